@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
+
 import netaddr
 
 from oslo_log import helpers as log_helpers
@@ -33,6 +35,8 @@ from networking_sfc.extensions import flowclassifier as fc_ext
 
 LOG = logging.getLogger(__name__)
 UUID_LEN = 36
+# flow classifiers whose conflict candidates are read with one query
+CONFLICT_QUERY_CHUNK = 50
 
 
 class L7Parameter(model_base.BASEV2):
@@ -72,6 +76,108 @@ class FlowClassifier(model_base.BASEV2, model_base.HasId,
         cascade='all, delete-orphan')
 
 
+class _IpPrefixIndex(object):
+    """Entries indexed by IP prefix, a None prefix matching any prefix.
+
+    The prefixes are kept per IP version and prefix length, so a lookup is
+    one hash lookup per shorter prefix length that may contain the looked
+    up prefix and one bisection per longer prefix length that may be
+    contained in it.
+    """
+
+    def __init__(self):
+        self._any = []
+        # (version, prefixlen) -> {first address: [entries]}
+        self._networks = {}
+        # (version, prefixlen) -> sorted first addresses
+        self._firsts = {}
+
+    def add(self, ip_prefix, entry):
+        if ip_prefix is None:
+            self._any.append(entry)
+            return
+        ip = netaddr.IPNetwork(ip_prefix)
+        key = (ip.version, ip.prefixlen)
+        networks = self._networks.setdefault(key, {})
+        if ip.first not in networks:
+            networks[ip.first] = []
+            bisect.insort(self._firsts.setdefault(key, []), ip.first)
+        networks[ip.first].append(entry)
+
+    def find(self, ip_prefix):
+        """Return the entries whose prefix overlaps ip_prefix."""
+        entries = list(self._any)
+        if ip_prefix is None:
+            for networks in self._networks.values():
+                for network_entries in networks.values():
+                    entries.extend(network_entries)
+            return entries
+        ip = netaddr.IPNetwork(ip_prefix)
+        max_prefixlen = 32 if ip.version == 4 else 128
+        for (version, prefixlen), networks in self._networks.items():
+            if version != ip.version:
+                continue
+            if prefixlen <= ip.prefixlen:
+                # only one network of this length can contain ip
+                hostmask = (1 << (max_prefixlen - prefixlen)) - 1
+                entries.extend(networks.get(ip.first & ~hostmask, []))
+            else:
+                firsts = self._firsts[(version, prefixlen)]
+                lo = bisect.bisect_left(firsts, ip.first)
+                hi = bisect.bisect_right(firsts, ip.last)
+                for first in firsts[lo:hi]:
+                    entries.extend(networks[first])
+        return entries
+
+
+class FlowClassifierIndex(object):
+    """Flow classifiers indexed for conflict lookups.
+
+    The classifiers are bucketed by ethertype and protocol and indexed by
+    source IP prefix, so the pairwise conflict checks only run against the
+    classifiers whose ethertype, protocol and source prefix may conflict.
+    """
+
+    def __init__(self, flow_classifiers=()):
+        self._buckets = {}
+        for flow_classifier in flow_classifiers:
+            self.add(flow_classifier)
+
+    def add(self, flow_classifier):
+        protocols = self._buckets.setdefault(
+            flow_classifier['ethertype'], {})
+        prefixes = protocols.get(flow_classifier['protocol'])
+        if prefixes is None:
+            prefixes = protocols[flow_classifier['protocol']] = (
+                _IpPrefixIndex())
+        prefixes.add(flow_classifier['source_ip_prefix'], flow_classifier)
+
+    def find_conflicts(self, flow_classifier, basic=False):
+        """Return the indexed flow classifiers conflicting with one.
+
+        @param basic: ignore the logical ports, like
+                      flowclassifier_basic_conflict
+        """
+        protocols = self._buckets.get(flow_classifier['ethertype'], {})
+        protocol = flow_classifier['protocol']
+        if protocol is None:
+            buckets = list(protocols.values())
+        else:
+            buckets = [protocols[key] for key in (protocol, None)
+                       if key in protocols]
+        if basic:
+            conflict = FlowClassifierDbPlugin.flowclassifier_basic_conflict
+        else:
+            conflict = FlowClassifierDbPlugin.flowclassifier_conflict
+        return [
+            candidate
+            for prefixes in buckets
+            for candidate in prefixes.find(
+                flow_classifier['source_ip_prefix'])
+            if conflict(flow_classifier, candidate)
+        ]
+
+
 class FlowClassifierDbPlugin(fc_ext.FlowClassifierPluginBase,
                              common_db_mixin.CommonDbMixin):
 
@@ -117,9 +223,14 @@ class FlowClassifierDbPlugin(fc_ext.FlowClassifierPluginBase,
     def _ip_prefix_conflict(cls, first_ip_prefix, second_ip_prefix):
         if first_ip_prefix is None or second_ip_prefix is None:
             return True
-        first_ipset = netaddr.IPSet([first_ip_prefix])
-        second_ipset = netaddr.IPSet([second_ip_prefix])
-        return bool(first_ipset & second_ipset)
+        # two CIDRs overlap when their address ranges intersect
+        first_ip = netaddr.IPNetwork(first_ip_prefix)
+        second_ip = netaddr.IPNetwork(second_ip_prefix)
+        return (
+            first_ip.version == second_ip.version and
+            first_ip.first <= second_ip.last and
+            second_ip.first <= first_ip.last
+        )
 
     @classmethod
     def _port_range_conflict(
@@ -204,29 +315,78 @@ class FlowClassifierDbPlugin(fc_ext.FlowClassifierPluginBase,
             )
         ])
 
+    @classmethod
+    def conflict_candidates_filter(cls, flow_classifier, logical_ports=True):
+        """SQL filter of the flow classifiers which may conflict with one.
+
+        It checks every field but the IP prefixes, which are left to
+        flowclassifier_conflict or flowclassifier_basic_conflict.
+        """
+        filters = [FlowClassifier.ethertype == flow_classifier['ethertype']]
+        if flow_classifier['protocol'] is not None:
+            filters.append(sa.or_(
+                FlowClassifier.protocol.is_(None),
+                FlowClassifier.protocol == flow_classifier['protocol']))
+        for direction in ('source', 'destination'):
+            port_range_min = flow_classifier['%s_port_range_min' % direction]
+            port_range_max = flow_classifier['%s_port_range_max' % direction]
+            if port_range_min is not None:
+                column = getattr(FlowClassifier,
+                                 '%s_port_range_max' % direction)
+                filters.append(sa.or_(column.is_(None),
+                                      column >= port_range_min))
+            if port_range_max is not None:
+                column = getattr(FlowClassifier,
+                                 '%s_port_range_min' % direction)
+                filters.append(sa.or_(column.is_(None),
+                                      column <= port_range_max))
+        if logical_ports:
+            for key in ('logical_source_port', 'logical_destination_port'):
+                if flow_classifier[key] is not None:
+                    column = getattr(FlowClassifier, key)
+                    filters.append(sa.or_(column.is_(None),
+                                          column == flow_classifier[key]))
+        return sa.and_(*filters)
+
+    @classmethod
+    def _check_flow_classifier_valid(cls, fc):
+        cls._check_port_range_valid(fc['source_port_range_min'],
+                                    fc['source_port_range_max'],
+                                    fc['protocol'])
+        cls._check_port_range_valid(fc['destination_port_range_min'],
+                                    fc['destination_port_range_max'],
+                                    fc['protocol'])
+        cls._check_ip_prefix_valid(fc['source_ip_prefix'], fc['ethertype'])
+        cls._check_ip_prefix_valid(fc['destination_ip_prefix'],
+                                   fc['ethertype'])
+
+    def _add_flow_classifier(self, context, fc):
+        flow_classifier_db = FlowClassifier(
+            id=uuidutils.generate_uuid(),
+            project_id=fc['project_id'],
+            name=fc['name'],
+            description=fc['description'],
+            ethertype=fc['ethertype'],
+            protocol=fc['protocol'],
+            source_port_range_min=fc['source_port_range_min'],
+            source_port_range_max=fc['source_port_range_max'],
+            destination_port_range_min=fc['destination_port_range_min'],
+            destination_port_range_max=fc['destination_port_range_max'],
+            source_ip_prefix=fc['source_ip_prefix'],
+            destination_ip_prefix=fc['destination_ip_prefix'],
+            logical_source_port=fc['logical_source_port'],
+            logical_destination_port=fc['logical_destination_port'],
+            l7_parameters={
+                key: L7Parameter(key, val)
+                for key, val in fc['l7_parameters'].items()}
+        )
+        context.session.add(flow_classifier_db)
+        return flow_classifier_db
+
     @log_helpers.log_method_call
     def create_flow_classifier(self, context, flow_classifier):
         fc = flow_classifier['flow_classifier']
-        project_id = fc['project_id']
-        l7_parameters = {
-            key: L7Parameter(key, val)
-            for key, val in fc['l7_parameters'].items()}
-        ethertype = fc['ethertype']
-        protocol = fc['protocol']
-        source_port_range_min = fc['source_port_range_min']
-        source_port_range_max = fc['source_port_range_max']
-        self._check_port_range_valid(source_port_range_min,
-                                     source_port_range_max,
-                                     protocol)
-        destination_port_range_min = fc['destination_port_range_min']
-        destination_port_range_max = fc['destination_port_range_max']
-        self._check_port_range_valid(destination_port_range_min,
-                                     destination_port_range_max,
-                                     protocol)
-        source_ip_prefix = fc['source_ip_prefix']
-        self._check_ip_prefix_valid(source_ip_prefix, ethertype)
-        destination_ip_prefix = fc['destination_ip_prefix']
-        self._check_ip_prefix_valid(destination_ip_prefix, ethertype)
+        self._check_flow_classifier_valid(fc)
         logical_source_port = fc['logical_source_port']
         logical_destination_port = fc['logical_destination_port']
         with context.session.begin(subtransactions=True):
@@ -234,7 +394,8 @@ class FlowClassifierDbPlugin(fc_ext.FlowClassifierPluginBase,
                 self._get_port(context, logical_source_port)
             if logical_destination_port is not None:
                 self._get_port(context, logical_destination_port)
-            query = self._model_query(context, FlowClassifier)
+            query = self._model_query(context, FlowClassifier).filter(
+                self.conflict_candidates_filter(fc))
             for flow_classifier_db in query.all():
                 if self.flowclassifier_conflict(
                     fc,
@@ -243,26 +404,56 @@ class FlowClassifierDbPlugin(fc_ext.FlowClassifierPluginBase,
                     raise fc_ext.FlowClassifierInConflict(
                         id=flow_classifier_db['id']
                     )
-            flow_classifier_db = FlowClassifier(
-                id=uuidutils.generate_uuid(),
-                project_id=project_id,
-                name=fc['name'],
-                description=fc['description'],
-                ethertype=ethertype,
-                protocol=protocol,
-                source_port_range_min=source_port_range_min,
-                source_port_range_max=source_port_range_max,
-                destination_port_range_min=destination_port_range_min,
-                destination_port_range_max=destination_port_range_max,
-                source_ip_prefix=source_ip_prefix,
-                destination_ip_prefix=destination_ip_prefix,
-                logical_source_port=logical_source_port,
-                logical_destination_port=logical_destination_port,
-                l7_parameters=l7_parameters
-            )
-            context.session.add(flow_classifier_db)
+            flow_classifier_db = self._add_flow_classifier(context, fc)
             return self._make_flow_classifier_dict(flow_classifier_db)
 
+    def _get_conflict_candidates(self, context, fcs):
+        """Return the flow classifiers which may conflict with any of fcs.
+
+        The candidate filters of the flow classifiers are OR-ed, by chunks
+        bounding the number of bound parameters of a query.
+        """
+        candidates = {}
+        for i in range(0, len(fcs), CONFLICT_QUERY_CHUNK):
+            query = self._model_query(context, FlowClassifier).filter(
+                sa.or_(*[self.conflict_candidates_filter(fc)
+                         for fc in fcs[i:i + CONFLICT_QUERY_CHUNK]]))
+            for flow_classifier_db in query:
+                candidates[flow_classifier_db['id']] = flow_classifier_db
+        return list(candidates.values())
+
+    @log_helpers.log_method_call
+    def create_flow_classifier_bulk(self, context, flow_classifiers):
+        """Create flow classifiers in one transaction.
+
+        The logical ports and the existing flow classifiers which may
+        conflict are looked up once for the whole batch, then each flow
+        classifier is checked against the index of the candidates and of
+        the flow classifiers of the batch before it.
+        """
+        fcs = [item['flow_classifier']
+               for item in flow_classifiers['flow_classifiers']]
+        for fc in fcs:
+            self._check_flow_classifier_valid(fc)
+        with context.session.begin(subtransactions=True):
+            self._get_ports(context, [
+                fc[key] for fc in fcs
+                for key in ('logical_source_port', 'logical_destination_port')
+                if fc[key] is not None])
+            index = FlowClassifierIndex(
+                self._get_conflict_candidates(context, fcs))
+            flow_classifier_dbs = []
+            for fc in fcs:
+                conflicts = index.find_conflicts(fc)
+                if conflicts:
+                    raise fc_ext.FlowClassifierInConflict(
+                        id=conflicts[0]['id'])
+                flow_classifier_db = self._add_flow_classifier(context, fc)
+                index.add(flow_classifier_db)
+                flow_classifier_dbs.append(flow_classifier_db)
+            return [self._make_flow_classifier_dict(flow_classifier_db)
+                    for flow_classifier_db in flow_classifier_dbs]
+
     def _make_flow_classifier_dict(self, flow_classifier, fields=None):
         res = {
             'id': flow_classifier['id'],
@@ -321,6 +512,23 @@ class FlowClassifierDbPlugin(fc_ext.FlowClassifierPluginBase,
         except exc.NoResultFound:
             raise fc_ext.FlowClassifierPortNotFound(id=id)
 
+    def _get_ports(self, context, ids):
+        """Bulk fetch ports.
+
+        @return: dict of Port objects keyed by id
+        """
+        ports = {}
+        if not ids:
+            return ports
+        query = self._model_query(context, models_v2.Port).filter(
+            models_v2.Port.id.in_(set(ids)))
+        for port in query:
+            ports[port['id']] = port
+        for id in ids:
+            if id not in ports:
+                raise fc_ext.FlowClassifierPortNotFound(id=id)
+        return ports
+
     @log_helpers.log_method_call
     def update_flow_classifier(self, context, id, flow_classifier):
         new_fc = flow_classifier['flow_classifier']
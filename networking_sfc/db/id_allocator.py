@@ -0,0 +1,88 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Allocation of small integer ids stored in a unique column.
+
+Chain ids, port pair group ids and the OVS driver path ids are all stored
+in a column with a unique constraint. Instead of reading every row to find
+an unused value, the lowest free value is found in the database with an
+anti-join of the column against itself shifted by one, which only walks
+the unique index. Two API workers may pick the same value concurrently;
+the unique constraint then rejects the second insert with DBDuplicateEntry,
+which the neutron DB retry decorators turn into a retry of the request.
+"""
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+
+def is_id_allocated(session, column, value):
+    """Return True when value is already stored in the unique column."""
+    query = session.query(column).filter(column == value)
+    return session.query(query.exists()).scalar()
+
+
+def find_free_id(session, column, start, end=None):
+    """Return the lowest value in [start, end] not used in column.
+
+    :param session: database session
+    :param column: unique integer column of a mapped model,
+                   e.g. PortChain.chain_id
+    :param start: lowest id that may be allocated
+    :param end: highest id that may be allocated, None for no limit
+    :returns: the free id, or None if the whole range is in use
+    """
+    if not is_id_allocated(session, column, start):
+        return start
+    # the lowest used id in the range whose successor is unused; the
+    # successor is then the lowest free id above start
+    following = orm.aliased(column.class_)
+    following_column = getattr(following, column.key)
+    query = session.query(
+        sa.func.min(column + 1)
+    ).outerjoin(
+        following, following_column == column + 1
+    ).filter(
+        column >= start,
+        following_column.is_(None)
+    )
+    if end is not None:
+        query = query.filter(column < end)
+    return query.scalar()
+
+
+def find_free_ids(session, column, start, count, end=None):
+    """Return the count lowest values in [start, end] not used in column.
+
+    The used values are read by ranges of the column above the lowest
+    free value, so allocating the ids of a batch costs a few index range
+    scans instead of a query per id.
+
+    :returns: the free ids in ascending order, fewer than count if the
+              whole range is in use
+    """
+    free_ids = []
+    low = find_free_id(session, column, start, end)
+    while low is not None and len(free_ids) < count:
+        high = low + 2 * (count - len(free_ids))
+        if end is not None:
+            high = min(high, end + 1)
+        used = set(value for value, in session.query(column).filter(
+            column >= low, column < high))
+        free_ids.extend(value for value in range(low, high)
+                        if value not in used)
+        if end is not None and high > end:
+            break
+        low = high
+    return free_ids[:count]
@@ -0,0 +1,45 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""add ovs driver indexes
+
+Revision ID: 2f1c4e7a9b35
+Revises: 8a1d5e3c7b42
+Create Date: 2017-08-28 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2f1c4e7a9b35'
+down_revision = '8a1d5e3c7b42'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_sfc_portpair_details_ingress_egress',
+                    'sfc_portpair_details', ['ingress', 'egress'])
+    op.create_index('ix_sfc_portpair_details_egress',
+                    'sfc_portpair_details', ['egress'])
+    op.create_index('ix_sfc_portpair_details_host_id_id',
+                    'sfc_portpair_details', ['host_id', 'id'])
+    op.create_index('ix_sfc_path_nodes_portchain_id_nsi_fwd_path',
+                    'sfc_path_nodes', ['portchain_id', 'nsi', 'fwd_path'])
+    op.create_index('ix_sfc_path_nodes_nsp_nsi',
+                    'sfc_path_nodes', ['nsp', 'nsi'])
+    op.create_index('ix_sfc_path_nodes_next_group_id_fwd_path',
+                    'sfc_path_nodes', ['next_group_id', 'fwd_path'])
+    op.create_index('ix_sfc_path_port_associations_portpair_id',
+                    'sfc_path_port_associations', ['portpair_id'])
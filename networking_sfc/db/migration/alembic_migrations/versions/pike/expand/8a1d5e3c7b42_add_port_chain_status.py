@@ -0,0 +1,37 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""add port chain status
+
+Revision ID: 8a1d5e3c7b42
+Revises: 6185f1633a3d
+Create Date: 2017-08-21 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8a1d5e3c7b42'
+down_revision = '6185f1633a3d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('sfc_port_chains',
+                  sa.Column('status',
+                            sa.String(length=16),
+                            nullable=False,
+                            server_default='active'))
@@ -30,6 +30,7 @@ from neutron_lib.db import constants as db_const
 from neutron_lib.db import model_base
 
 from networking_sfc.db import flowclassifier_db as fc_db
+from networking_sfc.db import id_allocator
 from networking_sfc.extensions import flowclassifier as ext_fc
 from networking_sfc.extensions import sfc as ext_sfc
 
@@ -164,6 +165,9 @@ class PortChain(model_base.BASEV2, model_base.HasId, model_base.HasProject):
     chain_id = sa.Column(sa.Integer(), unique=True, nullable=False)
     name = sa.Column(sa.String(db_const.NAME_FIELD_SIZE))
     description = sa.Column(sa.String(db_const.DESCRIPTION_FIELD_SIZE))
+    status = sa.Column(sa.String(db_const.STATUS_FIELD_SIZE),
+                       nullable=False,
+                       server_default=ext_sfc.PORT_CHAIN_STATUS_ACTIVE)
     chain_group_associations = orm.relationship(
         ChainGroupAssoc,
         backref='port_chain',
@@ -205,6 +209,7 @@ class SfcDbPlugin(
                 for k, param in port_chain['chain_parameters'].items()
             },
             'chain_id': port_chain['chain_id'],
+            'status': port_chain['status'],
         }
         return self._fields(res, fields)
 
@@ -235,28 +240,32 @@ class SfcDbPlugin(
                 if fc_assoc and fc_assoc['portchain_id'] != pc_id:
                     raise ext_fc.FlowClassifierInUse(id=fc.id)
 
-            query = self._model_query(context, PortChain)
-            for port_chain_db in query.all():
-                if port_chain_db['id'] == pc_id:
-                    continue
-                pc_fc_ids = [
-                    assoc['flowclassifier_id']
-                    for assoc in port_chain_db.chain_classifier_associations
-                ]
-                pc_fcs = [
-                    self._get_flow_classifier(context, pc_fc_id)
-                    for pc_fc_id in pc_fc_ids
-                ]
-                for pc_fc in pc_fcs:
-                    for fc in fcs:
-                        fc_cls = fc_db.FlowClassifierDbPlugin
-                        if fc_cls.flowclassifier_basic_conflict(
-                            pc_fc, fc
-                        ):
-                            raise ext_sfc.PortChainFlowClassifierInConflict(
-                                fc_id=fc['id'], pc_id=port_chain_db['id'],
-                                pc_fc_id=pc_fc['id']
-                            )
+            if not fcs:
+                return
+            # only load the classifiers of the other port chains which may
+            # conflict, and match them against an index of the new ones
+            fc_cls = fc_db.FlowClassifierDbPlugin
+            fc_index = fc_db.FlowClassifierIndex(fcs)
+            query = self._model_query(context, PortChain).join(
+                ChainClassifierAssoc,
+                ChainClassifierAssoc.portchain_id == PortChain.id
+            ).join(
+                fc_db.FlowClassifier,
+                fc_db.FlowClassifier.id ==
+                ChainClassifierAssoc.flowclassifier_id
+            ).filter(
+                PortChain.id != pc_id
+            ).filter(sa.or_(*[
+                fc_cls.conflict_candidates_filter(fc, logical_ports=False)
+                for fc in fcs
+            ])).with_entities(fc_db.FlowClassifier, PortChain.id)
+            for pc_fc, port_chain_id in query.all():
+                conflicts = fc_index.find_conflicts(pc_fc, basic=True)
+                if conflicts:
+                    raise ext_sfc.PortChainFlowClassifierInConflict(
+                        fc_id=conflicts[0]['id'], pc_id=port_chain_id,
+                        pc_fc_id=pc_fc['id']
+                    )
 
     def _setup_chain_group_associations(
         self, context, port_chain, pg_ids
@@ -309,31 +318,31 @@ class SfcDbPlugin(
             fc_ids = pc['flow_classifiers']
             self._validate_port_pair_groups(context, pg_ids)
             self._validate_flow_classifiers(context, fc_ids)
-            assigned_chain_ids = {}
-            query = context.session.query(PortChain)
-            for port_chain_db in query.all():
-                assigned_chain_ids[port_chain_db['chain_id']] = (
-                    port_chain_db['id']
-                )
             if not chain_id:
-                available_chain_id = 1
-                while available_chain_id < ext_sfc.MAX_CHAIN_ID:
-                    if available_chain_id not in assigned_chain_ids:
-                        chain_id = available_chain_id
-                        break
-                    available_chain_id += 1
+                # a concurrent create may pick the same id, the unique
+                # constraint then raises DBDuplicateEntry, which the
+                # retry_db_errors of the API controller retries
+                chain_id = id_allocator.find_free_id(
+                    context.session, PortChain.chain_id,
+                    1, ext_sfc.MAX_CHAIN_ID - 1)
                 if not chain_id:
                     raise ext_sfc.PortChainUnavailableChainId()
             else:
-                if chain_id in assigned_chain_ids:
+                query = context.session.query(PortChain).filter_by(
+                    chain_id=chain_id)
+                port_chain_db = query.first()
+                if port_chain_db:
                     raise ext_sfc.PortChainChainIdInConflict(
-                        chain_id=chain_id, pc_id=assigned_chain_ids[chain_id])
+                        chain_id=chain_id, pc_id=port_chain_db['id'])
             port_chain_db = PortChain(id=uuidutils.generate_uuid(),
                                       project_id=project_id,
                                       description=pc['description'],
                                       name=pc['name'],
                                       chain_parameters=chain_parameters,
-                                      chain_id=chain_id)
+                                      chain_id=chain_id,
+                                      status=pc.get(
+                                          'status',
+                                          ext_sfc.PORT_CHAIN_STATUS_ACTIVE))
             self._setup_chain_group_associations(
                 context, port_chain_db, pg_ids)
             self._setup_chain_classifier_associations(
@@ -381,6 +390,11 @@ class SfcDbPlugin(
         except ext_sfc.PortChainNotFound:
             LOG.info("Deleting a non-existing port chain.")
 
+    def _set_port_chain_status(self, context, id, status):
+        with context.session.begin(subtransactions=True):
+            context.session.query(PortChain).filter_by(id=id).update(
+                {'status': status}, synchronize_session=False)
+
     @log_helpers.log_method_call
     def update_port_chain(self, context, id, port_chain):
         pc = port_chain['port_chain']
@@ -470,6 +484,58 @@ class SfcDbPlugin(
             context.session.add(port_pair_db)
             return self._make_port_pair_dict(port_pair_db)
 
+    @log_helpers.log_method_call
+    def create_port_pair_bulk(self, context, port_pairs):
+        """Create port pairs in one transaction.
+
+        The port pairs already using the ingress and egress ports and the
+        ports themselves are each looked up with one query for the whole
+        batch. A port pair of the batch using the ports of a previous one
+        is rejected too.
+        """
+        pps = [item['port_pair'] for item in port_pairs['port_pairs']]
+        with context.session.begin(subtransactions=True):
+            in_use = {}
+            if pps:
+                query = self._model_query(context, PortPair).filter(
+                    PortPair.ingress.in_(set(pp['ingress'] for pp in pps)))
+                for port_pair_db in query:
+                    in_use[(port_pair_db['ingress'],
+                            port_pair_db['egress'])] = port_pair_db['id']
+            ports = self._get_ports(
+                context,
+                [pp[key] for pp in pps for key in ('ingress', 'egress')])
+            port_pair_dbs = []
+            for pp in pps:
+                pair = (pp['ingress'], pp['egress'])
+                if pair in in_use:
+                    raise ext_sfc.PortPairIngressEgressInUse(
+                        ingress=pp['ingress'],
+                        egress=pp['egress'],
+                        id=in_use[pair]
+                    )
+                self._validate_port_pair_ingress_egress(
+                    ports[pp['ingress']], ports[pp['egress']])
+                port_pair_db = PortPair(
+                    id=uuidutils.generate_uuid(),
+                    name=pp['name'],
+                    description=pp['description'],
+                    project_id=pp['project_id'],
+                    ingress=pp['ingress'],
+                    egress=pp['egress'],
+                    service_function_parameters={
+                        key: ServiceFunctionParam(
+                            keyword=key, value=jsonutils.dumps(val))
+                        for key, val in
+                        pp['service_function_parameters'].items()
+                    }
+                )
+                context.session.add(port_pair_db)
+                in_use[pair] = port_pair_db['id']
+                port_pair_dbs.append(port_pair_db)
+            return [self._make_port_pair_dict(port_pair_db)
+                    for port_pair_db in port_pair_dbs]
+
     @log_helpers.log_method_call
     def get_port_pairs(self, context, filters=None, fields=None,
                        sorts=None, limit=None, marker=None,
@@ -499,12 +565,46 @@ class SfcDbPlugin(
         except exc.NoResultFound:
             raise ext_sfc.PortPairNotFound(id=id)
 
+    def _get_port_pairs_by_ids(self, context, ids):
+        """Bulk fetch port pairs.
+
+        @return: dict of PortPair objects keyed by id
+        """
+        port_pairs = {}
+        if not ids:
+            return port_pairs
+        query = self._model_query(context, PortPair).filter(
+            PortPair.id.in_(set(ids)))
+        for port_pair in query:
+            port_pairs[port_pair['id']] = port_pair
+        for id in ids:
+            if id not in port_pairs:
+                raise ext_sfc.PortPairNotFound(id=id)
+        return port_pairs
+
     def _get_port(self, context, id):
         try:
             return self._get_by_id(context, models_v2.Port, id)
         except exc.NoResultFound:
             raise ext_sfc.PortPairPortNotFound(id=id)
 
+    def _get_ports(self, context, ids):
+        """Bulk fetch ports.
+
+        @return: dict of Port objects keyed by id
+        """
+        ports = {}
+        if not ids:
+            return ports
+        query = self._model_query(context, models_v2.Port).filter(
+            models_v2.Port.id.in_(set(ids)))
+        for port in query:
+            ports[port['id']] = port
+        for id in ids:
+            if id not in ports:
+                raise ext_sfc.PortPairPortNotFound(id=id)
+        return ports
+
     @log_helpers.log_method_call
     def update_port_pair(self, context, id, port_pair):
         new_pp = port_pair['port_pair']
@@ -559,19 +659,10 @@ class SfcDbPlugin(
                 for key, val in
                 pg['port_pair_group_parameters'].items()
             }
-            assigned_group_ids = {}
-            query = context.session.query(PortPairGroup)
-            for port_pair_group_db in query.all():
-                assigned_group_ids[port_pair_group_db['group_id']] = (
-                    port_pair_group_db['id']
-                )
-            group_id = 0
-            available_group_id = 1
-            while True:
-                if available_group_id not in assigned_group_ids:
-                    group_id = available_group_id
-                    break
-                available_group_id += 1
+            # retried by the API controller on DBDuplicateEntry, like the
+            # chain_id of create_port_chain
+            group_id = id_allocator.find_free_id(
+                context.session, PortPairGroup.group_id, 1)
             port_pair_group_db = PortPairGroup(
                 id=uuidutils.generate_uuid(),
                 name=pg['name'],
@@ -583,6 +674,50 @@ class SfcDbPlugin(
             context.session.add(port_pair_group_db)
             return self._make_port_pair_group_dict(port_pair_group_db)
 
+    @log_helpers.log_method_call
+    def create_port_pair_group_bulk(self, context, port_pair_groups):
+        """Create port pair groups in one transaction.
+
+        The port pairs of all the groups are looked up with one query and
+        the group ids of the batch are allocated together. A port pair
+        can only be added to one group of the batch.
+        """
+        pgs = [item['port_pair_group']
+               for item in port_pair_groups['port_pair_groups']]
+        with context.session.begin(subtransactions=True):
+            port_pairs = self._get_port_pairs_by_ids(
+                context, [pp_id for pg in pgs for pp_id in pg['port_pairs']])
+            # retried by the API controller on DBDuplicateEntry, like the
+            # chain_id of create_port_chain
+            group_ids = id_allocator.find_free_ids(
+                context.session, PortPairGroup.group_id, 1, len(pgs))
+            used = set()
+            port_pair_group_dbs = []
+            for pg, group_id in zip(pgs, group_ids):
+                portpairs_list = [port_pairs[pp_id]
+                                  for pp_id in pg['port_pairs']]
+                for portpair in portpairs_list:
+                    if portpair.portpairgroup_id or portpair.id in used:
+                        raise ext_sfc.PortPairInUse(id=portpair.id)
+                used.update(pg['port_pairs'])
+                port_pair_group_db = PortPairGroup(
+                    id=uuidutils.generate_uuid(),
+                    name=pg['name'],
+                    description=pg['description'],
+                    project_id=pg['project_id'],
+                    port_pairs=portpairs_list,
+                    port_pair_group_parameters={
+                        key: PortPairGroupParam(
+                            keyword=key, value=jsonutils.dumps(val))
+                        for key, val in
+                        pg['port_pair_group_parameters'].items()
+                    },
+                    group_id=group_id)
+                context.session.add(port_pair_group_db)
+                port_pair_group_dbs.append(port_pair_group_db)
+            return [self._make_port_pair_group_dict(port_pair_group_db)
+                    for port_pair_group_db in port_pair_group_dbs]
+
     @log_helpers.log_method_call
     def get_port_pair_groups(self, context, filters=None, fields=None,
                              sorts=None, limit=None, marker=None,
@@ -612,6 +747,25 @@ class SfcDbPlugin(
         except exc.NoResultFound:
             raise ext_sfc.PortPairGroupNotFound(id=id)
 
+    def _get_port_pair_groups_by_ids(self, context, ids):
+        """Bulk fetch port pair groups together with their port pairs.
+
+        @return: dict of PortPairGroup objects keyed by id
+        """
+        port_pair_groups = {}
+        if not ids:
+            return port_pair_groups
+        query = self._model_query(context, PortPairGroup).filter(
+            PortPairGroup.id.in_(set(ids))
+        ).options(orm.subqueryload(PortPairGroup.port_pairs).subqueryload(
+            PortPair.service_function_parameters))
+        for port_pair_group in query:
+            port_pair_groups[port_pair_group['id']] = port_pair_group
+        for id in ids:
+            if id not in port_pair_groups:
+                raise ext_sfc.PortPairGroupNotFound(id=id)
+        return port_pair_groups
+
     def _get_flow_classifier(self, context, id):
         try:
             return self._get_by_id(context, fc_db.FlowClassifier, id)
@@ -278,7 +278,8 @@ class Flowclassifier(extensions.ExtensionDescriptor):
             plural_mappings,
             RESOURCE_ATTRIBUTE_MAP,
             FLOW_CLASSIFIER_EXT,
-            register_quota=True)
+            register_quota=True,
+            allow_bulk=True)
 
     def get_extended_resources(self, version):
         if version == "2.0":
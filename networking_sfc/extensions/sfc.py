@@ -50,6 +50,10 @@ SUPPORTED_LB_FIELDS = [
 ]
 MAX_CHAIN_ID = 65535
 
+PORT_CHAIN_STATUS_BUILDING = 'building'
+PORT_CHAIN_STATUS_ACTIVE = 'active'
+PORT_CHAIN_STATUS_ERROR = 'error'
+
 
 # NOTE(scsnow): move to neutron-lib
 def validate_list_of_allowed_values(data, allowed_values=None):
@@ -271,6 +275,10 @@ RESOURCE_ATTRIBUTE_MAP = {
                 }
             },
             'convert_to': normalize_chain_parameters
+        },
+        'status': {
+            'allow_post': False, 'allow_put': False,
+            'is_visible': True
         }
     },
     'port_pair_groups': {
@@ -376,7 +384,8 @@ class Sfc(extensions.ExtensionDescriptor):
             plural_mappings,
             RESOURCE_ATTRIBUTE_MAP,
             SFC_EXT,
-            register_quota=True)
+            register_quota=True,
+            allow_bulk=True)
 
     def get_extended_resources(self, version):
         if version == "2.0":
@@ -0,0 +1,114 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from abc import abstractmethod
+
+from neutron_lib.api import extensions
+from neutron_lib import exceptions as neutron_exc
+
+from neutron.api.v2 import resource_helper
+
+from networking_sfc._i18n import _
+from networking_sfc.extensions import sfc as sfc_ext
+
+
+SFC_METRICS_EXT = "sfc-metrics"
+
+
+class SfcMetricsNotFound(neutron_exc.NotFound):
+    message = _("SFC metrics of operation %(id)s not found.")
+
+
+RESOURCE_ATTRIBUTE_MAP = {
+    'metrics': {
+        'id': {
+            'allow_post': False, 'allow_put': False,
+            'is_visible': True, 'primary_key': True},
+        'name': {
+            'allow_post': False, 'allow_put': False,
+            'is_visible': True},
+        'pid': {
+            'allow_post': False, 'allow_put': False,
+            'is_visible': True},
+        'count': {
+            'allow_post': False, 'allow_put': False,
+            'is_visible': True},
+        'wall_time_ms': {
+            'allow_post': False, 'allow_put': False,
+            'is_visible': True},
+        'queries': {
+            'allow_post': False, 'allow_put': False,
+            'is_visible': True},
+        'rpc_casts': {
+            'allow_post': False, 'allow_put': False,
+            'is_visible': True},
+        'payload_bytes': {
+            'allow_post': False, 'allow_put': False,
+            'is_visible': True},
+    },
+}
+
+
+class Sfc_metrics(extensions.ExtensionDescriptor):
+    """SFC instrumentation metrics extension."""
+
+    @classmethod
+    def get_name(cls):
+        return "SFC Metrics"
+
+    @classmethod
+    def get_alias(cls):
+        return SFC_METRICS_EXT
+
+    @classmethod
+    def get_description(cls):
+        return ("Admin-only read access to the instrumentation metrics "
+                "of the SFC operations. The metrics are kept per server "
+                "process: a request returns those of the API worker "
+                "serving it, identified by its pid.")
+
+    @classmethod
+    def get_plugin_interface(cls):
+        return SfcMetricsPluginBase
+
+    @classmethod
+    def get_updated(cls):
+        return "2017-08-01T10:00:00-00:00"
+
+    @classmethod
+    def get_resources(cls):
+        """Returns Ext Resources."""
+        plural_mappings = resource_helper.build_plural_mappings(
+            {}, RESOURCE_ATTRIBUTE_MAP)
+        return resource_helper.build_resource_info(
+            plural_mappings,
+            RESOURCE_ATTRIBUTE_MAP,
+            sfc_ext.SFC_EXT)
+
+    def get_extended_resources(self, version):
+        if version == "2.0":
+            return RESOURCE_ATTRIBUTE_MAP
+        else:
+            return {}
+
+
+class SfcMetricsPluginBase(sfc_ext.SfcPluginBase):
+
+    @abstractmethod
+    def get_metrics(self, context, filters=None, fields=None):
+        pass
+
+    @abstractmethod
+    def get_metric(self, context, id, fields=None):
+        pass
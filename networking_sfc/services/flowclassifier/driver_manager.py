@@ -124,6 +124,9 @@ class FlowClassifierDriverManager(NamedExtensionManager):
     def create_flow_classifier_postcommit(self, context):
         self._call_drivers("create_flow_classifier_postcommit", context)
 
+    def create_flow_classifier_bulk_postcommit(self, contexts):
+        self._call_drivers("create_flow_classifier_bulk_postcommit", contexts)
+
     def update_flow_classifier_precommit(self, context):
         self._call_drivers("update_flow_classifier_precommit", context)
 
@@ -40,6 +40,10 @@ class FlowClassifierDriverBase(FlowClassifierDriverBaseLegacy):
     def create_flow_classifier_postcommit(self, context):
         self.create_flow_classifier(context)
 
+    def create_flow_classifier_bulk_postcommit(self, contexts):
+        for context in contexts:
+            self.create_flow_classifier_postcommit(context)
+
     @abc.abstractmethod
     def delete_flow_classifier(self, context):
         pass
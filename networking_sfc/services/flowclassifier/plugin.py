@@ -37,11 +37,20 @@ class FlowClassifierPlugin(fc_db.FlowClassifierDbPlugin):
         self.driver_manager = fc_driver.FlowClassifierDriverManager()
         super(FlowClassifierPlugin, self).__init__()
         self.driver_manager.initialize()
+        self.__native_bulk_support = self.driver_manager.native_bulk_support
 
     def _get_port(self, context, id):
         port = super(FlowClassifierPlugin, self)._get_port(context, id)
         return directory.get_plugin().get_port(context, port['id'])
 
+    def _get_ports(self, context, ids):
+        ports = super(FlowClassifierPlugin, self)._get_ports(context, ids)
+        if not ports:
+            return ports
+        return dict(
+            (port['id'], port) for port in directory.get_plugin().get_ports(
+                context, filters={'id': list(ports)}))
+
     @log_helpers.log_method_call
     def create_flow_classifier(self, context, flow_classifier):
         with context.session.begin(subtransactions=True):
@@ -63,6 +72,32 @@ class FlowClassifierPlugin(fc_db.FlowClassifierDbPlugin):
                 self.delete_flow_classifier(context, fc_db['id'])
         return fc_db
 
+    @log_helpers.log_method_call
+    def create_flow_classifier_bulk(self, context, flow_classifiers):
+        with context.session.begin(subtransactions=True):
+            fcs = super(
+                FlowClassifierPlugin, self
+            ).create_flow_classifier_bulk(context, flow_classifiers)
+            fc_contexts = [
+                fc_ctx.FlowClassifierContext(self, context, fc)
+                for fc in fcs]
+            for fc_context in fc_contexts:
+                self.driver_manager.create_flow_classifier_precommit(
+                    fc_context)
+
+        try:
+            self.driver_manager.create_flow_classifier_bulk_postcommit(
+                fc_contexts)
+        except fc_exc.FlowClassifierDriverError as e:
+            LOG.exception(e)
+            with excutils.save_and_reraise_exception():
+                LOG.error("Create flow classifiers failed, "
+                          "deleting flow_classifiers %s",
+                          [fc['id'] for fc in fcs])
+                for fc in fcs:
+                    self.delete_flow_classifier(context, fc['id'])
+        return fcs
+
     @log_helpers.log_method_call
     def update_flow_classifier(self, context, id, flow_classifier):
         with context.session.begin(subtransactions=True):
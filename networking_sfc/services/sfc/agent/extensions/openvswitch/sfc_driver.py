@@ -14,9 +14,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import zlib
+
 from neutron_lib import constants as n_consts
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import versionutils
 
 from neutron.plugins.ml2.drivers.openvswitch.agent.common import constants \
     as ovs_consts
@@ -24,12 +28,14 @@ from neutron.plugins.ml2.drivers.openvswitch.agent import vlanmanager
 
 from networking_sfc.services.sfc.agent.extensions import sfc
 from networking_sfc.services.sfc.common import ovs_ext_lib
+from networking_sfc.services.sfc.common import ovs_native_lib
 from networking_sfc.services.sfc.drivers.ovs import constants
 
 LOG = logging.getLogger(__name__)
 
 cfg.CONF.import_group('OVS', 'neutron.plugins.ml2.drivers.openvswitch.agent.'
                              'common.config')
+cfg.CONF.import_group('sfc_agent', 'networking_sfc.services.sfc.common.config')
 
 # This table is used to process the traffic across differet subnet scenario.
 # Flow 1: pri=1, ip,dl_dst=nexthop_mac,nw_src=nexthop_subnet. actions=
@@ -52,6 +58,25 @@ PC_INGRESS_PRI = 30
 # Reverse group number offset for dump_group
 REVERSE_GROUP_NUMBER_OFFSET = 7000
 
+# The flows of the chains are tagged with a cookie that only depends on the
+# flow, so that the agent finds the flows it has to install on br-int when it
+# restarts instead of removing and installing them all again:
+# bits 52-63: SFC_COOKIE_PREFIX, the same for all the SFC flows
+# bits 32-51: the path and index of the flow rule (nsp << 8 | nsi)
+# bits 0-31: crc32 of the flow match and actions
+SFC_COOKIE_PREFIX = 0x5fc << 52
+SFC_COOKIE_PREFIX_MASK = 0xfff << 52
+SFC_COOKIE_PATH_SHIFT = 32
+SFC_COOKIE_PATH_MASK = 0xfffff
+UINT64_BITMASK = (1 << 64) - 1
+
+# first Open vSwitch release supporting conjunctive matches
+CONJUNCTION_MIN_OVS_VERSION = '2.4'
+# first Open vSwitch release supporting the selection method of groups,
+# an OpenFlow 1.5 group property
+HASH_SELECTION_MIN_OVS_VERSION = '2.4'
+CONJUNCTION_ID_MASK = 0xffffffff
+
 
 class SfcOVSAgentDriver(sfc.SfcAgentDriver):
     """This class will support MPLS frame
@@ -78,21 +103,84 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
         self.local_ip = None
         self.patch_tun_ofport = None
         self.vlan_manager = None
+        # whether the groups can use the hash selection method
+        self.hash_selection = False
+        # group_id -> buckets of the groups installed on br-int, None when
+        # the buckets were not installed by this driver instance, {} when
+        # they are unknown after a failed flow transaction
+        self.group_cache = {}
+        # cookies of the SFC flows found on br-int at start, which are not
+        # installed again while they are still there
+        self._present_cookies = set()
+        # cookies found at start which no flow rule asked for yet, removed
+        # by finish_sync; None once the synchronization is done
+        self._stale_cookies = None
+        # classify with conjunctive matches instead of one flow per pair of
+        # transport source and destination port masks
+        self.conjunction = False
+        # conjunction key -> conj_id of the conjunctive matches installed
+        self._conj_ids = {}
+        # the values of _conj_ids, to allocate a new conj_id without
+        # going through all the conjunctions
+        self._used_conj_ids = set()
+        # (priority, clause match) -> (clause match, {conj_id: clause}) of
+        # the clause flows, which are shared by the conjunctions with the
+        # same clause match
+        self._conj_clauses = {}
 
     def consume_api(self, agent_api):
         self.agent_api = agent_api
 
     def initialize(self):
-        self.br_int = ovs_ext_lib.SfcOVSBridgeExt(
-            self.agent_api.request_int_br())
-        self.br_int.set_protocols(SfcOVSAgentDriver.REQUIRED_PROTOCOLS)
+        self.br_int = self._get_br_int_ext(self.agent_api.request_int_br())
+        protocols = list(SfcOVSAgentDriver.REQUIRED_PROTOCOLS)
+        self.hash_selection = self._hash_selection_supported()
+        if self.hash_selection:
+            # for the selection method and fields of the groups of the
+            # port pair groups with lb_fields, the other flows and groups
+            # are still programmed with OpenFlow 1.3
+            protocols.append(ovs_consts.OPENFLOW15)
+        self.br_int.set_protocols(protocols,
+                                  of_version=ovs_consts.OPENFLOW13)
 
         self.local_ip = cfg.CONF.OVS.local_ip
         self.patch_tun_ofport = self.br_int.get_port_ofport(
             cfg.CONF.OVS.int_peer_patch_port)
         self.vlan_manager = vlanmanager.LocalVlanManager()
+        self.conjunction = (cfg.CONF.sfc_agent.conjunction_classification and
+                            self._conjunction_supported())
+
+        self._setup_sfc_flows_on_int_br()
+        self._load_sfc_state_on_int_br()
 
-        self._clear_sfc_flow_on_int_br()
+    def _get_br_int_ext(self, int_br):
+        return ovs_ext_lib.SfcOVSBridgeExt(int_br)
+
+    def _ovs_version_supports(self, min_version):
+        try:
+            ovs_version = self.br_int.ovsdb.db_get(
+                'Open_vSwitch', '.', 'ovs_version').execute(check_error=True)
+            return versionutils.is_compatible(
+                min_version, ovs_version, same_major=False)
+        except Exception as e:
+            LOG.exception(e)
+            return False
+
+    def _hash_selection_supported(self):
+        supported = self._ovs_version_supports(HASH_SELECTION_MIN_OVS_VERSION)
+        if not supported:
+            LOG.error("Open vSwitch does not support OpenFlow 1.5 group "
+                      "selection methods, the lb_fields of the port pair "
+                      "groups are ignored")
+        return supported
+
+    def _conjunction_supported(self):
+        supported = self._ovs_version_supports(CONJUNCTION_MIN_OVS_VERSION)
+        if not supported:
+            LOG.warning("Open vSwitch does not support conjunctive matches, "
+                        "classifying traffic with one flow per pair of "
+                        "transport port masks")
+        return supported
 
     def update_flow_rules(self, flowrule, flowrule_status):
         if flowrule['fwd_path'] is False and flowrule['node_type'] == \
@@ -102,10 +190,11 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
         try:
             LOG.debug('update_flow_rule, flowrule = %s', flowrule)
 
-            if flowrule.get('egress', None):
-                self._setup_egress_flow_rules(flowrule)
-            if flowrule.get('ingress', None):
-                self._setup_ingress_flow_rules(flowrule)
+            with self._flow_transaction():
+                if flowrule.get('egress', None):
+                    self._setup_egress_flow_rules(flowrule)
+                if flowrule.get('ingress', None):
+                    self._setup_ingress_flow_rules(flowrule)
             flowrule_status_temp = {'id': flowrule['id'],
                                     'status': constants.STATUS_ACTIVE}
             flowrule_status.append(flowrule_status_temp)
@@ -123,42 +212,8 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
                 flowrule['ingress']
         try:
             LOG.debug("delete_flow_rule, flowrule = %s", flowrule)
-            pc_corr = flowrule['pc_corr']
-
-            # delete tunnel table flow rule on br-int(egress match)
-            if flowrule['egress'] is not None:
-                self._setup_local_switch_flows_on_int_br(flowrule,
-                                                         flowrule['del_fcs'],
-                                                         None,
-                                                         add_flow=False,
-                                                         match_inport=True)
-                # delete group table, need to check again
-                group_id = flowrule.get('next_group_id', None)
-                if group_id and flowrule.get('group_refcnt', None) <= 1:
-                    if flowrule['fwd_path']:
-                        self.br_int.delete_group(group_id=group_id)
-                    else:
-                        self.br_int.delete_group(group_id=group_id +
-                                                 REVERSE_GROUP_NUMBER_OFFSET)
-                    for item in flowrule['next_hops']:
-                        if flowrule['fwd_path']:
-                            self.br_int.delete_flows(
-                                table=ACROSS_SUBNET_TABLE,
-                                dl_dst=item['in_mac_address'])
-                        else:
-                            self.br_int.delete_flows(
-                                table=ACROSS_SUBNET_TABLE,
-                                dl_dst=item['mac_address'])
-
-            if flowrule['ingress'] is not None:
-                # delete table INGRESS_TABLE ingress match flow rule
-                # on br-int(ingress match)
-                vif_port = self.br_int.get_vif_port_by_id(flowrule['ingress'])
-                if vif_port:
-                    # third, install br-int flow rule on table INGRESS_TABLE
-                    # for ingress traffic
-                    if pc_corr == 'mpls':
-                        self._delete_flows_mpls(flowrule, vif_port)
+            with self._flow_transaction():
+                self._delete_flow_rule(flowrule)
         except Exception as e:
             flowrule_status_temp = {'id': flowrule['id'],
                                     'status': constants.STATUS_ERROR}
@@ -166,10 +221,164 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
             LOG.exception(e)
             LOG.error("delete_flow_rule failed")
 
-    def _clear_sfc_flow_on_int_br(self):
-        self.br_int.delete_group(group_id='all')
-        self.br_int.delete_flows(table=ACROSS_SUBNET_TABLE)
-        self.br_int.delete_flows(table=INGRESS_TABLE)
+    def _delete_flow_rule(self, flowrule):
+        pc_corr = flowrule['pc_corr']
+
+        # delete tunnel table flow rule on br-int(egress match)
+        if flowrule['egress'] is not None:
+            self._setup_local_switch_flows_on_int_br(flowrule,
+                                                     flowrule['del_fcs'],
+                                                     None,
+                                                     add_flow=False,
+                                                     match_inport=True)
+            # delete group table, need to check again
+            group_id = flowrule.get('next_group_id', None)
+            if group_id and flowrule.get('group_refcnt', None) <= 1:
+                if flowrule['fwd_path']:
+                    self._delete_group(group_id)
+                else:
+                    self._delete_group(group_id + REVERSE_GROUP_NUMBER_OFFSET)
+                for item in flowrule['next_hops']:
+                    if flowrule['fwd_path']:
+                        self._delete_flows(
+                            table=ACROSS_SUBNET_TABLE,
+                            dl_dst=item['in_mac_address'])
+                    else:
+                        self._delete_flows(
+                            table=ACROSS_SUBNET_TABLE,
+                            dl_dst=item['mac_address'])
+
+        if flowrule['ingress'] is not None:
+            # delete table INGRESS_TABLE ingress match flow rule
+            # on br-int(ingress match)
+            vif_port = self.br_int.get_vif_port_by_id(flowrule['ingress'])
+            if vif_port:
+                # third, install br-int flow rule on table INGRESS_TABLE
+                # for ingress traffic
+                if pc_corr == 'mpls':
+                    self._delete_flows_mpls(flowrule, vif_port)
+
+    @contextlib.contextmanager
+    def _flow_transaction(self):
+        defer = cfg.CONF.sfc_agent.flow_transaction
+        try:
+            with self.br_int.flow_transaction(defer=defer):
+                yield
+        except Exception:
+            # the deferred group operations were dropped, or only partly
+            # applied, so the cache no longer matches the switch
+            if defer:
+                self._resync_group_cache()
+            raise
+
+    def _resync_group_cache(self):
+        try:
+            group_ids = self.br_int.dump_group_ids()
+        except Exception:
+            LOG.exception("Failed to dump the groups of br-int")
+            group_ids = set(self.group_cache)
+        group_cache = {}
+        for group_id in group_ids:
+            if self.group_cache.get(group_id) is None:
+                # not installed by this driver instance yet
+                group_cache[group_id] = None
+            else:
+                # installed by this driver instance, but its buckets are
+                # unknown: the group is modified when installed again
+                group_cache[group_id] = {}
+        self.group_cache = group_cache
+
+    def _install_group(self, group_id, buckets, lb_fields=None):
+        group = {'type': 'select', 'buckets': buckets}
+        if lb_fields and not self.hash_selection:
+            LOG.error("Ignoring the lb_fields %(fields)s of group "
+                      "%(group)s, the hash selection method is not "
+                      "supported",
+                      {'fields': lb_fields, 'group': group_id})
+        elif lb_fields:
+            # hash the flows over the fields, so that a flow sticks to
+            # one service function
+            group['selection_method'] = 'hash'
+            group['fields'] = ','.join(lb_fields)
+        if group_id not in self.group_cache:
+            self.br_int.add_group(group_id=group_id, **group)
+        elif self.group_cache[group_id] != group:
+            self.br_int.mod_group(group_id=group_id, **group)
+        else:
+            return
+        self.group_cache[group_id] = group
+
+    def _delete_group(self, group_id):
+        self.br_int.delete_group(group_id=group_id)
+        self.group_cache.pop(group_id, None)
+
+    def _get_flow_cookie(self, flowrule, flow):
+        flow_str = ','.join(
+            '%s=%s' % (key, flow[key]) for key in sorted(flow))
+        path = (flowrule['nsp'] << 8 | flowrule['nsi']) & SFC_COOKIE_PATH_MASK
+        return (SFC_COOKIE_PREFIX |
+                path << SFC_COOKIE_PATH_SHIFT |
+                zlib.crc32(flow_str.encode('utf-8')) & 0xffffffff)
+
+    def _add_flow(self, flowrule, **kwargs):
+        cookie = self._get_flow_cookie(flowrule, kwargs)
+        if cookie in self._present_cookies:
+            # the flow was installed before the agent restarted
+            self._present_cookies.discard(cookie)
+            if self._stale_cookies is not None:
+                self._stale_cookies.discard(cookie)
+            return
+        self._install_flow(cookie, **kwargs)
+
+    def _install_flow(self, cookie, **kwargs):
+        if self._stale_cookies is not None:
+            self._stale_cookies.discard(cookie)
+        self.br_int.reserve_cookie(cookie)
+        self.br_int.add_flow(cookie=cookie, **kwargs)
+
+    def _delete_flows(self, **kwargs):
+        if self._present_cookies:
+            # the flows found at start removed by this must be installed
+            # again if asked for
+            self._present_cookies -= self.br_int.dump_flow_cookies(
+                SFC_COOKIE_PREFIX, SFC_COOKIE_PREFIX_MASK, **kwargs)
+        self.br_int.delete_flows(**kwargs)
+
+    def _load_sfc_state_on_int_br(self):
+        self.group_cache = dict.fromkeys(self.br_int.dump_group_ids())
+        self._present_cookies = self.br_int.dump_flow_cookies(
+            SFC_COOKIE_PREFIX, SFC_COOKIE_PREFIX_MASK)
+        self._stale_cookies = set(self._present_cookies)
+        for cookie in self._present_cookies:
+            self.br_int.reserve_cookie(cookie)
+        LOG.debug("found %(flows)d SFC flows and %(groups)d groups on "
+                  "br-int", {'flows': len(self._present_cookies),
+                             'groups': len(self.group_cache)})
+
+    def get_sync_port_ids(self):
+        return self.br_int.get_vif_port_set()
+
+    def finish_sync(self):
+        if self._stale_cookies is None:
+            return
+        stale_groups = [group_id
+                        for group_id, group in self.group_cache.items()
+                        if group is None]
+        LOG.debug("removing %(flows)d stale SFC flows and %(groups)d stale "
+                  "groups from br-int",
+                  {'flows': len(self._stale_cookies),
+                   'groups': len(stale_groups)})
+        with self._flow_transaction():
+            for cookie in self._stale_cookies:
+                self.br_int.delete_flows(
+                    cookie='0x%x/0x%x' % (cookie, UINT64_BITMASK))
+                self.br_int.unreserve_cookie(cookie)
+            for group_id in stale_groups:
+                self._delete_group(group_id)
+        self._present_cookies = set()
+        self._stale_cookies = None
+
+    def _setup_sfc_flows_on_int_br(self):
         self.br_int.install_goto(dest_table_id=INGRESS_TABLE,
                                  priority=PC_DEF_PRI,
                                  eth_type=0x8847)
@@ -231,18 +440,8 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
                 source_port_masks,
                 destination_port_masks)
 
-    def _get_flow_infos_from_flow_classifier(self, flow_classifier, flowrule):
-        flow_infos = []
-        nw_src, nw_dst, tp_src, tp_dst = ((None, ) * 4)
-
-        if "IPv4" != flow_classifier['ethertype']:
-            LOG.error("Current portchain agent only supports IPv4")
-            return flow_infos
-
-        # parse and transfer flow info to match field info
-        dl_type, nw_proto, source_port_masks, destination_port_masks = (
-            self._parse_flow_classifier(flow_classifier))
-
+    def _get_ip_prefixes_from_flow_classifier(self, flow_classifier,
+                                              flowrule):
         if flowrule['fwd_path']:
             if flow_classifier['source_ip_prefix']:
                 nw_src = flow_classifier['source_ip_prefix']
@@ -261,6 +460,21 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
                 nw_dst = flow_classifier['source_ip_prefix']
             else:
                 nw_dst = '0.0.0.0/0.0.0.0'
+        return nw_src, nw_dst
+
+    def _get_flow_infos_from_flow_classifier(self, flow_classifier, flowrule):
+        flow_infos = []
+        tp_src, tp_dst = ((None, ) * 2)
+
+        if "IPv4" != flow_classifier['ethertype']:
+            LOG.error("Current portchain agent only supports IPv4")
+            return flow_infos
+
+        # parse and transfer flow info to match field info
+        dl_type, nw_proto, source_port_masks, destination_port_masks = (
+            self._parse_flow_classifier(flow_classifier))
+        nw_src, nw_dst = self._get_ip_prefixes_from_flow_classifier(
+            flow_classifier, flowrule)
 
         if source_port_masks and destination_port_masks:
             for destination_port in destination_port_masks:
@@ -287,18 +501,109 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
 
         return flow_infos
 
-    def _get_flow_infos_from_flow_classifier_list(self, flow_classifier_list,
-                                                  flowrule):
-        flow_infos = []
-
-        if not flow_classifier_list:
-            return flow_infos
-        for flow_classifier in flow_classifier_list:
-            flow_infos.extend(
-                self._get_flow_infos_from_flow_classifier(flow_classifier,
-                                                          flowrule))
+    def _get_conj_flow_info_from_flow_classifier(self, flow_classifier,
+                                                 flowrule):
+        """Get the match of a flow classifier as a conjunctive match.
 
-        return flow_infos
+        Returns the match without the transport ports, the tp_src masks and
+        the tp_dst masks, or None when the classifier has a single mask
+        for one of the ports and expanding it costs no more flows.
+        """
+        if "IPv4" != flow_classifier['ethertype']:
+            return None
+        dl_type, nw_proto, source_port_masks, destination_port_masks = (
+            self._parse_flow_classifier(flow_classifier))
+        if (nw_proto is None or len(source_port_masks) < 2 or
+                len(destination_port_masks) < 2):
+            return None
+        nw_src, nw_dst = self._get_ip_prefixes_from_flow_classifier(
+            flow_classifier, flowrule)
+        flow_info = {'dl_type': dl_type,
+                     'nw_proto': nw_proto,
+                     'nw_src': nw_src,
+                     'nw_dst': nw_dst}
+        if flowrule['fwd_path']:
+            return flow_info, source_port_masks, destination_port_masks
+        return flow_info, destination_port_masks, source_port_masks
+
+    def _get_conj_id(self, conj_key):
+        conj_id = self._conj_ids.get(conj_key)
+        if conj_id is not None:
+            return conj_id
+        # derived from the match, so that the conjunctions keep their id
+        # when the agent restarts
+        conj_id = zlib.crc32(
+            ';'.join('%s' % item for item in conj_key).encode('utf-8')
+        ) & CONJUNCTION_ID_MASK
+        while conj_id in self._used_conj_ids:
+            conj_id = (conj_id + 1) & CONJUNCTION_ID_MASK
+        return conj_id
+
+    def _update_conj_clause(self, flowrule, priority, match_info, conj_id,
+                            clause):
+        key = (priority, frozenset(match_info.items()))
+        match_info, conjunctions = self._conj_clauses.setdefault(
+            key, (match_info, {}))
+        if clause:
+            conjunctions[conj_id] = clause
+        else:
+            conjunctions.pop(conj_id, None)
+
+        if conjunctions:
+            actions = ','.join(
+                'conjunction(%d,%s)' % (clause_conj_id,
+                                        conjunctions[clause_conj_id])
+                for clause_conj_id in sorted(conjunctions))
+            flow = dict(match_info, table=ovs_consts.LOCAL_SWITCHING,
+                        priority=priority, actions=actions)
+            # the flow replaces the one of another set of conjunctions, it
+            # is never left as found on start
+            self._install_flow(self._get_flow_cookie(flowrule, flow), **flow)
+        else:
+            del self._conj_clauses[key]
+            self._delete_flows(table=ovs_consts.LOCAL_SWITCHING,
+                               priority=priority,
+                               **match_info)
+
+    def _setup_conj_flows_on_int_br(self, flowrule, priority, match_info,
+                                    tp_src_masks, tp_dst_masks, actions,
+                                    add_flow=True):
+        conj_key = (priority, tuple(sorted(match_info.items())),
+                    tuple(tp_src_masks), tuple(tp_dst_masks))
+        conj_id = self._get_conj_id(conj_key)
+        if add_flow:
+            self._conj_ids[conj_key] = conj_id
+            self._used_conj_ids.add(conj_id)
+            self._add_flow(flowrule,
+                           table=ovs_consts.LOCAL_SWITCHING,
+                           priority=priority,
+                           conj_id=conj_id,
+                           actions=actions)
+        else:
+            if self._conj_ids.pop(conj_key, None) is not None:
+                self._used_conj_ids.discard(conj_id)
+            self._delete_flows(table=ovs_consts.LOCAL_SWITCHING,
+                               priority=priority,
+                               conj_id=conj_id)
+
+        for clause, field, masks in ((1, 'tp_src', tp_src_masks),
+                                     (2, 'tp_dst', tp_dst_masks)):
+            for mask in masks:
+                clause_match = dict(match_info)
+                clause_match[field] = mask
+                if add_flow:
+                    self._update_conj_clause(flowrule, priority,
+                                             clause_match, conj_id,
+                                             '%d/2' % clause)
+                elif (priority,
+                      frozenset(clause_match.items())) in self._conj_clauses:
+                    self._update_conj_clause(flowrule, priority,
+                                             clause_match, conj_id, None)
+                else:
+                    # not installed by this agent instance
+                    self._delete_flows(table=ovs_consts.LOCAL_SWITCHING,
+                                       priority=priority,
+                                       **clause_match)
 
     def _setup_local_switch_flows_on_int_br(self, flowrule,
                                             flow_classifier_list, actions,
@@ -316,8 +621,27 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
                 inport_match = {'in_port': egress_port.ofport}
                 priority = PC_INGRESS_PRI
 
-        for flow_info in self._get_flow_infos_from_flow_classifier_list(
-                flow_classifier_list, flowrule):
+        flow_infos = []
+        for flow_classifier in flow_classifier_list or []:
+            conj_flow_info = None
+            if self.conjunction and not (
+                    node_type == constants.SF_NODE and pp_corr):
+                conj_flow_info = (
+                    self._get_conj_flow_info_from_flow_classifier(
+                        flow_classifier, flowrule))
+            if conj_flow_info:
+                flow_info, tp_src_masks, tp_dst_masks = conj_flow_info
+                match_info = dict(inport_match)
+                match_info.update(flow_info)
+                self._setup_conj_flows_on_int_br(
+                    flowrule, priority, match_info, tp_src_masks,
+                    tp_dst_masks, actions, add_flow=add_flow)
+            else:
+                flow_infos.extend(
+                    self._get_flow_infos_from_flow_classifier(
+                        flow_classifier, flowrule))
+
+        for flow_info in flow_infos:
             match_info = dict(inport_match)
             match_info.update(flow_info)
             if node_type == constants.SF_NODE:
@@ -328,14 +652,15 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
                             flowrule, match_info)
 
             if add_flow:
-                self.br_int.add_flow(table=ovs_consts.LOCAL_SWITCHING,
-                                     priority=priority,
-                                     actions=actions,
-                                     **match_info)
+                self._add_flow(flowrule,
+                               table=ovs_consts.LOCAL_SWITCHING,
+                               priority=priority,
+                               actions=actions,
+                               **match_info)
             else:
-                self.br_int.delete_flows(table=ovs_consts.LOCAL_SWITCHING,
-                                         priority=priority,
-                                         **match_info)
+                self._delete_flows(table=ovs_consts.LOCAL_SWITCHING,
+                                   priority=priority,
+                                   **match_info)
 
     def _setup_egress_flow_rules(self, flowrule, match_inport=True):
         group_id = flowrule.get('next_group_id', None)
@@ -401,42 +726,30 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
                 subnet_actions_list.append(subnet_actions)
 
                 if flowrule['fwd_path']:
-                    self.br_int.add_flow(
+                    self._add_flow(
+                        flowrule,
                         table=ACROSS_SUBNET_TABLE,
                         priority=0,
                         dl_dst=item['in_mac_address'],
                         dl_type=0x0800,
                         actions="%s" % ','.join(subnet_actions_list))
                 else:
-                    self.br_int.add_flow(
+                    self._add_flow(
+                        flowrule,
                         table=ACROSS_SUBNET_TABLE,
                         priority=0,
                         dl_dst=item['mac_address'],
                         dl_type=0x0800,
                         actions="%s" % ','.join(subnet_actions_list))
 
-            group_content = self.br_int.dump_group_for_id(group_id)
             buckets = ','.join(buckets)
+            lb_fields = flowrule.get('lb_fields')
             if flowrule['fwd_path']:
-                if group_content.find('group_id=%d' % group_id) == -1:
-                    self.br_int.add_group(group_id=group_id,
-                                          type='select',
-                                          buckets=buckets)
-                else:
-                    self.br_int.mod_group(group_id=group_id,
-                                          type='select',
-                                          buckets=buckets)
+                self._install_group(group_id, buckets, lb_fields)
             else:
                 # set different id for rev_group
-                rev_group_id = group_id + REVERSE_GROUP_NUMBER_OFFSET
-                if group_content.find('group_id=%d' % (rev_group_id)) == -1:
-                    self.br_int.add_group(group_id=rev_group_id,
-                                          type='select',
-                                          buckets=buckets)
-                else:
-                    self.br_int.mod_group(group_id=rev_group_id,
-                                          type='select',
-                                          buckets=buckets)
+                self._install_group(group_id + REVERSE_GROUP_NUMBER_OFFSET,
+                                    buckets, lb_fields)
 
             # 2nd, install br-int flow rule on table 0 for egress traffic
             enc_actions = ""
@@ -509,7 +822,7 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
                 elif pp_corr == 'mpls':
                     match_field = self._build_forward_sfc_mpls(flowrule,
                                                                vif_port, vlan)
-            self.br_int.add_flow(**match_field)
+            self._add_flow(flowrule, **match_field)
 
     def _build_classification_match_sfc_mpls(self, flowrule, match_info):
         match_info['dl_type'] = 0x8847
@@ -552,9 +865,34 @@ class SfcOVSAgentDriver(sfc.SfcAgentDriver):
         return match_field
 
     def _delete_flows_mpls(self, flowrule, vif_port):
-        self.br_int.delete_flows(
+        self._delete_flows(
             table=INGRESS_TABLE,
             dl_type=0x8847,
             dl_dst=vif_port.vif_mac,
             mpls_label=flowrule['nsp'] << 8 | flowrule['nsi'] + 1
         )
+
+
+class SfcOVSNativeAgentDriver(SfcOVSAgentDriver):
+    """SFC agent driver for the native OpenFlow interface of the OVS agent
+
+    It programs the same flows and groups as SfcOVSAgentDriver, but over
+    the persistent OpenFlow connection of the agent's br-int instead of
+    one ovs-ofctl process per operation. It requires the OVS agent to run
+    with of_interface = native.
+    """
+
+    def _hash_selection_supported(self):
+        LOG.warning("The %s SFC agent driver does not support the hash "
+                    "selection method of the port pair groups with "
+                    "lb_fields, their flows are balanced by the default "
+                    "selection method of the switch instead",
+                    self.__class__.__name__)
+        return False
+
+    def _get_br_int_ext(self, int_br):
+        if not hasattr(int_br, '_get_dp'):
+            raise RuntimeError(
+                "The %s SFC agent driver requires the native OpenFlow "
+                "interface of the OVS agent" % self.__class__.__name__)
+        return ovs_native_lib.SfcOVSBridgeNative(int_br)
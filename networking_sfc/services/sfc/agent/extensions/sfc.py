@@ -13,8 +13,10 @@
 # limitations under the License.
 
 import abc
+import copy
 import six
 
+import eventlet
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging
@@ -30,8 +32,17 @@ from networking_sfc.services.sfc.drivers.ovs import rpc_topics as sfc_topics
 
 LOG = logging.getLogger(__name__)
 
+cfg.CONF.import_group('sfc_agent', 'networking_sfc.services.sfc.common.config')
+
 
 class SfcPluginApi(object):
+    """Agent side of the SFC plugin RPC API.
+
+    API version history:
+        1.0 - Initial version.
+        1.1 - Add get_flowrules_by_host.
+    """
+
     def __init__(self, topic, host):
         self.host = host
         self.target = oslo_messaging.Target(topic=topic, version='1.0')
@@ -49,6 +60,12 @@ class SfcPluginApi(object):
             context, 'get_flowrules_by_host_portid',
             host=self.host, port_id=port_id)
 
+    def get_flowrules_by_host(self, context, marker=None, limit=None):
+        cctxt = self.client.prepare(version='1.1')
+        return cctxt.call(
+            context, 'get_flowrules_by_host',
+            host=self.host, marker=marker, limit=limit)
+
 
 @six.add_metaclass(abc.ABCMeta)
 class SfcAgentDriver(object):
@@ -70,17 +87,54 @@ class SfcAgentDriver(object):
     def delete_flow_rule(self, flowrule, flowrule_status):
         """Delete a flow rule in driver."""
 
+    def get_sync_port_ids(self):
+        """Return the ids of the ports to handle before finish_sync."""
+        return set()
+
+    def finish_sync(self):
+        """Remove what is left from before the agent started.
+
+        Called once the ports returned by get_sync_port_ids were handled
+        after initialize.
+        """
+
 
 class SfcAgentExtension(l2_extension.L2AgentExtension):
+    """SFC agent extension.
+
+    RPC API version history:
+        1.0 - Initial version.
+        1.1 - Add process_flow_rules.
+    """
+
+    target = oslo_messaging.Target(version='1.1')
 
     def initialize(self, connection, driver_type):
         """Initialize agent extension."""
         self.sfc_driver = manager.NeutronManager.load_class_for_provider(
-            'networking_sfc.sfc.agent_drivers', driver_type)()
+            'networking_sfc.sfc.agent_drivers',
+            cfg.CONF.sfc_agent.driver or driver_type)()
         self.sfc_driver.consume_api(self.agent_api)
         self.sfc_driver.initialize()
 
+        # flow rules of the host fetched in bulk, keyed by port id, which
+        # handle_port uses instead of fetching the flow rules of each port
+        self._host_flowrules = {}
+        self._sync_required = True
+
+        # ports on the bridge at start which are not handled yet, the
+        # driver removes its stale flows once they all are
+        self._unsynced_ports = set(self.sfc_driver.get_sync_port_ids())
+        # ports the agent never hands to the extension, e.g. ports bound to
+        # another host, must not keep the stale flows forever
+        self._sync_timer = None
+
         self._sfc_setup_rpc()
+        if not self._unsynced_ports:
+            self._finish_sync()
+        elif cfg.CONF.sfc_agent.sync_timeout:
+            self._sync_timer = eventlet.spawn_after(
+                cfg.CONF.sfc_agent.sync_timeout, self._sync_timed_out)
 
     def consume_api(self, agent_api):
         """Receive neutron agent API object
@@ -97,11 +151,7 @@ class SfcAgentExtension(l2_extension.L2AgentExtension):
         flowrule_status = []
         try:
             LOG.debug("a new device %s is found", port_id)
-            flows_list = (
-                self.sfc_plugin_rpc.get_flowrules_by_host_portid(
-                    context, port_id
-                )
-            )
+            flows_list = self._get_port_flowrules(context, port_id)
             if flows_list:
                 for flow in flows_list:
                     self.sfc_driver.update_flow_rules(
@@ -110,13 +160,91 @@ class SfcAgentExtension(l2_extension.L2AgentExtension):
             LOG.exception(e)
             LOG.error("SFC L2 extension handle_port failed")
             resync = True
+            self._sync_required = True
 
         if flowrule_status:
             self.sfc_plugin_rpc.update_flowrules_status(
                 context, flowrule_status)
 
+        if not resync:
+            self._port_synced(port_id)
         return resync
 
+    def _port_synced(self, port_id):
+        if self._unsynced_ports:
+            self._unsynced_ports.discard(port_id)
+            if not self._unsynced_ports:
+                self._finish_sync()
+
+    def _sync_timed_out(self):
+        self._sync_timer = None
+        if self._unsynced_ports:
+            LOG.warning("%(count)d ports of br-int were not handled "
+                        "%(timeout)d seconds after start, removing the "
+                        "stale SFC flows anyway",
+                        {'count': len(self._unsynced_ports),
+                         'timeout': cfg.CONF.sfc_agent.sync_timeout})
+            self._finish_sync()
+
+    def _finish_sync(self):
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        self._unsynced_ports = None
+        try:
+            self.sfc_driver.finish_sync()
+        except Exception as e:
+            LOG.exception(e)
+            LOG.error("SFC L2 extension finish_sync failed")
+
+    def _get_port_flowrules(self, context, port_id):
+        """Get the flow rules of a port.
+
+        On start and after a failure, the flow rules of all the ports of
+        the host are fetched at once and handed out as the ports are
+        handled. Ports not found there, e.g. ports bound after the fetch,
+        get their flow rules with a per port call.
+        """
+        if self._sync_required:
+            self._sync_required = False
+            self._host_flowrules = self._fetch_host_flowrules(context)
+        flowrules = self._host_flowrules.pop(port_id, None)
+        if flowrules is not None:
+            # the driver updates the flow rules it applies in place
+            return copy.deepcopy(flowrules)
+        return self.sfc_plugin_rpc.get_flowrules_by_host_portid(
+            context, port_id)
+
+    def _fetch_host_flowrules(self, context):
+        host_flowrules = {}
+        marker = None
+        try:
+            while True:
+                result = self.sfc_plugin_rpc.get_flowrules_by_host(
+                    context, marker=marker,
+                    limit=cfg.CONF.sfc_agent.flowrules_page_size)
+                for port_detail in result['port_details']:
+                    port_ids = set([port_detail['ingress'],
+                                    port_detail['egress']])
+                    port_ids.discard(None)
+                    for port_id in port_ids:
+                        host_flowrules.setdefault(port_id, []).extend(
+                            port_detail['flowrules'])
+                marker = result['next_marker']
+                if not marker:
+                    break
+        except Exception as e:
+            LOG.exception(e)
+            LOG.warning("Failed to fetch the flow rules of the host, "
+                        "fetching them per port")
+            return {}
+        LOG.debug("fetched the flow rules of %d ports", len(host_flowrules))
+        return host_flowrules
+
+    def _invalidate_host_flowrules(self):
+        # flow rules fetched in bulk may be outdated by a notification
+        self._host_flowrules = {}
+
     def delete_port(self, context, port):
         """Handle agent SFC extension port delete."""
         port_id = port['port_id']
@@ -132,10 +260,13 @@ class SfcAgentExtension(l2_extension.L2AgentExtension):
             )
             resync = True
 
+        if not resync:
+            self._port_synced(port_id)
         return resync
 
     def update_flow_rules(self, context, **kwargs):
         flowrule_status = []
+        self._invalidate_host_flowrules()
         try:
             flowrules = kwargs['flowrule_entries']
             LOG.debug("update_flow_rules received,  flowrules = %s",
@@ -154,6 +285,7 @@ class SfcAgentExtension(l2_extension.L2AgentExtension):
 
     def delete_flow_rules(self, context, **kwargs):
         flowrule_status = []
+        self._invalidate_host_flowrules()
         try:
             flowrules = kwargs['flowrule_entries']
             LOG.debug("delete_flow_rules received,  flowrules= %s", flowrules)
@@ -168,6 +300,29 @@ class SfcAgentExtension(l2_extension.L2AgentExtension):
             self.sfc_plugin_rpc.update_flowrules_status(
                 context, flowrule_status)
 
+    def process_flow_rules(self, context, **kwargs):
+        """Apply an ordered batch of flow rule updates and deletions."""
+        flowrule_status = []
+        self._invalidate_host_flowrules()
+        flowrule_entries = kwargs.get('flowrule_entries') or []
+        LOG.debug("process_flow_rules received, %d flowrules",
+                  len(flowrule_entries))
+        for entry in flowrule_entries:
+            try:
+                if entry['operation'] == topics.DELETE:
+                    self.sfc_driver.delete_flow_rule(
+                        entry['flowrule'], flowrule_status)
+                else:
+                    self.sfc_driver.update_flow_rules(
+                        entry['flowrule'], flowrule_status)
+            except Exception as e:
+                LOG.exception(e)
+                LOG.error("process_flow_rules failed")
+
+        if flowrule_status:
+            self.sfc_plugin_rpc.update_flowrules_status(
+                context, flowrule_status)
+
     def _sfc_setup_rpc(self):
         self.sfc_plugin_rpc = SfcPluginApi(
             sfc_topics.SFC_PLUGIN, cfg.CONF.host)
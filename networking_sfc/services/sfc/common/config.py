@@ -22,7 +22,116 @@ SFC_DRIVER_OPTS = [
                 help=_("An ordered list of service chain drivers "
                        "entrypoints to be loaded from the "
                        "networking_sfc.sfc.drivers namespace.")),
+    cfg.IntOpt('flowrules_bulk_size',
+               default=500,
+               min=1,
+               help=_("Maximum number of path nodes, port chains, flow "
+                      "classifiers or ports loaded with one query when the "
+                      "OVS driver builds the flow rules requested by an "
+                      "agent, and maximum number of port pair details "
+                      "returned per get_flowrules_by_host call.")),
+    cfg.IntOpt('flowrule_status_interval',
+               default=2,
+               min=1,
+               help=_("Seconds during which the OVS driver coalesces the "
+                      "flow rule statuses reported by the agents before "
+                      "writing them to the path nodes.")),
+    cfg.StrOpt('agent_rpc_version_cap',
+               help=_("Maximum version of the SFC agent RPC API used by the "
+                      "OVS driver to notify the agents of flow rules. Set "
+                      "it to 1.0 while some SFC agents run a release older "
+                      "than the servers, so that the flow rules are sent "
+                      "with one message per flow rule instead of one "
+                      "message per agent host. Defaults to the latest "
+                      "version.")),
+    cfg.BoolOpt('instrumentation',
+                default=False,
+                help=_("Measure the wall time, SQL statements, RPC casts and "
+                       "RPC payload bytes of the SFC plugin and driver "
+                       "operations. The metrics are logged periodically "
+                       "and returned to admins by the sfc-metrics API "
+                       "extension.")),
+    cfg.IntOpt('instrumentation_log_interval',
+               default=600,
+               min=0,
+               help=_("Seconds between two logs of the instrumentation "
+                      "metrics, 0 to disable the logs.")),
+    cfg.BoolOpt('async_postcommit',
+                default=False,
+                help=_("Run the driver postcommit operations of port chain "
+                       "creations and updates in background workers. The "
+                       "API returns the port chain in the building status, "
+                       "which becomes active or error once the drivers are "
+                       "done. The operations on one port chain keep their "
+                       "order within an API worker process only: the "
+                       "operations submitted to different API workers, or "
+                       "to different servers, on the same port chain may "
+                       "run concurrently.")),
+    cfg.IntOpt('postcommit_workers',
+               default=4,
+               min=1,
+               help=_("Number of background workers of each API worker "
+                      "running port chain postcommit operations when "
+                      "async_postcommit is enabled.")),
+    cfg.IntOpt('port_detail_cache_size',
+               default=4096,
+               min=0,
+               help=_("Maximum number of host tunnel endpoints, and of "
+                      "network segmentations, cached by the OVS driver "
+                      "to build the port pair details, 0 to disable the "
+                      "cache.")),
+    cfg.IntOpt('port_detail_cache_ttl',
+               default=60,
+               min=0,
+               help=_("Seconds during which a host tunnel endpoint or a "
+                      "network segmentation cached by the OVS driver is "
+                      "used, 0 to disable the cache. Each API worker has "
+                      "its own cache: a changed tunnel endpoint IP is only "
+                      "seen once the cached entry expires, and a network "
+                      "or segment update only invalidates the cache of "
+                      "the API worker processing it.")),
 ]
 
 
 cfg.CONF.register_opts(SFC_DRIVER_OPTS, "sfc")
+
+SFC_AGENT_OPTS = [
+    cfg.StrOpt('driver',
+               help=_("SFC agent driver entrypoint to be loaded from the "
+                      "networking_sfc.sfc.agent_drivers namespace. Defaults "
+                      "to the driver named after the L2 agent type, e.g. "
+                      "'ovs'. Use 'ovs_native' to program flows over the "
+                      "native OpenFlow interface of the OVS agent.")),
+    cfg.BoolOpt('flow_transaction',
+                default=False,
+                help=_("Defer the OpenFlow flow and group operations of "
+                       "each flow rule and apply them in order, with one "
+                       "ovs-ofctl invocation per run of consecutive "
+                       "operations of the same command type, instead of "
+                       "one invocation per operation.")),
+    cfg.IntOpt('flowrules_page_size',
+               default=100,
+               min=1,
+               help=_("Number of port pair details whose flow rules are "
+                      "fetched per RPC call when the SFC agent extension "
+                      "loads all the flow rules of its host, on start and "
+                      "after a failure.")),
+    cfg.BoolOpt('conjunction_classification',
+                default=False,
+                help=_("Classify the traffic of flow classifiers with "
+                       "source and destination port ranges using Open "
+                       "vSwitch conjunctive matches, which take one flow "
+                       "per port mask instead of one flow per pair of "
+                       "source and destination port masks. Ignored when "
+                       "Open vSwitch is older than 2.4.")),
+    cfg.IntOpt('sync_timeout',
+               default=300,
+               min=0,
+               help=_("Seconds after the start of the SFC agent extension "
+                      "at which the SFC flows and groups left from before "
+                      "the start are removed even if some ports of br-int "
+                      "were not handled yet, 0 to wait for all of them.")),
+]
+
+
+cfg.CONF.register_opts(SFC_AGENT_OPTS, "sfc_agent")
@@ -0,0 +1,254 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Opt-in instrumentation of the SFC service plugin and drivers.
+
+When [sfc] instrumentation is enabled, every measured operation records
+its wall time, the number of SQL statements executed, and the number and
+serialized size of the RPC casts sent while it runs. A measurement nested
+in another one, e.g. a driver call made by the plugin, also counts toward
+the outer one. The results are aggregated per operation in histograms
+kept by each process, logged periodically and returned by the
+sfc-metrics API extension.
+When it is disabled, a measured operation costs one flag check.
+"""
+
+import bisect
+import threading
+import time
+
+import eventlet
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+import six
+import sqlalchemy as sa
+
+LOG = logging.getLogger(__name__)
+
+cfg.CONF.import_opt('instrumentation',
+                    'networking_sfc.services.sfc.common.config', group='sfc')
+
+# upper bounds of the histogram buckets, the last bucket has no bound
+WALL_TIME_MS_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000,
+                       5000, 10000)
+COUNT_BOUNDS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 10000)
+BYTES_BOUNDS = (0, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_enabled = False
+_listening = False
+_logging = False
+
+
+class Histogram(object):
+    """Distribution of the values of a metric."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        return {
+            'sum': self.total,
+            'max': self.max,
+            'buckets': [
+                [bound, count] for bound, count in
+                zip(self.bounds + (None,), self.buckets)
+            ]
+        }
+
+
+class OperationMetrics(object):
+    """Metrics aggregated over the calls of an operation."""
+
+    def __init__(self):
+        self.count = 0
+        self.wall_time_ms = Histogram(WALL_TIME_MS_BOUNDS)
+        self.queries = Histogram(COUNT_BOUNDS)
+        self.rpc_casts = Histogram(COUNT_BOUNDS)
+        self.payload_bytes = Histogram(BYTES_BOUNDS)
+
+    def add(self, measurement):
+        self.count += 1
+        self.wall_time_ms.add(measurement.wall_time * 1000)
+        self.queries.add(measurement.queries)
+        self.rpc_casts.add(measurement.rpc_casts)
+        self.payload_bytes.add(measurement.payload_bytes)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'wall_time_ms': self.wall_time_ms.to_dict(),
+            'queries': self.queries.to_dict(),
+            'rpc_casts': self.rpc_casts.to_dict(),
+            'payload_bytes': self.payload_bytes.to_dict()
+        }
+
+
+class Measurement(object):
+    """Context manager measuring one call of an operation."""
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+        self.wall_time = 0
+        self.queries = 0
+        self.rpc_casts = 0
+        self.payload_bytes = 0
+
+    def __enter__(self):
+        self.registry.active().append(self)
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall_time = time.time() - self._start
+        self.registry.active().remove(self)
+        self.registry.record(self.name, self)
+
+
+class _NoMeasurement(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NO_MEASUREMENT = _NoMeasurement()
+
+
+class Registry(object):
+    """Metrics of the measured operations, keyed by operation name."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        # measurements running in the current (green) thread
+        self._local = threading.local()
+
+    def active(self):
+        try:
+            return self._local.measurements
+        except AttributeError:
+            self._local.measurements = []
+            return self._local.measurements
+
+    def record(self, name, measurement):
+        with self._lock:
+            metrics = self._metrics.get(name)
+            if metrics is None:
+                metrics = self._metrics[name] = OperationMetrics()
+            metrics.add(measurement)
+
+    def snapshot(self):
+        """Return a dict of the metrics dicts keyed by operation name."""
+        with self._lock:
+            return dict(
+                (name, metrics.to_dict())
+                for name, metrics in self._metrics.items()
+            )
+
+    def reset(self):
+        with self._lock:
+            self._metrics = {}
+
+
+REGISTRY = Registry()
+
+
+def setup():
+    """Enable the instrumentation if configured so."""
+    global _enabled, _listening, _logging
+    _enabled = cfg.CONF.sfc.instrumentation
+    if not _enabled:
+        return
+    if not _listening:
+        _listening = True
+        sa.event.listen(sa.engine.Engine, 'before_cursor_execute',
+                        _count_query)
+    interval = cfg.CONF.sfc.instrumentation_log_interval
+    if interval and not _logging:
+        _logging = True
+        eventlet.spawn_n(_log_summaries, interval)
+
+
+def enabled():
+    return _enabled
+
+
+def measure(name):
+    """Return a context manager measuring an operation."""
+    if not _enabled:
+        return _NO_MEASUREMENT
+    return Measurement(REGISTRY, name)
+
+
+def instrumented(f):
+    """Measure the calls of a method, named after its class."""
+    @six.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        if not _enabled:
+            return f(self, *args, **kwargs)
+        with Measurement(REGISTRY, '%s.%s' % (type(self).__name__,
+                                              f.__name__)):
+            return f(self, *args, **kwargs)
+
+    return wrapper
+
+
+def count_rpc_cast(payload):
+    """Count an RPC cast, and the size of its payload, if measured."""
+    if not _enabled:
+        return
+    measurements = REGISTRY.active()
+    if not measurements:
+        return
+    size = len(jsonutils.dumps(payload))
+    for measurement in measurements:
+        measurement.rpc_casts += 1
+        measurement.payload_bytes += size
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if not _enabled:
+        return
+    for measurement in REGISTRY.active():
+        measurement.queries += 1
+
+
+def _log_summaries(interval):
+    while True:
+        eventlet.sleep(interval)
+        if not _enabled:
+            continue
+        for name, metrics in sorted(REGISTRY.snapshot().items()):
+            count = metrics['count']
+            LOG.info("%(name)s: %(count)d calls, %(avg).1f ms average, "
+                     "%(max).1f ms max, %(queries).1f queries, "
+                     "%(casts).1f RPC casts and %(bytes)d bytes per call",
+                     {'name': name, 'count': count,
+                      'avg': metrics['wall_time_ms']['sum'] / count,
+                      'max': metrics['wall_time_ms']['max'],
+                      'queries': float(metrics['queries']['sum']) / count,
+                      'casts': float(metrics['rpc_casts']['sum']) / count,
+                      'bytes': metrics['payload_bytes']['sum'] // count})
@@ -12,6 +12,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import re
+import threading
+
 from neutron.plugins.ml2.drivers.openvswitch.agent.common import constants \
     as ovs_consts
 from neutron_lib import exceptions
@@ -47,19 +51,63 @@ def get_port_mask(min_port, max_port):
 
 def decorate_run_ofctl(f, sfc_ovs_bridge):
     @six.wraps(f)
-    def run_ofctl(cmd, args, process_input=None):
-        return f(cmd, ["-O " + sfc_ovs_bridge.of_version] + args,
-                 process_input)
+    def run_ofctl(cmd, args, process_input=None, of_version=None):
+        of_version = of_version or sfc_ovs_bridge.of_version
+        return f(cmd, ["-O " + of_version] + args, process_input)
 
     return run_ofctl
 
 
+class FlowTransaction(object):
+    """Flow and group operations deferred until the transaction ends.
+
+    The operations are applied in the order they were issued, so that a
+    transaction has the effect of the same operations run one by one.
+    Consecutive operations of the same command type are batched in one
+    ovs-ofctl invocation (mod-group only accepts a single group and still
+    needs one per group).
+    """
+
+    def __init__(self):
+        # [(command type, [operation])], in the order they were issued
+        self.operations = []
+
+    def append(self, command, operation):
+        if self.operations and self.operations[-1][0] == command:
+            self.operations[-1][1].append(operation)
+        else:
+            self.operations.append((command, [operation]))
+
+    def apply(self, bridge_ext):
+        for command, operations in self.operations:
+            if command == 'del_flows':
+                bridge_ext.run_ofctl('del-flows', ['-'], ''.join(operations))
+            elif command == 'del_flows_strict':
+                bridge_ext.run_ofctl('del-flows', ['--strict', '-'],
+                                     ''.join(operations))
+            elif command == 'add_flows':
+                bridge_ext.bridge.do_action_flows('add', operations)
+            elif command == 'mod_flows':
+                bridge_ext.bridge.do_action_flows('mod', operations)
+            elif command == 'add_groups':
+                bridge_ext.do_action_groups('add', operations)
+            elif command == 'mod_groups':
+                for group in operations:
+                    bridge_ext.do_action_groups('mod', [group])
+            elif command == 'del_groups':
+                bridge_ext.do_action_groups('del', operations)
+
+
 class SfcOVSBridgeExt(object):
 
     def __init__(self, ovs_bridge):
         self.bridge = ovs_bridge
         # OpenFlow 1.1 for groups
         self.of_version = ovs_consts.OPENFLOW11
+        # the open transaction of each (green) thread using the bridge
+        self._local = threading.local()
+        # cookies of the flows the agent must keep when it cleans the bridge
+        self.reserved_cookies = set()
 
         # this is so that our own run_ofctl is used when we call e.g. add_flows
         # (proxying is not enough, because the proxied bridge would still call
@@ -68,15 +116,57 @@ class SfcOVSBridgeExt(object):
             ovs_bridge.run_ofctl,
             self)
 
-    def set_protocols(self, protocols):
-        self.of_version = protocols[-1]
+    def set_protocols(self, protocols, of_version=None):
+        self.of_version = of_version or protocols[-1]
         self.bridge.set_protocols(protocols)
 
     # proxy most methods to self.bridge
     def __getattr__(self, name):
         return getattr(self.bridge, name)
 
+    @property
+    def _flow_transaction(self):
+        return getattr(self._local, 'transaction', None)
+
+    @contextlib.contextmanager
+    def flow_transaction(self, defer=True):
+        """Defer flow and group operations until the block exits.
+
+        The deferred operations are applied in batches when the block
+        exits normally and dropped if it raises. Nested transactions are
+        merged into the outermost one of the same (green) thread; the
+        transactions of different threads are independent.
+        """
+        if not defer or self._flow_transaction is not None:
+            yield self
+            return
+        transaction = FlowTransaction()
+        self._local.transaction = transaction
+        try:
+            yield self
+        finally:
+            self._local.transaction = None
+        transaction.apply(self)
+
+    def add_flow(self, **kwargs):
+        if self._flow_transaction is not None:
+            self._flow_transaction.append('add_flows', kwargs)
+        else:
+            self.bridge.add_flow(**kwargs)
+
+    def mod_flow(self, **kwargs):
+        if self._flow_transaction is not None:
+            self._flow_transaction.append('mod_flows', kwargs)
+        else:
+            self.bridge.mod_flow(**kwargs)
+
     def do_action_groups(self, action, kwargs_list):
+        # the group selection method and fields are OpenFlow 1.5 group
+        # properties, ovs-ofctl ignores them with an older version
+        of_version = None
+        if any('selection_method' in kw or 'fields' in kw
+               for kw in kwargs_list):
+            of_version = ovs_consts.OPENFLOW15
         group_strs = [_build_group_expr_str(kw, action) for kw in kwargs_list]
         if action == 'add' or action == 'del':
             cmd = '%s-groups' % action
@@ -85,16 +175,26 @@ class SfcOVSBridgeExt(object):
         else:
             msg = _("Action is illegal")
             raise exceptions.InvalidInput(error_message=msg)
-        self.run_ofctl(cmd, ['-'], '\n'.join(group_strs))
+        self.run_ofctl(cmd, ['-'], '\n'.join(group_strs),
+                       of_version=of_version)
 
     def add_group(self, **kwargs):
-        self.do_action_groups('add', [kwargs])
+        if self._flow_transaction is not None:
+            self._flow_transaction.append('add_groups', kwargs)
+        else:
+            self.do_action_groups('add', [kwargs])
 
     def mod_group(self, **kwargs):
-        self.do_action_groups('mod', [kwargs])
+        if self._flow_transaction is not None:
+            self._flow_transaction.append('mod_groups', kwargs)
+        else:
+            self.do_action_groups('mod', [kwargs])
 
     def delete_group(self, **kwargs):
-        self.do_action_groups('del', [kwargs])
+        if self._flow_transaction is not None:
+            self._flow_transaction.append('del_groups', kwargs)
+        else:
+            self.do_action_groups('del', [kwargs])
 
     def dump_group_for_id(self, group_id):
         retval = None
@@ -105,25 +205,77 @@ class SfcOVSBridgeExt(object):
                                if 'NXST' not in item)
         return retval
 
+    def dump_group_ids(self):
+        groups = self.run_ofctl("dump-groups", [])
+        return set(int(group_id) for group_id in
+                   re.findall(r'group_id=(\d+)', groups or ''))
+
+    def dump_flow_cookies(self, cookie, cookie_mask, **kwargs):
+        """Return the cookies of the flows matching cookie/cookie_mask.
+
+        The flows can be further selected like for delete_flows, the
+        priority aside.
+        """
+        kwargs.pop('priority', None)
+        kwargs['cookie'] = '0x%x/0x%x' % (cookie, cookie_mask)
+        flows = self.run_ofctl(
+            "dump-flows", [_build_del_flow_expr_str(kwargs).rstrip('\n')])
+        return set(int(flow_cookie, 16) for flow_cookie in
+                   re.findall(r'cookie=0x([0-9a-f]+)', flows or ''))
+
+    def reserve_cookie(self, cookie):
+        """Keep the flows with the given cookie when the agent cleans br-int.
+
+        The OVS agent removes the flows whose cookie the bridge does not
+        reserve after its first loop. request_cookie only reserves a random
+        cookie, a given one is reserved by stamping a clone of the bridge
+        with it, like the agent extension API does for each extension.
+        """
+        if cookie in self.reserved_cookies:
+            return
+        self.bridge.clone().set_agent_uuid_stamp(cookie)
+        # stamping the clone released the cookie of the bridge, which is
+        # reserved again when the bridge reads its reserved cookies
+        self.bridge.reserved_cookies
+        self.reserved_cookies.add(cookie)
+
+    def unreserve_cookie(self, cookie):
+        self.reserved_cookies.discard(cookie)
+        # unset_cookie is missing from the older agent bridges, which then
+        # keep the cookie reserved until the agent restarts
+        if hasattr(self.bridge, 'unset_cookie'):
+            self.bridge.unset_cookie(cookie)
+
     def delete_flows(self, **kwargs):
         # Run precision deletion with option --strict and priority
-        flow_expr_arr = []
-        for key, value in kwargs.items():
-            if key == "proto":
-                flow_expr_arr.append(value)
+        flow_str = _build_del_flow_expr_str(kwargs)
+        strict = "priority" in flow_str
+        if self._flow_transaction is not None:
+            if strict:
+                self._flow_transaction.append('del_flows_strict', flow_str)
             else:
-                flow_expr_arr.append("%s=%s" % (key, str(value)))
-        flow_str = ','.join(flow_expr_arr) + '\n'
-        if "priority" in flow_str:
+                self._flow_transaction.append('del_flows', flow_str)
+        elif strict:
             self.run_ofctl('del-flows', ['--strict', '-'], flow_str)
         else:
             self.run_ofctl('del-flows', ['-'], flow_str)
 
 
+def _build_del_flow_expr_str(flow_dict):
+    flow_expr_arr = []
+    for key, value in flow_dict.items():
+        if key == "proto":
+            flow_expr_arr.append(value)
+        else:
+            flow_expr_arr.append("%s=%s" % (key, str(value)))
+    return ','.join(flow_expr_arr) + '\n'
+
+
 def _build_group_expr_str(group_dict, cmd):
     group_expr_arr = []
     buckets = None
     group_id = None
+    fields = group_dict.pop('fields', None)
 
     if cmd != 'del':
         if "group_id" not in group_dict:
@@ -144,6 +296,10 @@ def _build_group_expr_str(group_dict, cmd):
     for key, value in group_dict.items():
         group_expr_arr.append("%s=%s" % (key, value))
 
+    # the fields hashed by selection_method=hash, which must precede them
+    if fields:
+        group_expr_arr.append("fields(%s)" % fields)
+
     if buckets:
         group_expr_arr.append(buckets)
 
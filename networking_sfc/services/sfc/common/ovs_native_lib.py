@@ -0,0 +1,354 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+
+import netaddr
+from neutron_lib import constants as n_consts
+from neutron_lib import exceptions
+from oslo_log import log as logging
+
+from networking_sfc._i18n import _
+
+LOG = logging.getLogger(__name__)
+
+UINT64_BITMASK = (1 << 64) - 1
+
+
+def split_actions(actions):
+    """Split an ovs-ofctl action string, keeping "resubmit(,N)" whole."""
+    tokens = []
+    depth = 0
+    token = ''
+    for char in actions:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == ',' and depth == 0:
+            tokens.append(token.strip())
+            token = ''
+        else:
+            token += char
+    tokens.append(token.strip())
+    return [token for token in tokens if token]
+
+
+def _parse_int(value):
+    if isinstance(value, int):
+        return value
+    return int(value, 0)
+
+
+def _parse_cookie(value):
+    # "value/mask" as in ovs-ofctl, a bare value matches the exact cookie
+    value = '%s' % value
+    if '/' in value:
+        cookie, mask = value.split('/')
+        return _parse_int(cookie), _parse_int(mask) & UINT64_BITMASK
+    return _parse_int(value), UINT64_BITMASK
+
+
+def _parse_ip_prefix(value):
+    ip = netaddr.IPNetwork(value)
+    if ip.prefixlen == 0:
+        return None
+    if ip.prefixlen == ip.network.netmask_bits():
+        return str(ip.ip)
+    return (str(ip.network), str(ip.netmask))
+
+
+def _parse_port_mask(value):
+    value = '%s' % value
+    if '/' in value:
+        port, mask = value.split('/')
+        return _parse_int(port), _parse_int(mask)
+    return _parse_int(value), 0xffff
+
+
+def build_match_kwargs(ofp, flow_dict):
+    """Translate ovs-ofctl match fields into OFPMatch keyword arguments."""
+    match = {}
+    nw_proto = flow_dict.get('nw_proto')
+    for key, value in flow_dict.items():
+        if value is None:
+            continue
+        if key == 'in_port':
+            match['in_port'] = _parse_int(value)
+        elif key in ('dl_type', 'eth_type'):
+            match['eth_type'] = _parse_int(value)
+        elif key == 'dl_dst':
+            match['eth_dst'] = value
+        elif key == 'dl_vlan':
+            match['vlan_vid'] = _parse_int(value) | ofp.OFPVID_PRESENT
+        elif key == 'nw_proto':
+            match['ip_proto'] = _parse_int(value)
+        elif key in ('nw_src', 'nw_dst'):
+            prefix = _parse_ip_prefix(value)
+            if prefix is not None:
+                match['ipv4_%s' % key[3:]] = prefix
+        elif key in ('tp_src', 'tp_dst'):
+            port, mask = _parse_port_mask(value)
+            if not mask:
+                continue
+            if nw_proto == n_consts.PROTO_NUM_TCP:
+                proto = 'tcp'
+            elif nw_proto == n_consts.PROTO_NUM_UDP:
+                proto = 'udp'
+            else:
+                msg = _("Transport ports can only be matched together "
+                        "with the tcp or udp protocol")
+                raise exceptions.InvalidInput(error_message=msg)
+            if mask == 0xffff:
+                match['%s_%s' % (proto, key[3:])] = port
+            else:
+                match['%s_%s' % (proto, key[3:])] = (port, mask)
+        elif key == 'mpls_label':
+            match['mpls_label'] = _parse_int(value)
+        elif key == 'conj_id':
+            match['conj_id'] = _parse_int(value)
+        else:
+            msg = _("Unsupported match field %s") % key
+            raise exceptions.InvalidInput(error_message=msg)
+    return match
+
+
+def build_actions(ofp, ofpp, actions):
+    """Translate an ovs-ofctl action string into OpenFlow actions."""
+    result = []
+    if not actions:
+        return result
+    for action in split_actions(actions):
+        name, sep, arg = action.partition(':')
+        if action == 'drop':
+            continue
+        elif action == 'normal':
+            result.append(ofpp.OFPActionOutput(ofp.OFPP_NORMAL, 0))
+        elif action == 'strip_vlan':
+            result.append(ofpp.OFPActionPopVlan())
+        elif action.startswith('resubmit('):
+            table_id = action[len('resubmit('):-1].split(',')[1]
+            result.append(ofpp.NXActionResubmitTable(
+                in_port=ofp.OFPP_IN_PORT, table_id=_parse_int(table_id)))
+        elif action.startswith('conjunction('):
+            conj_id, clauses = action[len('conjunction('):-1].split(',')
+            clause, n_clauses = clauses.split('/')
+            # clauses are numbered from 0 in the OpenFlow message
+            result.append(ofpp.NXActionConjunction(
+                clause=_parse_int(clause) - 1,
+                n_clauses=_parse_int(n_clauses),
+                id_=_parse_int(conj_id)))
+        elif name == 'output':
+            result.append(ofpp.OFPActionOutput(_parse_int(arg), 0))
+        elif name == 'group':
+            result.append(ofpp.OFPActionGroup(_parse_int(arg)))
+        elif name == 'mod_vlan_vid':
+            # ovs-ofctl pushes a VLAN header when the packet has none,
+            # which is always the case for traffic leaving a VM port
+            result.append(ofpp.OFPActionPushVlan(0x8100))
+            result.append(ofpp.OFPActionSetField(
+                vlan_vid=_parse_int(arg) | ofp.OFPVID_PRESENT))
+        elif name == 'mod_dl_dst':
+            result.append(ofpp.OFPActionSetField(eth_dst=arg))
+        elif name == 'push_mpls':
+            result.append(ofpp.OFPActionPushMpls(_parse_int(arg)))
+        elif name == 'pop_mpls':
+            result.append(ofpp.OFPActionPopMpls(_parse_int(arg)))
+        elif name == 'set_mpls_label':
+            result.append(ofpp.OFPActionSetField(mpls_label=_parse_int(arg)))
+        elif name == 'set_mpls_ttl':
+            result.append(ofpp.OFPActionSetMplsTtl(_parse_int(arg)))
+        else:
+            msg = _("Unsupported action %s") % action
+            raise exceptions.InvalidInput(error_message=msg)
+    return result
+
+
+def build_buckets(ofp, ofpp, buckets):
+    """Translate ovs-ofctl "bucket=..." strings into OFPBuckets."""
+    result = []
+    bucket = None
+    for token in split_actions(buckets):
+        if token.startswith('bucket='):
+            bucket = {'weight': 0, 'actions': []}
+            result.append(bucket)
+            token = token[len('bucket='):]
+            if token.startswith('weight='):
+                bucket['weight'] = _parse_int(token[len('weight='):])
+                continue
+        if bucket is None:
+            msg = _("Group actions must follow a bucket")
+            raise exceptions.InvalidInput(error_message=msg)
+        bucket['actions'].append(token)
+    return [
+        ofpp.OFPBucket(
+            weight=bucket['weight'],
+            watch_port=ofp.OFPP_ANY,
+            watch_group=ofp.OFPG_ANY,
+            actions=build_actions(ofp, ofpp, ','.join(bucket['actions'])))
+        for bucket in result
+    ]
+
+
+class SfcOVSBridgeNative(object):
+    """Native OpenFlow counterpart of ovs_ext_lib.SfcOVSBridgeExt.
+
+    It takes the same ovs-ofctl style arguments as SfcOVSBridgeExt, so the
+    SFC agent driver flow logic is shared, but sends the flow and group
+    modifications over the bridge's persistent OpenFlow connection instead
+    of spawning ovs-ofctl.
+    """
+
+    def __init__(self, ovs_bridge):
+        self.bridge = ovs_bridge
+        # cookies of the flows the agent must keep when it cleans the bridge
+        self.reserved_cookies = set()
+
+    def set_protocols(self, protocols, of_version=None):
+        self.bridge.set_protocols(protocols)
+
+    # proxy most methods to self.bridge
+    def __getattr__(self, name):
+        return getattr(self.bridge, name)
+
+    @contextlib.contextmanager
+    def flow_transaction(self, defer=True):
+        # every operation is already a single OpenFlow message
+        yield self
+
+    def _flow_mod(self, command, flow_dict):
+        (dp, ofp, ofpp) = self.bridge._get_dp()
+        flow_dict = dict(flow_dict)
+        table_id = flow_dict.pop('table', ofp.OFPTT_ALL)
+        priority = flow_dict.pop('priority', None)
+        actions = flow_dict.pop('actions', None)
+        cookie = flow_dict.pop('cookie', None)
+        instructions = []
+        cookie_mask = 0
+        if command in (ofp.OFPFC_ADD, ofp.OFPFC_MODIFY):
+            if cookie is None:
+                cookie = self.bridge.default_cookie
+            of_actions = build_actions(ofp, ofpp, actions)
+            if of_actions:
+                instructions = [ofpp.OFPInstructionActions(
+                    ofp.OFPIT_APPLY_ACTIONS, of_actions)]
+        elif cookie is None:
+            # like ovs-ofctl del-flows, match flows of any cookie
+            cookie = 0
+        else:
+            cookie, cookie_mask = _parse_cookie(cookie)
+        if priority is None:
+            # ovs-ofctl default priority
+            priority = 0x8000
+        msg = ofpp.OFPFlowMod(
+            dp,
+            cookie=int(cookie),
+            cookie_mask=cookie_mask,
+            table_id=table_id,
+            command=command,
+            priority=int(priority),
+            out_port=ofp.OFPP_ANY,
+            out_group=ofp.OFPG_ANY,
+            match=ofpp.OFPMatch(**build_match_kwargs(ofp, flow_dict)),
+            instructions=instructions)
+        self.bridge._send_msg(msg)
+
+    def add_flow(self, **kwargs):
+        (dp, ofp, ofpp) = self.bridge._get_dp()
+        self._flow_mod(ofp.OFPFC_ADD, kwargs)
+
+    def mod_flow(self, **kwargs):
+        (dp, ofp, ofpp) = self.bridge._get_dp()
+        self._flow_mod(ofp.OFPFC_MODIFY, kwargs)
+
+    def delete_flows(self, **kwargs):
+        (dp, ofp, ofpp) = self.bridge._get_dp()
+        # precise deletion when a priority is given, like SfcOVSBridgeExt
+        if 'priority' in kwargs:
+            self._flow_mod(ofp.OFPFC_DELETE_STRICT, kwargs)
+        else:
+            self._flow_mod(ofp.OFPFC_DELETE, kwargs)
+
+    def _group_mod(self, command, group_id, type='select', buckets='',
+                   selection_method=None, fields=None):
+        (dp, ofp, ofpp) = self.bridge._get_dp()
+        if selection_method:
+            # OpenFlow 1.3 has no group selection method, the switch picks
+            # the buckets by weight with its default hash
+            LOG.warning("Ignoring the selection method %(method)s over "
+                        "fields %(fields)s of group %(group)s, unsupported "
+                        "by the native OpenFlow interface: the flows are "
+                        "not hashed over the port pair group lb_fields",
+                        {'method': selection_method, 'fields': fields,
+                         'group': group_id})
+        if group_id == 'all':
+            group_id = ofp.OFPG_ALL
+        group_type = {'select': ofp.OFPGT_SELECT,
+                      'all': ofp.OFPGT_ALL,
+                      'indirect': ofp.OFPGT_INDIRECT,
+                      'ff': ofp.OFPGT_FF}[type]
+        msg = ofpp.OFPGroupMod(
+            dp, command, group_type, int(group_id),
+            build_buckets(ofp, ofpp, buckets))
+        self.bridge._send_msg(msg)
+
+    def add_group(self, group_id, **kwargs):
+        (dp, ofp, ofpp) = self.bridge._get_dp()
+        self._group_mod(ofp.OFPGC_ADD, group_id, **kwargs)
+
+    def mod_group(self, group_id, **kwargs):
+        (dp, ofp, ofpp) = self.bridge._get_dp()
+        self._group_mod(ofp.OFPGC_MODIFY, group_id, **kwargs)
+
+    def delete_group(self, group_id, **kwargs):
+        (dp, ofp, ofpp) = self.bridge._get_dp()
+        self._group_mod(ofp.OFPGC_DELETE, group_id)
+
+    def dump_group_ids(self):
+        (dp, ofp, ofpp) = self.bridge._get_dp()
+        msg = ofpp.OFPGroupDescStatsRequest(dp, 0)
+        replies = self.bridge._send_msg(
+            msg, reply_cls=ofpp.OFPGroupDescStatsReply, reply_multi=True)
+        return set(stats.group_id
+                   for reply in replies for stats in reply.body)
+
+    def dump_flow_cookies(self, cookie, cookie_mask, **kwargs):
+        (dp, ofp, ofpp) = self.bridge._get_dp()
+        kwargs.pop('priority', None)
+        table_id = kwargs.pop('table', ofp.OFPTT_ALL)
+        msg = ofpp.OFPFlowStatsRequest(
+            dp, table_id=table_id, cookie=cookie, cookie_mask=cookie_mask,
+            match=ofpp.OFPMatch(**build_match_kwargs(ofp, kwargs)))
+        replies = self.bridge._send_msg(
+            msg, reply_cls=ofpp.OFPFlowStatsReply, reply_multi=True)
+        return set(stats.cookie
+                   for reply in replies for stats in reply.body)
+
+    def reserve_cookie(self, cookie):
+        # see SfcOVSBridgeExt.reserve_cookie
+        if cookie in self.reserved_cookies:
+            return
+        self.bridge.clone().set_agent_uuid_stamp(cookie)
+        self.bridge.reserved_cookies
+        self.reserved_cookies.add(cookie)
+
+    def unreserve_cookie(self, cookie):
+        self.reserved_cookies.discard(cookie)
+        if hasattr(self.bridge, 'unset_cookie'):
+            self.bridge.unset_cookie(cookie)
+
+    def dump_group_for_id(self, group_id):
+        if group_id in self.dump_group_ids():
+            return 'group_id=%d' % group_id
+        return ''
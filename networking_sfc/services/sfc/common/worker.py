@@ -0,0 +1,87 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+import eventlet
+from eventlet import event
+from eventlet import queue
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class KeyedWorkerPool(object):
+    """Bounded pool of green threads running jobs in order per key.
+
+    The jobs submitted with the same key run one at a time, in the order
+    they were submitted, while the jobs of different keys run concurrently
+    on at most size green threads. The green threads are started by the
+    first submission, so that they run in the process submitting the jobs,
+    e.g. an API worker forked after the plugins were loaded. The order is
+    not kept between the pools of different processes.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._started = False
+        # key -> deque of the jobs of the key not started yet; a key is
+        # present until its last job is done
+        self._jobs = {}
+        # key -> events sent once the key has no more jobs
+        self._waiters = {}
+        self._ready_keys = queue.LightQueue()
+
+    def _start(self):
+        if self._started:
+            return
+        self._started = True
+        for i in range(self.size):
+            eventlet.spawn_n(self._work)
+
+    def submit(self, key, func, *args, **kwargs):
+        """Run func(*args, **kwargs) after the other jobs of key."""
+        self._start()
+        jobs = self._jobs.get(key)
+        if jobs is None:
+            jobs = self._jobs[key] = collections.deque()
+            self._ready_keys.put(key)
+        jobs.append((func, args, kwargs))
+
+    def pending(self, key):
+        """Return the number of jobs of key not started yet."""
+        return len(self._jobs.get(key, ()))
+
+    def wait(self, key):
+        """Wait until the jobs of key, including later ones, are done."""
+        if key not in self._jobs:
+            return
+        done = event.Event()
+        self._waiters.setdefault(key, []).append(done)
+        done.wait()
+
+    def _work(self):
+        while True:
+            key = self._ready_keys.get()
+            jobs = self._jobs[key]
+            while jobs:
+                func, args, kwargs = jobs.popleft()
+                try:
+                    func(*args, **kwargs)
+                except Exception:
+                    LOG.exception("Job %(func)s of %(key)s failed",
+                                  {'func': func, 'key': key})
+            del self._jobs[key]
+            for waiter in self._waiters.pop(key, []):
+                waiter.send()
@@ -17,6 +17,7 @@ from oslo_log import log
 from stevedore.named import NamedExtensionManager
 
 from networking_sfc.services.sfc.common import exceptions as sfc_exc
+from networking_sfc.services.sfc.common import instrumentation
 
 
 LOG = log.getLogger(__name__)
@@ -97,7 +98,10 @@ class SfcDriverManager(NamedExtensionManager):
         """
         for driver in self.ordered_drivers:
             try:
-                getattr(driver.obj, method_name)(context)
+                with instrumentation.measure(
+                    '%s.%s' % (driver.name, method_name)
+                ):
+                    getattr(driver.obj, method_name)(context)
             except Exception as e:
                 # This is an internal failure.
                 LOG.exception(e)
@@ -140,6 +144,9 @@ class SfcDriverManager(NamedExtensionManager):
     def create_port_pair_postcommit(self, context):
         self._call_drivers("create_port_pair_postcommit", context)
 
+    def create_port_pair_bulk_postcommit(self, contexts):
+        self._call_drivers("create_port_pair_bulk_postcommit", contexts)
+
     def update_port_pair_precommit(self, context):
         self._call_drivers("update_port_pair_precommit", context)
 
@@ -161,6 +168,9 @@ class SfcDriverManager(NamedExtensionManager):
     def create_port_pair_group_postcommit(self, context):
         self._call_drivers("create_port_pair_group_postcommit", context)
 
+    def create_port_pair_group_bulk_postcommit(self, contexts):
+        self._call_drivers("create_port_pair_group_bulk_postcommit", contexts)
+
     def update_port_pair_group_precommit(self, context):
         self._call_drivers("update_port_pair_group_precommit", context)
 
@@ -77,6 +77,10 @@ class SfcDriverBase(SfcDriverBaseLegacy):
     def create_port_pair_postcommit(self, context):
         self.create_port_pair(context)
 
+    def create_port_pair_bulk_postcommit(self, contexts):
+        for context in contexts:
+            self.create_port_pair_postcommit(context)
+
     @abc.abstractmethod
     def delete_port_pair(self, context):
         pass
@@ -99,6 +103,10 @@ class SfcDriverBase(SfcDriverBaseLegacy):
     def create_port_pair_group_postcommit(self, context):
         self.create_port_pair_group(context)
 
+    def create_port_pair_group_bulk_postcommit(self, contexts):
+        for context in contexts:
+            self.create_port_pair_group_postcommit(context)
+
     @abc.abstractmethod
     def delete_port_pair_group(self, context):
         pass
@@ -0,0 +1,59 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import time
+
+
+class TTLCache(object):
+    """Cache with a bounded size whose entries expire after ttl seconds.
+
+    All the entries live for the same ttl, so the entry set first is the
+    first to expire; it is the one evicted when the cache is full. A size
+    or ttl of 0 disables the cache.
+    """
+
+    def __init__(self, size, ttl, timer=time.time):
+        self.size = size
+        self.ttl = ttl
+        self._timer = timer
+        # key -> (expiry, value), in the order the entries were set
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expiry, value = entry
+        if expiry <= self._timer():
+            del self._entries[key]
+            return default
+        return value
+
+    def set(self, key, value):
+        if not self.size or not self.ttl:
+            return
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.size:
+            self._entries.popitem(last=False)
+        self._entries[key] = (self._timer() + self.ttl, value)
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
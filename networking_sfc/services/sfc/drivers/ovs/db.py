@@ -17,6 +17,7 @@ from neutron.db import common_db_mixin
 from neutron_lib import context as n_context
 from neutron_lib.db import model_base
 from neutron_lib import exceptions as n_exc
+from oslo_db import exception as db_exc
 
 import sqlalchemy as sa
 from sqlalchemy import orm
@@ -26,9 +27,21 @@ from sqlalchemy import sql
 import six
 
 from oslo_log import helpers as log_helpers
+from oslo_log import log as logging
 from oslo_utils import uuidutils
 
 from networking_sfc._i18n import _
+from networking_sfc.db import id_allocator
+from networking_sfc.services.sfc.common import instrumentation
+
+LOG = logging.getLogger(__name__)
+
+# attempts of assign_intid when other servers take the same intid
+ASSIGN_INTID_ATTEMPTS = 3
+
+# Loads the associations of many path nodes or port pair details with one
+# more query, instead of joining them to every row.
+_load_collection = getattr(orm, 'selectinload', orm.subqueryload)
 
 
 class PortPairDetailNotFound(n_exc.NotFound):
@@ -73,22 +86,28 @@ class IDAllocation(object):
 
     @log_helpers.log_method_call
     def assign_intid(self, type_, uuid):
-        query = self.session.query(UuidIntidAssoc).filter_by(
-            type_=type_).order_by(UuidIntidAssoc.intid)
-
-        allocated_int_ids = {obj.intid for obj in query.all()}
-
-        # Find the first one from the available range that
-        # is not in allocated_int_ids
-        start, end = self.conf_obj[type_][0], self.conf_obj[type_][1] + 1
-        for init_id in six.moves.range(start, end):
-            if init_id not in allocated_int_ids:
-                with self.session.begin(subtransactions=True):
+        start, end = self.conf_obj[type_][0], self.conf_obj[type_][1]
+        for attempt in range(ASSIGN_INTID_ATTEMPTS):
+            init_id = id_allocator.find_free_id(
+                self.session, UuidIntidAssoc.intid, start, end)
+            if init_id is None:
+                return None
+            try:
+                # a savepoint, so that losing the id to a concurrent
+                # allocation only rolls back this insert
+                with self.session.begin_nested():
                     uuid_intid = UuidIntidAssoc(
                         uuid, init_id, type_)
                     self.session.add(uuid_intid)
-                return init_id
-        return None
+            except db_exc.DBDuplicateEntry as e:
+                if (attempt == ASSIGN_INTID_ATTEMPTS - 1 or
+                        'uuid' in e.columns):
+                    raise
+                LOG.debug("intid %(intid)s of %(type)s was assigned "
+                          "concurrently, retrying",
+                          {'intid': init_id, 'type': type_})
+                continue
+            return init_id
 
     @log_helpers.log_method_call
     def get_intid_by_uuid(self, type_, uuid):
@@ -132,6 +151,12 @@ class PathPortAssoc(model_base.BASEV2):
                             primary_key=True)
     weight = sa.Column(sa.Integer, nullable=False, default=1)
 
+    __table_args__ = (
+        # the primary key only serves the lookups by path node
+        sa.Index('ix_sfc_path_port_associations_portpair_id', portpair_id),
+        model_base.BASEV2.__table_args__
+    )
+
 
 class PortPairDetail(model_base.BASEV2, model_base.HasId,
                      model_base.HasProject):
@@ -146,10 +171,17 @@ class PortPairDetail(model_base.BASEV2, model_base.HasId,
     local_endpoint = sa.Column(sa.String(64), nullable=False)
     path_nodes = orm.relationship(PathPortAssoc,
                                   backref='port_pair_detail',
-                                  lazy="joined",
+                                  lazy="select",
                                   cascade='all,delete')
     correlation = sa.Column(sa.String(255), nullable=True)
 
+    __table_args__ = (
+        sa.Index('ix_sfc_portpair_details_ingress_egress', ingress, egress),
+        sa.Index('ix_sfc_portpair_details_egress', egress),
+        sa.Index('ix_sfc_portpair_details_host_id_id', host_id, 'id'),
+        model_base.BASEV2.__table_args__
+    )
+
 
 class PathNode(model_base.BASEV2, model_base.HasId, model_base.HasProject):
     __tablename__ = 'sfc_path_nodes'
@@ -162,13 +194,22 @@ class PathNode(model_base.BASEV2, model_base.HasId, model_base.HasProject):
     status = sa.Column(sa.String(32))
     portpair_details = orm.relationship(PathPortAssoc,
                                         backref='path_nodes',
-                                        lazy="joined",
+                                        lazy="select",
                                         cascade='all,delete')
     next_group_id = sa.Column(sa.Integer)
     next_hop = sa.Column(sa.String(512))
     fwd_path = sa.Column(sa.Boolean(),
                          nullable=False)
 
+    __table_args__ = (
+        sa.Index('ix_sfc_path_nodes_portchain_id_nsi_fwd_path',
+                 portchain_id, nsi, fwd_path),
+        sa.Index('ix_sfc_path_nodes_nsp_nsi', nsp, nsi),
+        sa.Index('ix_sfc_path_nodes_next_group_id_fwd_path',
+                 next_group_id, fwd_path),
+        model_base.BASEV2.__table_args__
+    )
+
 
 class OVSSfcDriverDB(common_db_mixin.CommonDbMixin):
     def initialize(self):
@@ -219,16 +260,42 @@ class OVSSfcDriverDB(common_db_mixin.CommonDbMixin):
 
         return self._fields(res, fields)
 
+    @staticmethod
+    def _make_dict(item, make_dict, fields):
+        if isinstance(item, model_base.BASEV2):
+            return make_dict(item, fields)
+        # a column projection only has the fields
+        return item._asdict()
+
+    def _query(self, model, collection, fields=None):
+        """Query the rows of model, with their collection.
+
+        When fields are given without the collection, only their columns
+        are queried and the collection is not loaded at all.
+        """
+        session = self.admin_context.session
+        if fields and collection.key not in fields:
+            return session.query(*[getattr(model, field)
+                                   for field in fields])
+        return session.query(model).options(_load_collection(collection))
+
+    def _get_by_id_with(self, model, collection, id):
+        # a single row is loaded along with its collection in one query
+        return self._model_query(self.admin_context, model).options(
+            orm.joinedload(collection)).filter(model.id == id).one()
+
     def _get_path_node(self, id):
         try:
-            node = self._get_by_id(self.admin_context, PathNode, id)
+            node = self._get_by_id_with(
+                PathNode, PathNode.portpair_details, id)
         except exc.NoResultFound:
             raise NodeNotFound(node_id=id)
         return node
 
     def _get_port_pair_detail(self, id):
         try:
-            port = self._get_by_id(self.admin_context, PortPairDetail, id)
+            port = self._get_by_id_with(
+                PortPairDetail, PortPairDetail.path_nodes, id)
         except exc.NoResultFound:
             raise PortPairDetailNotFound(port_id=id)
         return port
@@ -249,6 +316,41 @@ class OVSSfcDriverDB(common_db_mixin.CommonDbMixin):
             self.admin_context.session.add(node_obj)
             return self._make_pathnode_dict(node_obj)
 
+    @instrumentation.instrumented
+    def create_path_nodes(self, nodes):
+        """Bulk create path nodes along with their port pair details.
+
+        The path nodes and their associations are written with one INSERT
+        per table, in a single transaction.
+
+        @param: nodes: list of (node, members) tuples, members being the
+                dicts of the portpair_id and weight of the port pair
+                details associated with the node
+        @return: list of path node dicts, in the order of nodes
+        """
+        node_columns = [column.name for column in PathNode.__table__.columns]
+        node_rows, assoc_rows, results = [], [], []
+        for node, members in nodes:
+            row = dict((column, node.get(column)) for column in node_columns)
+            row['id'] = uuidutils.generate_uuid()
+            node_rows.append(row)
+            assoc_rows.extend(
+                {'pathnode_id': row['id'],
+                 'portpair_id': member['portpair_id'],
+                 'weight': member['weight']}
+                for member in members)
+            result = self._make_pathnode_dict(PathNode(**row))
+            result['portpair_details'] = [member['portpair_id']
+                                          for member in members]
+            results.append(result)
+        session = self.admin_context.session
+        with session.begin(subtransactions=True):
+            if node_rows:
+                session.execute(PathNode.__table__.insert(), node_rows)
+            if assoc_rows:
+                session.execute(PathPortAssoc.__table__.insert(), assoc_rows)
+        return results
+
     def create_pathport_assoc(self, assoc):
         with self.admin_context.session.begin(subtransactions=True):
             args = self._filter_non_model_columns(assoc, PathPortAssoc)
@@ -325,6 +427,30 @@ class OVSSfcDriverDB(common_db_mixin.CommonDbMixin):
             node_obj = self._get_path_node(id)
             self.admin_context.session.delete(node_obj)
 
+    def _delete_path_nodes_by(self, criterion):
+        session = self.admin_context.session
+        with session.begin(subtransactions=True):
+            node_ids = session.query(PathNode.id).filter(criterion)
+            session.query(PathPortAssoc).filter(
+                PathPortAssoc.pathnode_id.in_(node_ids.subquery())
+            ).delete(synchronize_session=False)
+            session.query(PathNode).filter(criterion).delete(
+                synchronize_session=False)
+
+    @instrumentation.instrumented
+    def delete_path_nodes(self, ids):
+        """Bulk delete path nodes and their associations."""
+        if ids:
+            self._delete_path_nodes_by(PathNode.id.in_(ids))
+
+    @instrumentation.instrumented
+    def delete_path(self, portchain_id):
+        """Delete all the path nodes of a port chain and their associations.
+
+        @param: portchain_id: the id of the port chain
+        """
+        self._delete_path_nodes_by(PathNode.portchain_id == portchain_id)
+
     def get_port_detail(self, id):
         with self.admin_context.session.begin(subtransactions=True):
             port_obj = self._get_port_pair_detail(id)
@@ -333,8 +459,8 @@ class OVSSfcDriverDB(common_db_mixin.CommonDbMixin):
     def get_port_detail_without_exception(self, id):
         with self.admin_context.session.begin(subtransactions=True):
             try:
-                port = self._get_by_id(
-                    self.admin_context, PortPairDetail, id)
+                port = self._get_by_id_with(
+                    PortPairDetail, PortPairDetail.path_nodes, id)
             except exc.NoResultFound:
                 return None
             return self._make_port_detail_dict(port)
@@ -344,24 +470,67 @@ class OVSSfcDriverDB(common_db_mixin.CommonDbMixin):
             node_obj = self._get_path_node(id)
         return self._make_pathnode_dict(node_obj)
 
-    def get_path_nodes_by_filter(self, filters=None):
+    @instrumentation.instrumented
+    def get_path_nodes_by_ids(self, ids, chunk_size):
+        """Bulk fetch path nodes, chunk_size ids per query.
+
+        @return: dict of path node dicts keyed by id
+        @raise NodeNotFound: when a path node does not exist
+        """
+        nodes = {}
+        ids = list(ids)
         with self.admin_context.session.begin(subtransactions=True):
-            qry = self._get_path_nodes_by_filter(filters)
+            for i in six.moves.range(0, len(ids), chunk_size):
+                qry = self._query(
+                    PathNode, PathNode.portpair_details
+                ).filter(PathNode.id.in_(ids[i:i + chunk_size]))
+                for item in qry:
+                    nodes[item['id']] = self._make_pathnode_dict(item)
+        for id in ids:
+            if id not in nodes:
+                raise NodeNotFound(node_id=id)
+        return nodes
+
+    @instrumentation.instrumented
+    def update_path_nodes_status(self, context, statuses, chunk_size):
+        """Bulk update the status of path nodes.
+
+        @param: statuses: dict of status by path node id
+        @param: chunk_size: maximum number of path nodes per UPDATE
+        """
+        ids_by_status = {}
+        for id, status in statuses.items():
+            ids_by_status.setdefault(status, []).append(id)
+        with context.session.begin(subtransactions=True):
+            for status, ids in ids_by_status.items():
+                for i in six.moves.range(0, len(ids), chunk_size):
+                    context.session.query(PathNode).filter(
+                        PathNode.id.in_(ids[i:i + chunk_size])
+                    ).update({'status': status}, synchronize_session=False)
+
+    @instrumentation.instrumented
+    def get_path_nodes_by_filter(self, filters=None, fields=None):
+        with self.admin_context.session.begin(subtransactions=True):
+            qry = self._get_path_nodes_by_filter(filters, fields)
             all_items = qry.all()
             if all_items:
-                return [self._make_pathnode_dict(item) for item in all_items]
+                return [
+                    self._make_dict(item, self._make_pathnode_dict, fields)
+                    for item in all_items
+                ]
         return None
 
-    def get_path_node_by_filter(self, filters=None):
+    def get_path_node_by_filter(self, filters=None, fields=None):
         with self.admin_context.session.begin(subtransactions=True):
-            qry = self._get_path_nodes_by_filter(filters)
+            qry = self._get_path_nodes_by_filter(filters, fields)
             first = qry.first()
             if first:
-                return self._make_pathnode_dict(first)
+                return self._make_dict(first, self._make_pathnode_dict,
+                                       fields)
         return None
 
-    def _get_path_nodes_by_filter(self, filters=None):
-        qry = self.admin_context.session.query(PathNode)
+    def _get_path_nodes_by_filter(self, filters=None, fields=None):
+        qry = self._query(PathNode, PathNode.portpair_details, fields)
         if filters:
             for key, value in filters.items():
                 column = getattr(PathNode, key, None)
@@ -372,25 +541,108 @@ class OVSSfcDriverDB(common_db_mixin.CommonDbMixin):
                         qry = qry.filter(column == value)
         return qry
 
-    def get_port_details_by_filter(self, filters=None):
+    @instrumentation.instrumented
+    def get_port_details_by_filter(self, filters=None, fields=None):
         with self.admin_context.session.begin(subtransactions=True):
-            qry = self._get_port_details_by_filter(filters)
+            qry = self._get_port_details_by_filter(filters, fields)
             all_items = qry.all()
             if all_items:
-                return [self._make_port_detail_dict(item)
-                        for item in all_items]
+                return [
+                    self._make_dict(item, self._make_port_detail_dict, fields)
+                    for item in all_items
+                ]
         return None
 
-    def get_port_detail_by_filter(self, filters=None):
+    def get_port_detail_by_filter(self, filters=None, fields=None):
         with self.admin_context.session.begin(subtransactions=True):
-            qry = self._get_port_details_by_filter(filters)
+            qry = self._get_port_details_by_filter(filters, fields)
             first = qry.first()
             if first:
-                return self._make_port_detail_dict(first)
+                return self._make_dict(first, self._make_port_detail_dict,
+                                       fields)
         return None
 
-    def _get_port_details_by_filter(self, filters=None):
-        qry = self.admin_context.session.query(PortPairDetail)
+    @instrumentation.instrumented
+    def get_port_details_by_host(self, host, marker=None, limit=None):
+        """Get the port details of a host, ordered by id.
+
+        @param: marker: only return the port details after this id
+        @param: limit: maximum number of port details to return
+        @return: list of port detail dicts
+        """
+        if not host:
+            return []
+        with self.admin_context.session.begin(subtransactions=True):
+            qry = self._query(
+                PortPairDetail, PortPairDetail.path_nodes
+            ).filter(PortPairDetail.host_id == host)
+            if marker:
+                qry = qry.filter(PortPairDetail.id > marker)
+            qry = qry.order_by(PortPairDetail.id)
+            if limit:
+                qry = qry.limit(limit)
+            return [self._make_port_detail_dict(item) for item in qry]
+
+    @instrumentation.instrumented
+    def get_port_details_by_port_pairs(self, port_pairs):
+        """Bulk fetch the port details of a set of port pairs.
+
+        @param: port_pairs: iterable of (ingress, egress) tuples
+        @return: dict of port detail dicts keyed by (ingress, egress)
+        """
+        port_details = {}
+        port_pairs = set(port_pairs)
+        ingress_ids = set(ingress for ingress, egress in port_pairs)
+        if not ingress_ids:
+            return port_details
+        with self.admin_context.session.begin(subtransactions=True):
+            qry = self._query(
+                PortPairDetail, PortPairDetail.path_nodes
+            ).filter(PortPairDetail.ingress.in_(ingress_ids))
+            for item in qry:
+                key = (item['ingress'], item['egress'])
+                if key in port_pairs and key not in port_details:
+                    port_details[key] = self._make_port_detail_dict(item)
+        return port_details
+
+    @instrumentation.instrumented
+    def get_group_reference_count(self, next_group_id, fwd_path, host):
+        """Count the path nodes on host that forward to a port pair group.
+
+        These are the src nodes of fwd_path without port pair details, and
+        the forward path nodes associated with a port pair detail on host,
+        whose next group is next_group_id. Both are counted with a single
+        aggregate query.
+        """
+        session = self.admin_context.session
+        src_nodes = session.query(
+            sa.func.count(PathNode.id)
+        ).filter(
+            PathNode.next_group_id == next_group_id,
+            PathNode.nsi == 0xff,
+            PathNode.fwd_path == fwd_path,
+            ~sa.exists().where(PathPortAssoc.pathnode_id == PathNode.id)
+        )
+        host_nodes = session.query(
+            sa.func.count(PathPortAssoc.pathnode_id)
+        ).join(
+            PathNode, PathNode.id == PathPortAssoc.pathnode_id
+        ).join(
+            PortPairDetail, PortPairDetail.id == PathPortAssoc.portpair_id
+        ).filter(
+            PathNode.next_group_id == next_group_id,
+            PathNode.fwd_path == sql.true(),
+            PortPairDetail.host_id == host
+        )
+        if not host:
+            host_nodes = host_nodes.filter(sql.false())
+        with session.begin(subtransactions=True):
+            src_count, host_count = session.query(
+                src_nodes.as_scalar(), host_nodes.as_scalar()).one()
+        return (src_count or 0) + (host_count or 0)
+
+    def _get_port_details_by_filter(self, filters=None, fields=None):
+        qry = self._query(PortPairDetail, PortPairDetail.path_nodes, fields)
         if filters:
             for key, value in filters.items():
                 column = getattr(PortPairDetail, key, None)
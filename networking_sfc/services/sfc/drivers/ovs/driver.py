@@ -13,44 +13,197 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+
 import neutron.common.constants as nc_const
 import neutron.common.rpc as n_rpc
+from neutron.common import topics
 import neutron.db.api as db_api
 from neutron.db import models_v2
 import neutron.plugins.common.constants as np_const
 import neutron.plugins.ml2.drivers.l2pop.db as l2pop_db
 import neutron.plugins.ml2.drivers.l2pop.rpc as l2pop_rpc
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import registry
+from neutron_lib.callbacks import resources
 from neutron_lib import constants as const
 from neutron_lib import context as n_context
 from neutron_lib.plugins import directory
+from oslo_config import cfg
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
+import six
 
 from networking_sfc.extensions import flowclassifier
 from networking_sfc.extensions import sfc
 from networking_sfc.services.sfc.common import exceptions as exc
+from networking_sfc.services.sfc.common import instrumentation
 from networking_sfc.services.sfc.drivers import base as driver_base
+from networking_sfc.services.sfc.drivers.ovs import cache as ovs_sfc_cache
 from networking_sfc.services.sfc.drivers.ovs import constants as ovs_const
 from networking_sfc.services.sfc.drivers.ovs import db as ovs_sfc_db
 from networking_sfc.services.sfc.drivers.ovs import rpc as ovs_sfc_rpc
 from networking_sfc.services.sfc.drivers.ovs import rpc_topics as sfc_topics
+from networking_sfc.services.sfc.drivers.ovs import status as ovs_sfc_status
 
 LOG = logging.getLogger(__name__)
 
+cfg.CONF.import_opt('flowrules_bulk_size',
+                    'networking_sfc.services.sfc.common.config', group='sfc')
+cfg.CONF.import_opt('flowrule_status_interval',
+                    'networking_sfc.services.sfc.common.config', group='sfc')
+cfg.CONF.import_opt('port_detail_cache_size',
+                    'networking_sfc.services.sfc.common.config', group='sfc')
+cfg.CONF.import_opt('port_detail_cache_ttl',
+                    'networking_sfc.services.sfc.common.config', group='sfc')
+
+
+def batch_flow_rules(f):
+    """Send the flow rules computed by a driver operation per agent host.
+
+    Flow rules notified while the decorated method runs are collected and
+    sent once it returns, with a single message for each agent host. They
+    are not sent if it raises.
+    Nested decorated calls share the batch of the outermost one.
+    """
+    @six.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self._flowrule_local, 'batch', None) is not None:
+            return f(self, *args, **kwargs)
+        batch = ovs_sfc_rpc.FlowRuleBatch()
+        self._flowrule_local.batch = batch
+        try:
+            result = f(self, *args, **kwargs)
+        finally:
+            self._flowrule_local.batch = None
+        # the plugin undoes or flags a failed operation, the agents do not
+        # get its partial flow rules
+        self._send_flow_rule_batch(batch)
+        return result
+
+    return wrapper
+
+
+def _operation_cache(*names):
+    def decorator(f):
+        @six.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            if getattr(self._fc_local, 'cache', None) is not None:
+                return f(self, *args, **kwargs)
+            self._fc_local.cache = dict((name, {}) for name in names)
+            try:
+                return f(self, *args, **kwargs)
+            finally:
+                self._fc_local.cache = None
+
+        return wrapper
+
+    return decorator
+
+
+# Look up each flow classifier and logical port once per operation.
+# Flow classifiers and their logical ports fetched while the decorated
+# method runs are cached and reused by every path node and port, as are
+# the load balancing fields of the port pair groups, then dropped when it
+# returns. Nested decorated calls share the cache of the
+# outermost one.
+cache_flow_classifiers = _operation_cache(
+    'flow_classifiers', 'ports', 'lb_fields')
+
+# Operations which only read the path nodes can also reuse the next hops
+# and the group reference counts across the flow rules they build.
+cache_flow_rules = _operation_cache(
+    'flow_classifiers', 'ports', 'next_hops', 'group_refcnts', 'lb_fields')
+
+
+def _get_port_pair_weight(port_pair):
+    # port_pair is a PortPair model, whose parameters are JSON encoded
+    param = port_pair['service_function_parameters'].get('weight')
+    if param is None:
+        return 1
+    return jsonutils.loads(param['value'])
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
 
 class OVSSfcDriver(driver_base.SfcDriverBase,
                    ovs_sfc_db.OVSSfcDriverDB):
     """Sfc Driver Base Class."""
 
+    # flow rule batch of the operation running in the current thread
+    _flowrule_local = threading.local()
+    # flow classifier cache of the operation running in the current thread
+    _fc_local = threading.local()
+
     def initialize(self):
         super(OVSSfcDriver, self).initialize()
         self.ovs_driver_rpc = ovs_sfc_rpc.SfcAgentRpcClient(
             sfc_topics.SFC_AGENT
         )
         self.rpc_ctx = n_context.get_admin_context_without_session()
+        self._status_writer = ovs_sfc_status.FlowRuleStatusWriter(
+            self._write_flowrule_status,
+            cfg.CONF.sfc.flowrule_status_interval)
+        self._setup_port_detail_cache()
         self._setup_rpc()
 
+    def _setup_port_detail_cache(self):
+        # host -> tunnel endpoint IP, network id -> (type, segment id)
+        self._endpoint_cache = ovs_sfc_cache.TTLCache(
+            cfg.CONF.sfc.port_detail_cache_size,
+            cfg.CONF.sfc.port_detail_cache_ttl)
+        self._network_cache = ovs_sfc_cache.TTLCache(
+            cfg.CONF.sfc.port_detail_cache_size,
+            cfg.CONF.sfc.port_detail_cache_ttl)
+        for event in (events.AFTER_UPDATE, events.AFTER_DELETE):
+            registry.subscribe(self._invalidate_network_cache,
+                               resources.NETWORK, event)
+        for event in (events.AFTER_CREATE, events.AFTER_UPDATE,
+                      events.AFTER_DELETE):
+            registry.subscribe(self._invalidate_network_cache,
+                               resources.SEGMENT, event)
+        # the agent state reports are processed by the RPC workers, which
+        # do not share the cache of the API workers, so the cached host
+        # endpoints are only refreshed when they expire
+
+    def _invalidate_network_cache(self, resource, event, trigger, **kwargs):
+        if resource == resources.SEGMENT:
+            network_id = (kwargs.get('segment') or {}).get('network_id')
+        else:
+            network_id = (kwargs.get('network') or {}).get('id')
+        if network_id:
+            self._network_cache.pop(network_id)
+        else:
+            self._network_cache.clear()
+
+    def _get_network_segmentation(self, core_plugin, network_id):
+        """Get the (network_type, segment_id) of a network, cached."""
+        segmentation = self._network_cache.get(network_id)
+        if segmentation is None:
+            network_info = core_plugin.get_network(
+                self.admin_context, network_id)
+            segmentation = (network_info['provider:network_type'],
+                            network_info['provider:segmentation_id'])
+            self._network_cache.set(network_id, segmentation)
+        return segmentation
+
+    def _get_host_endpoint(self, core_plugin, network_type, host_id):
+        """Get the tunnel endpoint IP of a host, cached when known."""
+        local_ip = self._endpoint_cache.get(host_id)
+        if local_ip is None:
+            driver = core_plugin.type_manager.drivers.get(network_type)
+            host_endpoint = driver.obj.get_endpoint_by_host(host_id)
+            if host_endpoint:
+                local_ip = host_endpoint['ip_address']
+            if local_ip:
+                self._endpoint_cache.set(host_id, local_ip)
+        return local_ip
+
     def _setup_rpc(self):
         # Setup a rpc server
         self.topic = sfc_topics.SFC_PLUGIN
@@ -162,7 +315,8 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                 if not pre_node:
                     continue
                 for each in pre_node['portpair_details']:
-                    pre_port = self.get_port_detail_by_filter(dict(id=each))
+                    pre_port = self.get_port_detail_by_filter(
+                        dict(id=each), fields=['host_id'])
                     if host == pre_port['host_id']:
                         agent_active_ports += 1
 
@@ -193,18 +347,6 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
     def _delete_agent_fdb_entries(self, flow_rule):
         self._call_on_l2pop_driver(flow_rule, "remove_fdb_entries")
 
-    def _get_subnet_by_port(self, id):
-        core_plugin = directory.get_plugin()
-        port = core_plugin.get_port(self.admin_context, id)
-        subnet = None
-        for ip in port['fixed_ips']:
-            subnet = core_plugin.get_subnet(self.admin_context,
-                                            ip["subnet_id"])
-            # currently only support one subnet for a port
-            break
-
-        return subnet
-
     @log_helpers.log_method_call
     def _get_portgroup_members(self, context, pg_id, fwd_path):
         next_group_members = []
@@ -221,10 +363,12 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                 filters.update({'ingress': pp['ingress']})
             if pp.get('egress', None):
                 filters.update({'egress': pp['egress']})
-            pd = self.get_port_detail_by_filter(filters)
+            pd = self.get_port_detail_by_filter(filters, fields=['id'])
             if pd:
-                next_group_members.append(
-                    dict(portpair_id=pd['id'], weight=1))
+                next_group_members.append(dict(
+                    portpair_id=pd['id'],
+                    weight=pp['service_function_parameters'].get(
+                        'weight', 1)))
         if fwd_path is False:
             next_group_members.reverse()
         return group_intid, next_group_members
@@ -296,7 +440,8 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                         egress=fc['logical_source_port'],
                         project_id=project_id
                     )
-                pds = self.get_port_details_by_filter(src_pd_filter)
+                pds = self.get_port_details_by_filter(src_pd_filter,
+                                                      fields=['id'])
                 if pds:
                     for pd in pds:
                         # update src_node portpair_details refence info
@@ -312,86 +457,127 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                             # if len(pd['path_nodes']) == 1:
                             self.delete_port_pair_detail(pd['id'])
 
-    @log_helpers.log_method_call
-    def _create_portchain_path(self, context, port_chain, fwd_path):
-        path_nodes = []
-        # Create an assoc object for chain_id and path_id
-        # context = context._plugin_context
-        path_id = port_chain['chain_id']
+    def _load_portchain_path_snapshot(self, context, port_chain):
+        """Load everything needed to build the paths of a port chain.
 
-        if not path_id:
-            LOG.error('No path_id available for creating port chain path')
-            return
+        The port pair groups, their port pairs, the port pair details and
+        the subnets of all involved ports are fetched with a constant number
+        of set-based queries, whatever the chain length and group width.
+        """
+        pg_ids = port_chain['port_pair_groups']
+        ppg_objs = context._plugin._get_port_pair_groups_by_ids(
+            context._plugin_context, pg_ids)
+        groups = {}
+        port_pairs = []
+        for pg_id, ppg_obj in ppg_objs.items():
+            pps = [(pp['ingress'], pp['egress'])
+                   for pp in ppg_obj['port_pairs']]
+            weights = dict(
+                ((pp['ingress'], pp['egress']), _get_port_pair_weight(pp))
+                for pp in ppg_obj['port_pairs'])
+            groups[pg_id] = {'group_id': ppg_obj['group_id'],
+                             'port_pairs': pps,
+                             'weights': weights}
+            port_pairs.extend(pps)
+
+        fcs = self._get_fcs_by_ids(port_chain['flow_classifiers'])
+        port_ids = set(fc['logical_source_port'] for fc in fcs)
+        for ingress, egress in port_pairs:
+            port_ids.update([ingress, egress])
+        port_ids.discard(None)
+
+        return {
+            'groups': groups,
+            'flow_classifiers': fcs,
+            'port_details': self.get_port_details_by_port_pairs(port_pairs),
+            'cidrs': self._get_subnet_cidrs_by_ports(port_ids)
+        }
+
+    def _get_subnet_cidrs_by_ports(self, port_ids):
+        cidrs = {}
+        if not port_ids:
+            return cidrs
+        session = self.admin_context.session
+        with session.begin(subtransactions=True):
+            qry = session.query(
+                models_v2.IPAllocation.port_id, models_v2.Subnet.cidr
+            ).join(
+                models_v2.Subnet,
+                models_v2.Subnet.id == models_v2.IPAllocation.subnet_id
+            ).filter(models_v2.IPAllocation.port_id.in_(port_ids))
+            for port_id, cidr in qry:
+                # currently only support one subnet for a port
+                cidrs.setdefault(port_id, cidr)
+        return cidrs
+
+    def _get_portgroup_members_from_snapshot(self, snapshot, pg_id, fwd_path):
+        group = snapshot['groups'][pg_id]
+        next_group_members = []
+        for pp in group['port_pairs']:
+            pd = snapshot['port_details'].get(pp)
+            if pd:
+                next_group_members.append(
+                    dict(portpair_id=pd['id'], weight=group['weights'][pp]))
+        if fwd_path is False:
+            next_group_members.reverse()
+        return group['group_id'], next_group_members
 
+    def _check_portchain_cross_subnet(self, port_chain, snapshot):
+        groups = snapshot['groups']
+        cidrs = snapshot['cidrs']
         port_pair_groups = port_chain['port_pair_groups']
-        sf_path_length = len(port_pair_groups)
 
-        # Detect cross-subnet transit
         # Compare subnets for logical source ports
         # and first PPG ingress ports
-        for fc in self._get_fcs_by_ids(port_chain['flow_classifiers']):
-            subnet1 = self._get_subnet_by_port(fc['logical_source_port'])
-            cidr1 = subnet1['cidr']
-            ppg = context._plugin.get_port_pair_group(context._plugin_context,
-                                                      port_pair_groups[0])
-            for pp_id1 in ppg['port_pairs']:
-                pp1 = context._plugin.get_port_pair(context._plugin_context,
-                                                    pp_id1)
-                filter1 = {}
-                if pp1.get('ingress', None):
-                    filter1 = dict(dict(ingress=pp1['ingress']), **filter1)
-                    pd1 = self.get_port_detail_by_filter(filter1)
-                    subnet2 = self._get_subnet_by_port(pd1['ingress'])
-                    cidr2 = subnet2['cidr']
-                    if cidr1 != cidr2:
-                        LOG.error('Cross-subnet chain not supported')
-                        raise exc.SfcDriverError(
-                            method='create_portchain_path')
+        first_ingress_cidrs = set(
+            cidrs.get(ingress)
+            for ingress, egress in groups[port_pair_groups[0]]['port_pairs'])
+        for fc in snapshot['flow_classifiers']:
+            cidr1 = cidrs.get(fc['logical_source_port'])
+            if first_ingress_cidrs - set([cidr1]):
+                LOG.error('Cross-subnet chain not supported')
+                raise exc.SfcDriverError(method='create_portchain_path')
 
         # Compare subnets for PPG egress ports
         # and next PPG ingress ports
-        for i in range(sf_path_length - 1):
-            ppg = context._plugin.get_port_pair_group(context._plugin_context,
-                                                      port_pair_groups[i])
-            next_ppg = context._plugin.get_port_pair_group(
-                context._plugin_context, port_pair_groups[i + 1])
-            for pp_id1 in ppg['port_pairs']:
-                pp1 = context._plugin.get_port_pair(context._plugin_context,
-                                                    pp_id1)
-                filter1 = {}
-                cidr3 = None
-                if pp1.get('egress', None):
-                    filter1 = dict(dict(egress=pp1['egress']), **filter1)
-                    pd1 = self.get_port_detail_by_filter(filter1)
-                    subnet1 = self._get_subnet_by_port(pd1['egress'])
-                    cidr3 = subnet1['cidr']
-
-                for pp_id2 in next_ppg['port_pairs']:
-                    pp2 = context._plugin.get_port_pair(
-                        context._plugin_context, pp_id2)
-                    filter2 = {}
-                    if pp2.get('ingress', None):
-                        filter2 = dict(dict(ingress=pp2['ingress']), **filter2)
-                        pd2 = self.get_port_detail_by_filter(filter2)
-                        subnet2 = self._get_subnet_by_port(pd2['ingress'])
-                        cidr4 = subnet2['cidr']
-                        if cidr3 != cidr4:
-                            LOG.error('Cross-subnet chain not supported')
-                            raise exc.SfcDriverError(
-                                method='create_portchain_path')
+        for pg_id, next_pg_id in zip(port_pair_groups,
+                                     port_pair_groups[1:]):
+            egress_cidrs = set(
+                cidrs.get(egress)
+                for ingress, egress in groups[pg_id]['port_pairs'])
+            ingress_cidrs = set(
+                cidrs.get(ingress)
+                for ingress, egress in groups[next_pg_id]['port_pairs'])
+            if not egress_cidrs or not ingress_cidrs:
+                continue
+            if len(egress_cidrs | ingress_cidrs) > 1:
+                LOG.error('Cross-subnet chain not supported')
+                raise exc.SfcDriverError(method='create_portchain_path')
+
+    def _build_portchain_path(self, port_chain, fwd_path, snapshot):
+        """Build the path nodes of one direction of a port chain.
+
+        @return: list of (node_args, members) tuples, members being the
+                 port pair details attached to a SF node
+        """
+        path_nodes = []
+        path_id = port_chain['chain_id']
+        port_pair_groups = port_chain['port_pair_groups']
+        sf_path_length = len(port_pair_groups)
 
         next_group_intid = None
         next_group_members = None
         # get the init and last port_pair_group
         if fwd_path:
-            next_group_intid, next_group_members = self._get_portgroup_members(
-                context, port_chain['port_pair_groups'][0], fwd_path)
+            next_group_intid, next_group_members = (
+                self._get_portgroup_members_from_snapshot(
+                    snapshot, port_pair_groups[0], fwd_path))
 
         else:
-            next_group_intid, next_group_members = self._get_portgroup_members(
-                context,
-                port_chain['port_pair_groups'][sf_path_length - 1],
-                fwd_path)
+            next_group_intid, next_group_members = (
+                self._get_portgroup_members_from_snapshot(
+                    snapshot, port_pair_groups[sf_path_length - 1],
+                    fwd_path))
 
         # Create a head node object for port chain
         src_args = {'project_id': port_chain['project_id'],
@@ -404,9 +590,7 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                     'next_hop': jsonutils.dumps(next_group_members),
                     'fwd_path': fwd_path
                     }
-        src_node = self.create_path_node(src_args)
-        LOG.debug('create src node: %s', src_node)
-        path_nodes.append(src_node)
+        path_nodes.append((src_args, []))
 
         # Create a destination node object for port chain
         dst_args = {
@@ -420,16 +604,7 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
             'next_hop': None,
             'fwd_path': fwd_path
         }
-        dst_node = self.create_path_node(dst_args)
-        LOG.debug('create dst node: %s', dst_node)
-        path_nodes.append(dst_node)
-
-        # need to pass project_id here
-        self._add_flowclassifier_port_assoc(
-            port_chain['flow_classifiers'],
-            port_chain['project_id'],
-            src_node
-        )
+        path_nodes.append((dst_args, []))
 
         for i in range(sf_path_length):
             cur_group_members = next_group_members
@@ -437,13 +612,13 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
             if i < sf_path_length - 1:
                 if fwd_path:
                     next_group_intid, next_group_members = (
-                        self._get_portgroup_members(
-                            context, port_pair_groups[i + 1], fwd_path)
+                        self._get_portgroup_members_from_snapshot(
+                            snapshot, port_pair_groups[i + 1], fwd_path)
                     )
                 elif fwd_path is False:
                     next_group_intid, next_group_members = (
-                        self._get_portgroup_members(
-                            context,
+                        self._get_portgroup_members_from_snapshot(
+                            snapshot,
                             port_pair_groups[sf_path_length - 2 - i],
                             fwd_path)
                     )
@@ -466,22 +641,46 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                 ),
                 'fwd_path': fwd_path,
             }
-            sf_node = self.create_path_node(node_args)
-            LOG.debug('chain path node: %s', sf_node)
-            # Create the assocation objects that combine the pathnode_id with
-            # the ingress of the port_pairs in the current group
-            # when port_group does not reach tail
-            for member in cur_group_members:
-                assco_args = {'portpair_id': member['portpair_id'],
-                              'pathnode_id': sf_node['id'],
-                              'weight': member['weight'], }
-                sfna = self.create_pathport_assoc(assco_args)
-                LOG.debug('create assoc port with node: %s', sfna)
-                sf_node['portpair_details'].append(member['portpair_id'])
-            path_nodes.append(sf_node)
+            path_nodes.append((node_args, cur_group_members))
 
         return path_nodes
 
+    def _create_path_nodes(self, port_chain, nodes):
+        # the path nodes and the assocation objects that combine them with
+        # the port pairs of their group are written in bulk
+        path_nodes = self.create_path_nodes(nodes)
+        for node in path_nodes:
+            LOG.debug('create %s node: %s', node['node_type'], node)
+            if node['node_type'] == ovs_const.SRC_NODE:
+                # need to pass project_id here
+                self._add_flowclassifier_port_assoc(
+                    port_chain['flow_classifiers'],
+                    port_chain['project_id'],
+                    node
+                )
+        return path_nodes
+
+    @log_helpers.log_method_call
+    def _create_portchain_path(self, context, port_chain, fwd_paths,
+                               snapshot=None):
+        # Create an assoc object for chain_id and path_id
+        # context = context._plugin_context
+        if not port_chain['chain_id']:
+            LOG.error('No path_id available for creating port chain path')
+            return []
+
+        if snapshot is None:
+            snapshot = self._load_portchain_path_snapshot(context, port_chain)
+
+        # Detect cross-subnet transit
+        self._check_portchain_cross_subnet(port_chain, snapshot)
+
+        nodes = []
+        for fwd_path in fwd_paths:
+            nodes.extend(
+                self._build_portchain_path(port_chain, fwd_path, snapshot))
+        return self._create_path_nodes(port_chain, nodes)
+
     def _delete_path_node_port_flowrule(self, node, port, pc_corr, fc_ids):
         # if this port is not binding, don't to generate flow rule
         if not port['host_id']:
@@ -490,8 +689,7 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                                                         port,
                                                         pc_corr,
                                                         del_fc_ids=fc_ids)
-        self.ovs_driver_rpc.ask_agent_to_delete_flow_rules(self.admin_context,
-                                                           flow_rule)
+        self._notify_flow_rule(topics.DELETE, flow_rule)
         self._delete_agent_fdb_entries(flow_rule)
 
     def _delete_path_node_flowrule(self, node, pc_corr, fc_ids):
@@ -507,19 +705,23 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
     def _delete_portchain_path(self, port_chain):
         pds = self.get_path_nodes_by_filter(
             dict(portchain_id=port_chain['id']))
+        self._delete_path_nodes(pds or [], port_chain, whole_path=True)
+
+    def _delete_path_nodes(self, path_nodes, port_chain, whole_path=False):
         src_nodes = []
-        if pds:
-            for pd in pds:
-                if pd['node_type'] == ovs_const.SRC_NODE:
-                    src_nodes.append(pd)
-                pc_corr = port_chain['chain_parameters']['correlation']
-                self._delete_path_node_flowrule(
-                    pd,
-                    pc_corr,
-                    port_chain['flow_classifiers']
-                )
-            for pd in pds:
-                self.delete_path_node(pd['id'])
+        pc_corr = port_chain['chain_parameters']['correlation']
+        for pd in path_nodes:
+            if pd['node_type'] == ovs_const.SRC_NODE:
+                src_nodes.append(pd)
+            self._delete_path_node_flowrule(
+                pd,
+                pc_corr,
+                port_chain['flow_classifiers']
+            )
+        if whole_path:
+            self.delete_path(port_chain['id'])
+        else:
+            self.delete_path_nodes([pd['id'] for pd in path_nodes])
 
         # delete the ports on the traffic classifier
         self._remove_flowclassifier_port_assoc(
@@ -532,6 +734,14 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
         node_next_hops = []
         if not flow_rule['next_hop']:
             return None
+        cached_next_hops = self._get_fc_cache('next_hops')
+        if flow_rule['next_hop'] in cached_next_hops:
+            node_next_hops = [
+                dict(detail)
+                for detail in cached_next_hops[flow_rule['next_hop']]]
+            flow_rule['next_hops'] = node_next_hops
+            flow_rule.pop('next_hop')
+            return node_next_hops
         next_hops = jsonutils.loads(flow_rule['next_hop'])
         if not next_hops:
             return None
@@ -553,6 +763,7 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                 self.admin_context, port_detail['ingress'])
             detail['net_uuid'] = port['network_id']
             node_next_hops.append(detail)
+        cached_next_hops[flow_rule['next_hop']] = node_next_hops
         flow_rule['next_hops'] = node_next_hops
         flow_rule.pop('next_hop')
 
@@ -607,9 +818,25 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                                                      port['host_id'])
         # update next hop info
         self._update_path_node_next_hops(flow_rule)
+        # the agent hashes these fields to select the next hop
+        flow_rule['lb_fields'] = (
+            self._get_group_lb_fields(flow_rule['next_group_id'])
+            if flow_rule.get('next_hops') else [])
 
         return flow_rule
 
+    def _get_group_lb_fields(self, group_intid):
+        lb_fields = self._get_fc_cache('lb_fields')
+        if group_intid not in lb_fields:
+            sfc_plugin = directory.get_plugin(sfc.SFC_EXT)
+            pgs = sfc_plugin.get_port_pair_groups(
+                self.admin_context, filters={'group_id': [group_intid]},
+                fields=['port_pair_group_parameters'])
+            lb_fields[group_intid] = (
+                pgs[0]['port_pair_group_parameters'].get('lb_fields', [])
+                if pgs else [])
+        return lb_fields[group_intid]
+
     def _filter_flow_classifiers(self, flow_rule, fc_ids):
         """Filter flow classifiers.
 
@@ -621,6 +848,7 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
         if not fc_ids:
             return fc_return
         fcs = self._get_fcs_by_ids(fc_ids)
+        ports = self._get_fcs_logical_ports(fcs)
         for fc in fcs:
             new_fc = fc.copy()
             new_fc.pop('id')
@@ -629,10 +857,8 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
             new_fc.pop('description')
             router_ints = const.ROUTER_INTERFACE_OWNERS
             logical_source_port = new_fc['logical_source_port']
-            if logical_source_port is not None:
-                port_src = self._get_by_id(
-                    self.admin_context, models_v2.Port, logical_source_port
-                )
+            port_src = ports.get(logical_source_port)
+            if port_src is not None:
                 if (
                     new_fc['source_ip_prefix'] is None and
                     port_src['device_owner'] not in router_ints
@@ -643,11 +869,8 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                         new_fc['source_ip_prefix'] = src_ips[0]['ip_address']
 
             logical_destination_port = new_fc['logical_destination_port']
-            if logical_destination_port is not None:
-                port_dst = self._get_by_id(
-                    self.admin_context, models_v2.Port,
-                    logical_destination_port
-                )
+            port_dst = ports.get(logical_destination_port)
+            if port_dst is not None:
                 if (
                     new_fc['destination_ip_prefix'] is None and
                     port_dst['device_owner'] not in router_ints
@@ -686,10 +909,25 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                                                         pc_corr,
                                                         add_fc_ids=add_fc_ids,
                                                         del_fc_ids=del_fc_ids)
-        self.ovs_driver_rpc.ask_agent_to_update_flow_rules(self.admin_context,
-                                                           flow_rule)
+        self._notify_flow_rule(topics.UPDATE, flow_rule)
         self._update_agent_fdb_entries(flow_rule)
 
+    def _notify_flow_rule(self, operation, flow_rule):
+        batch = getattr(self._flowrule_local, 'batch', None)
+        if batch is not None:
+            batch.add(operation, flow_rule)
+        elif operation == topics.DELETE:
+            self.ovs_driver_rpc.ask_agent_to_delete_flow_rules(
+                self.admin_context, flow_rule)
+        else:
+            self.ovs_driver_rpc.ask_agent_to_update_flow_rules(
+                self.admin_context, flow_rule)
+
+    def _send_flow_rule_batch(self, batch):
+        for host, flowrule_entries in batch.items():
+            self.ovs_driver_rpc.ask_agent_to_process_flow_rules(
+                self.admin_context, host, flowrule_entries)
+
     def _update_path_node_flowrules(self, node, pc_corr,
                                     add_fc_ids=None, del_fc_ids=None):
         if node['portpair_details'] is None:
@@ -709,25 +947,65 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
     def _get_portchain_fcs(self, port_chain):
         return self._get_fcs_by_ids(port_chain['flow_classifiers'])
 
+    def _get_fc_cache(self, name):
+        cache = getattr(self._fc_local, 'cache', None)
+        if cache is None or name not in cache:
+            return {}
+        return cache[name]
+
     def _get_fcs_by_ids(self, fc_ids):
         flow_classifiers = []
         if not fc_ids:
             return flow_classifiers
 
-        # Get the portchain flow classifiers
-        fc_plugin = (
-            directory.get_plugin(flowclassifier.FLOW_CLASSIFIER_EXT)
-        )
-        if not fc_plugin:
-            LOG.warning("Not found the flow classifier service plugin")
-            return flow_classifiers
+        fcs = self._get_fc_cache('flow_classifiers')
+        missing_fc_ids = [fc_id for fc_id in fc_ids if fc_id not in fcs]
+        if missing_fc_ids:
+            # Get the portchain flow classifiers
+            fc_plugin = (
+                directory.get_plugin(flowclassifier.FLOW_CLASSIFIER_EXT)
+            )
+            if not fc_plugin:
+                LOG.warning("Not found the flow classifier service plugin")
+                return flow_classifiers
+
+            for fc_ids_chunk in _chunks(
+                missing_fc_ids, cfg.CONF.sfc.flowrules_bulk_size
+            ):
+                for fc in fc_plugin.get_flow_classifiers(
+                    self.admin_context, filters={'id': fc_ids_chunk}
+                ):
+                    fcs[fc['id']] = fc
 
         for fc_id in fc_ids:
-            fc = fc_plugin.get_flow_classifier(self.admin_context, fc_id)
-            flow_classifiers.append(fc)
+            if fc_id not in fcs:
+                raise flowclassifier.FlowClassifierNotFound(id=fc_id)
+            flow_classifiers.append(fcs[fc_id])
 
         return flow_classifiers
 
+    def _get_fcs_logical_ports(self, fcs):
+        """Get the logical source and destination ports of fcs.
+
+        @return: dict of port id to Port model
+        """
+        ports = self._get_fc_cache('ports')
+        port_ids = set()
+        for fc in fcs:
+            port_ids.update([fc['logical_source_port'],
+                             fc['logical_destination_port']])
+        port_ids.discard(None)
+        missing_port_ids = port_ids - set(ports)
+        for port_ids_chunk in _chunks(
+            missing_port_ids, cfg.CONF.sfc.flowrules_bulk_size
+        ):
+            query = self._model_query(
+                self.admin_context, models_v2.Port
+            ).filter(models_v2.Port.id.in_(port_ids_chunk))
+            for port in query:
+                ports[port['id']] = port
+        return ports
+
     @log_helpers.log_method_call
     def create_port_chain_precommit(self, context):
         """OVS Driver precommit before transaction committed.
@@ -749,33 +1027,27 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                     ))
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
+    @batch_flow_rules
+    @cache_flow_classifiers
     def create_port_chain(self, context):
         port_chain = context.current
         symmetric = port_chain['chain_parameters'].get('symmetric')
-        if symmetric:
-            fwd_path_nodes = self._create_portchain_path(context, port_chain,
-                                                         True)
-            rev_path_nodes = self._create_portchain_path(context, port_chain,
-                                                         False)
-            self._update_path_nodes(
-                fwd_path_nodes,
-                port_chain['chain_parameters']['correlation'],
-                port_chain['flow_classifiers'],
-                None)
-            self._update_path_nodes(
-                rev_path_nodes,
-                port_chain['chain_parameters']['correlation'],
-                port_chain['flow_classifiers'],
-                None)
-        elif symmetric is False:
-            path_nodes = self._create_portchain_path(context, port_chain, True)
-            self._update_path_nodes(
-                path_nodes,
-                port_chain['chain_parameters']['correlation'],
-                port_chain['flow_classifiers'],
-                None)
+        snapshot = self._load_portchain_path_snapshot(context, port_chain)
+        # both directions of a symmetric chain are created at once
+        path_nodes = self._create_portchain_path(
+            context, port_chain, [True, False] if symmetric else [True],
+            snapshot)
+        self._update_path_nodes(
+            path_nodes,
+            port_chain['chain_parameters']['correlation'],
+            port_chain['flow_classifiers'],
+            None)
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
+    @batch_flow_rules
+    @cache_flow_classifiers
     def delete_port_chain(self, context):
         port_chain = context.current
         LOG.debug("to delete portchain path")
@@ -790,36 +1062,128 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
 
         return to_del, to_add
 
+    def _get_path_node_key(self, node):
+        return node['fwd_path'], node['node_type'], node['nsi']
+
+    def _path_node_changed(self, node, node_args, members):
+        if node['next_group_id'] != node_args['next_group_id']:
+            return True
+        next_hops = [
+            jsonutils.loads(next_hop) if next_hop else None
+            for next_hop in (node['next_hop'], node_args['next_hop'])
+        ]
+        if (next_hops[0] or None) != (next_hops[1] or None):
+            return True
+        # the port pair details of a src node come from flow classifiers
+        if node['node_type'] == ovs_const.SF_NODE:
+            return set(node['portpair_details']) != set(
+                member['portpair_id'] for member in members)
+        return False
+
+    def _diff_portchain_path(self, context, port_chain, path_nodes):
+        """Compare the stored path nodes with the ones port_chain needs.
+
+        @return: the unchanged path nodes, the stale path nodes and the
+                 (node_args, members) of the path nodes to create
+        """
+        snapshot = self._load_portchain_path_snapshot(context, port_chain)
+        self._check_portchain_cross_subnet(port_chain, snapshot)
+
+        orig_nodes = dict(
+            (self._get_path_node_key(node), node) for node in path_nodes)
+        kept_nodes, stale_nodes, new_nodes = [], [], []
+        symmetric = port_chain['chain_parameters'].get('symmetric')
+        for fwd_path in ([True, False] if symmetric else [True]):
+            for node_args, members in self._build_portchain_path(
+                    port_chain, fwd_path, snapshot):
+                node = orig_nodes.pop(
+                    self._get_path_node_key(node_args), None)
+                if node is None:
+                    new_nodes.append((node_args, members))
+                elif self._path_node_changed(node, node_args, members):
+                    stale_nodes.append(node)
+                    new_nodes.append((node_args, members))
+                else:
+                    kept_nodes.append(node)
+        stale_nodes.extend(orig_nodes.values())
+
+        return kept_nodes, stale_nodes, new_nodes
+
+    def _update_path_nodes_fcs(self, path_nodes, port_chain,
+                               add_fc_ids, del_fc_ids):
+        """Push only the flow classifier changes to existing path nodes."""
+        if not add_fc_ids and not del_fc_ids:
+            return
+        pc_corr = port_chain['chain_parameters']['correlation']
+        project_id = port_chain['project_id']
+        add_fc_ids = sorted(add_fc_ids) or None
+        del_fc_ids = sorted(del_fc_ids) or None
+        fcs = self._get_portchain_fcs(port_chain)
+        del_fcs = self._get_fcs_by_ids(del_fc_ids)
+
+        for node in path_nodes:
+            unused_fc_ids = []
+            unused_ports = set()
+            if node['node_type'] == ovs_const.SRC_NODE:
+                self._add_flowclassifier_port_assoc(
+                    add_fc_ids, project_id, node)
+                # the source ports no remaining flow classifier uses
+                src_key = ('logical_source_port' if node['fwd_path'] else
+                           'logical_destination_port')
+                used_ports = set(fc[src_key] for fc in fcs)
+                for fc in del_fcs:
+                    if fc[src_key] not in used_ports:
+                        unused_fc_ids.append(fc['id'])
+                        unused_ports.add(fc[src_key])
+
+            for each in node['portpair_details']:
+                port = self.get_port_detail_by_filter(dict(id=each))
+                if not port:
+                    continue
+                if port['egress'] in unused_ports:
+                    self._delete_path_node_port_flowrule(
+                        node, port, pc_corr, del_fc_ids)
+                else:
+                    self._update_path_node_port_flowrules(
+                        node, port, pc_corr, add_fc_ids, del_fc_ids)
+
+            if unused_fc_ids:
+                self._remove_flowclassifier_port_assoc(
+                    unused_fc_ids, project_id, [node])
+
     @log_helpers.log_method_call
+    @instrumentation.instrumented
+    @batch_flow_rules
+    @cache_flow_classifiers
     def update_port_chain(self, context):
+        """Update the path of a port chain incrementally.
+
+        Only the path nodes whose position, next hop or port pairs changed
+        are rebuilt, the other ones just get the added and removed flow
+        classifiers.
+        """
         port_chain = context.current
         orig = context.original
-        self._delete_portchain_path(orig)
-        # recreate port_chain after delete the orig
-        symmetric = port_chain['chain_parameters'].get('symmetric')
-        if symmetric:
-            fwd_path_nodes = self._create_portchain_path(context, port_chain,
-                                                         True)
-            rev_path_nodes = self._create_portchain_path(context, port_chain,
-                                                         False)
-            self._update_path_nodes(
-                fwd_path_nodes,
-                port_chain['chain_parameters']['correlation'],
-                port_chain['flow_classifiers'],
-                None)
-            self._update_path_nodes(
-                rev_path_nodes,
-                port_chain['chain_parameters']['correlation'],
-                port_chain['flow_classifiers'],
-                None)
-
-        elif symmetric is False:
-            path_nodes = self._create_portchain_path(context, port_chain, True)
-            self._update_path_nodes(
-                path_nodes,
-                port_chain['chain_parameters']['correlation'],
-                port_chain['flow_classifiers'],
-                None)
+        del_fc_ids, add_fc_ids = self._get_diff_set(
+            orig['flow_classifiers'], port_chain['flow_classifiers'])
+        path_nodes = self.get_path_nodes_by_filter(
+            dict(portchain_id=port_chain['id'])) or []
+
+        if port_chain['port_pair_groups'] == orig['port_pair_groups']:
+            kept_nodes, stale_nodes, new_nodes = path_nodes, [], []
+        else:
+            kept_nodes, stale_nodes, new_nodes = self._diff_portchain_path(
+                context, port_chain, path_nodes)
+
+        self._delete_path_nodes(stale_nodes, orig)
+        self._update_path_nodes_fcs(
+            kept_nodes, port_chain, add_fc_ids, del_fc_ids)
+        new_path_nodes = self._create_path_nodes(port_chain, new_nodes)
+        self._update_path_nodes(
+            new_path_nodes,
+            port_chain['chain_parameters']['correlation'],
+            port_chain['flow_classifiers'],
+            None)
 
     @log_helpers.log_method_call
     def create_port_pair_group(self, context):
@@ -830,6 +1194,9 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
         pass
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
+    @batch_flow_rules
+    @cache_flow_classifiers
     def update_port_pair_group(self, context):
         current = context.current
         original = context.original
@@ -975,10 +1342,8 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
             host_id = port_detail['binding:host_id']
             network_id = port_detail['network_id']
             mac_address = port_detail['mac_address']
-            network_info = core_plugin.get_network(
-                self.admin_context, network_id)
-            network_type = network_info['provider:network_type']
-            segment_id = network_info['provider:segmentation_id']
+            network_type, segment_id = self._get_network_segmentation(
+                core_plugin, network_id)
 
         if network_type != np_const.TYPE_VXLAN:
             LOG.warning("Currently only support vxlan network")
@@ -987,17 +1352,63 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
             LOG.warning("This port has not been binding")
             return ((None, ) * 5)
         else:
-            driver = core_plugin.type_manager.drivers.get(network_type)
-            host_endpoint = driver.obj.get_endpoint_by_host(host_id)
-            if host_endpoint:
-                local_ip = host_endpoint['ip_address']
-            else:
-                local_ip = None
+            local_ip = self._get_host_endpoint(
+                core_plugin, network_type, host_id)
 
         return host_id, local_ip, network_type, segment_id, mac_address
 
+    def _get_port_detail_infos(self, port_ids):
+        """Get the port details of ports, like _get_port_detail_info.
+
+        The ports and the networks missing from the cache are each read
+        with one core plugin call for all the ports, and the tunnel
+        endpoints missing from the cache once per host.
+
+        @param: port_ids: set of uuids
+        @return: dict of (host_id, local_ip, network_type, segment_id,
+        mac_address) tuples keyed by port id
+        """
+        infos = dict((port_id, (None, ) * 5) for port_id in port_ids)
+        if not port_ids:
+            return infos
+        core_plugin = directory.get_plugin()
+        ports = core_plugin.get_ports(
+            self.admin_context, filters={'id': list(port_ids)})
+        segmentations = {}
+        for port in ports:
+            segmentation = self._network_cache.get(port['network_id'])
+            if segmentation is not None:
+                segmentations[port['network_id']] = segmentation
+        missing = set(port['network_id'] for port in ports) - set(
+            segmentations)
+        if missing:
+            for network_info in core_plugin.get_networks(
+                self.admin_context, filters={'id': list(missing)}
+            ):
+                segmentation = (network_info['provider:network_type'],
+                                network_info['provider:segmentation_id'])
+                self._network_cache.set(network_info['id'], segmentation)
+                segmentations[network_info['id']] = segmentation
+        local_ips = {}
+        for port in ports:
+            host_id = port['binding:host_id']
+            network_type, segment_id = segmentations[port['network_id']]
+            if network_type != np_const.TYPE_VXLAN:
+                LOG.warning("Currently only support vxlan network")
+                continue
+            elif not host_id:
+                LOG.warning("This port has not been binding")
+                continue
+            if host_id not in local_ips:
+                local_ips[host_id] = self._get_host_endpoint(
+                    core_plugin, network_type, host_id)
+            infos[port['id']] = (
+                host_id, local_ips[host_id], network_type, segment_id,
+                port['mac_address'])
+        return infos
+
     @log_helpers.log_method_call
-    def _create_port_pair_detail(self, port_pair):
+    def _create_port_pair_detail(self, port_pair, port_infos=None):
         # since first node may not assign the ingress port, and last node
         # is not saved in the portpair_detail. we store the major egress port
         # info as the key to get the SF information.
@@ -1006,16 +1417,20 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
         in_port, e_port, host_id, local_endpoint, network_type, segment_id, \
             mac_address, in_mac_address = (
                 (None, ) * 8)
+        if port_infos is None:
+            get_port_detail_info = self._get_port_detail_info
+        else:
+            get_port_detail_info = port_infos.__getitem__
 
         if port_pair.get('ingress', None):
             in_port = port_pair['ingress']
             in_host_id, in_local_endpoint, in_network_type, in_segment_id, \
                 in_mac_address = (
-                    self._get_port_detail_info(in_port))
+                    get_port_detail_info(in_port))
         if port_pair.get('egress', None):
             e_port = port_pair['egress']
             host_id, local_endpoint, network_type, segment_id, mac_address = (
-                self._get_port_detail_info(e_port))
+                get_port_detail_info(e_port))
 
         pp_corr = port_pair.get('service_function_parameters')
         if pp_corr:
@@ -1042,6 +1457,16 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
         port_pair = context.current
         self._create_port_pair_detail(port_pair)
 
+    @log_helpers.log_method_call
+    @instrumentation.instrumented
+    def create_port_pair_bulk_postcommit(self, contexts):
+        port_pairs = [context.current for context in contexts]
+        port_infos = self._get_port_detail_infos(set(
+            port_pair[key] for port_pair in port_pairs
+            for key in ('ingress', 'egress') if port_pair.get(key)))
+        for port_pair in port_pairs:
+            self._create_port_pair_detail(port_pair, port_infos)
+
     @log_helpers.log_method_call
     def delete_port_pair(self, context):
         port_pair = context.current
@@ -1050,7 +1475,7 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                          egress=port_pair.get('egress', None),
                          project_id=port_pair['project_id']
                          )
-        pds = self.get_port_details_by_filter(pd_filter)
+        pds = self.get_port_details_by_filter(pd_filter, fields=['id'])
         if pds:
             for pd in pds:
                 self.delete_port_pair_detail(pd['id'])
@@ -1059,6 +1484,59 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
     def update_port_pair(self, context):
         pass
 
+    def _get_port_chains_by_ids(self, context, sfc_plugin, pc_ids):
+        port_chains = {}
+        for pc_ids_chunk in _chunks(pc_ids, cfg.CONF.sfc.flowrules_bulk_size):
+            for port_chain in sfc_plugin.get_port_chains(
+                context, filters={'id': pc_ids_chunk}
+            ):
+                port_chains[port_chain['id']] = port_chain
+        for pc_id in pc_ids:
+            if pc_id not in port_chains:
+                raise sfc.PortChainNotFound(id=pc_id)
+        return port_chains
+
+    def _get_port_details_flowrules(self, context, sfc_plugin, port_details):
+        """Build the flow rules of the path nodes of port details.
+
+        The path nodes, port chains and flow classifiers are loaded in bulk
+        and shared by all the flow rules, so the number of queries does not
+        grow with the number of chains a port is in.
+
+        @return: list of the flow rule lists of each port detail
+        """
+        node_ids = set(assoc['pathnode_id']
+                       for port_detail in port_details
+                       for assoc in port_detail['path_nodes'])
+        nodes = self.get_path_nodes_by_ids(
+            node_ids, cfg.CONF.sfc.flowrules_bulk_size)
+        port_chains = self._get_port_chains_by_ids(
+            context, sfc_plugin,
+            set(node['portchain_id'] for node in nodes.values()))
+        fcs = self._get_fcs_by_ids(sorted(set(
+            fc_id for port_chain in port_chains.values()
+            for fc_id in port_chain['flow_classifiers'])))
+        self._get_fcs_logical_ports(fcs)
+
+        port_details_flowrules = []
+        for port_detail in port_details:
+            flowrules = []
+            for assoc in port_detail['path_nodes']:
+                # update current path flow rule
+                node = nodes[assoc['pathnode_id']]
+                port_chain = port_chains[node['portchain_id']]
+                flow_rule = self._build_portchain_flowrule_body(
+                    node,
+                    port_detail,
+                    port_chain['chain_parameters']['correlation'],
+                    add_fc_ids=port_chain['flow_classifiers']
+                )
+                flowrules.append(flow_rule)
+            port_details_flowrules.append(flowrules)
+        return port_details_flowrules
+
+    @instrumentation.instrumented
+    @cache_flow_rules
     def get_flowrules_by_host_portid(self, context, host, port_id):
         port_chain_flowrules = []
         sfc_plugin = directory.get_plugin(sfc.SFC_EXT)
@@ -1085,21 +1563,10 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
                     egress_port.update(dict(host_id=host))
 
             # this is a SF if there are both egress and engress.
-            for i, ports in enumerate(port_detail_list):
-                nodes_assocs = ports['path_nodes']
-                for assoc in nodes_assocs:
-                    # update current path flow rule
-                    node = self.get_path_node(assoc['pathnode_id'])
-                    port_chain = sfc_plugin.get_port_chain(
-                        context,
-                        node['portchain_id'])
-                    flow_rule = self._build_portchain_flowrule_body(
-                        node,
-                        ports,
-                        port_chain['chain_parameters']['correlation'],
-                        add_fc_ids=port_chain['flow_classifiers']
-                    )
-                    port_chain_flowrules.append(flow_rule)
+            for flowrules in self._get_port_details_flowrules(
+                context, sfc_plugin, port_detail_list
+            ):
+                port_chain_flowrules.extend(flowrules)
 
             return port_chain_flowrules
 
@@ -1107,51 +1574,65 @@ class OVSSfcDriver(driver_base.SfcDriverBase,
             LOG.exception(e)
             LOG.error("get_flowrules_by_host_portid failed")
 
-    def update_flowrule_status(self, context, id, status):
-        """FIXME
+    @instrumentation.instrumented
+    @cache_flow_rules
+    def get_flowrules_by_host(self, context, host, marker=None, limit=None):
+        """Get the flow rules of all the port pair details on a host.
 
-        drivers/ovs/db.py will be removed in the future with 4 ovs tables
+        The port pair details are returned by pages of at most limit, and
+        at most [sfc] flowrules_bulk_size, entries ordered by id; pass the
+        returned next_marker to get the next page, which is None after the
+        last one.
 
-        This function raise:
-            RuntimeError: reentrant call
-            DBError: reentrant call
-            DBConnectionError: (pymysql.err.OperationalError)
-                (2014, 'Command Out of Sync'))
+        @return: dict with the 'port_details' list, each entry holding the
+                 ingress and egress ports of a port pair detail and its
+                 flow rules, and the 'next_marker'
         """
-        pass
-        # try:
-        #     flowrule_status = dict(status=status)
-        #     self.update_path_node(id, flowrule_status)
-        # except Exception as e:
-        #     LOG.exception(e)
-        #     LOG.error("update_flowrule_status failed")
+        result = {'port_details': [], 'next_marker': None}
+        sfc_plugin = directory.get_plugin(sfc.SFC_EXT)
+        if not sfc_plugin:
+            return result
+        # bound the page size, whatever the agent asks for
+        limit = min(limit or cfg.CONF.sfc.flowrules_bulk_size,
+                    cfg.CONF.sfc.flowrules_bulk_size)
+        port_details = self.get_port_details_by_host(host, marker, limit)
+        for port_detail, flowrules in zip(
+            port_details,
+            self._get_port_details_flowrules(
+                context, sfc_plugin, port_details)
+        ):
+            result['port_details'].append({
+                'ingress': port_detail['ingress'],
+                'egress': port_detail['egress'],
+                'flowrules': flowrules
+            })
+        if limit and len(port_details) == limit:
+            result['next_marker'] = port_details[-1]['id']
+        return result
+
+    def update_flowrule_status(self, context, id, status):
+        """Queue the status of a path node reported by an agent.
+
+        The statuses are written in bulk, on a session of their own,
+        by the flow rule status writer.
+        """
+        self._status_writer.add(id, status)
+
+    def _write_flowrule_status(self, statuses):
+        self.update_path_nodes_status(
+            n_context.get_admin_context(), statuses,
+            cfg.CONF.sfc.flowrules_bulk_size)
 
     def _update_portchain_group_reference_count(self, flow_rule, host):
         group_refcnt = 0
         flow_rule['host'] = host
 
         if flow_rule['next_group_id'] is not None:
-            all_nodes = self.get_path_nodes_by_filter(
-                filters={'next_group_id': flow_rule['next_group_id'],
-                         'nsi': 0xff})
-            if all_nodes is not None:
-                for node in all_nodes:
-                    if not node['portpair_details']:
-                        if flow_rule['fwd_path'] == node['fwd_path']:
-                            group_refcnt += 1
-
-            port_details = self.get_port_details_by_filter(
-                dict(host_id=flow_rule['host']))
-            if port_details is not None:
-                for pd in port_details:
-                    for path in pd['path_nodes']:
-                        path_node = self.get_path_node(path['pathnode_id'])
-                        if (
-                            path_node['next_group_id'] ==
-                            flow_rule['next_group_id']
-                            and path_node['fwd_path']
-                        ):
-                            group_refcnt += 1
+            group_refcnts = self._get_fc_cache('group_refcnts')
+            key = (flow_rule['next_group_id'], flow_rule['fwd_path'], host)
+            if key not in group_refcnts:
+                group_refcnts[key] = self.get_group_reference_count(*key)
+            group_refcnt = group_refcnts[key]
         flow_rule['group_refcnt'] = group_refcnt
 
         return group_refcnt
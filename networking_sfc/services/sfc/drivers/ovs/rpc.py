@@ -11,6 +11,9 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import collections
+
+from oslo_config import cfg
 from oslo_log import log as logging
 
 import oslo_messaging
@@ -18,16 +21,26 @@ import oslo_messaging
 from neutron.common import rpc as n_rpc
 from neutron.common import topics
 
+from networking_sfc.services.sfc.common import instrumentation
 from networking_sfc.services.sfc.drivers.ovs import rpc_topics as sfc_topics
 
 LOG = logging.getLogger(__name__)
 
+cfg.CONF.import_opt('agent_rpc_version_cap',
+                    'networking_sfc.services.sfc.common.config', group='sfc')
+
 
 class SfcRpcCallback(object):
-    """Sfc RPC server."""
+    """Sfc RPC server.
+
+    API version history:
+        1.0 - Initial version.
+        1.1 - Add get_flowrules_by_host to fetch the flow rules of all the
+              ports of a host by pages.
+    """
 
     def __init__(self, driver):
-        self.target = oslo_messaging.Target(version='1.0')
+        self.target = oslo_messaging.Target(version='1.1')
         self.driver = driver
 
     def get_flowrules_by_host_portid(self, context, **kwargs):
@@ -39,22 +52,59 @@ class SfcRpcCallback(object):
         LOG.debug('host: %s, port_id: %s', host, port_id)
         return pcfrs
 
+    def get_flowrules_by_host(self, context, **kwargs):
+        host = kwargs.get('host')
+        marker = kwargs.get('marker')
+        limit = kwargs.get('limit')
+        LOG.debug('host: %(host)s, marker: %(marker)s, limit: %(limit)s',
+                  {'host': host, 'marker': marker, 'limit': limit})
+        return self.driver.get_flowrules_by_host(
+            context, host, marker=marker, limit=limit)
+
     def update_flowrules_status(self, context, **kwargs):
         flowrules_status = kwargs.get('flowrules_status')
-        LOG.info('update_flowrules_status: %s', flowrules_status)
+        LOG.debug('update_flowrules_status: %s', flowrules_status)
         for flowrule_dict in flowrules_status:
             self.driver.update_flowrule_status(context,
                                                flowrule_dict['id'],
                                                flowrule_dict['status'])
 
 
+class FlowRuleBatch(object):
+    """Flow rule notifications of one operation, grouped by agent host.
+
+    Entries keep the order in which they were added, so an agent applies
+    deletions and updates in the same order the driver computed them.
+    """
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+
+    def add(self, operation, flowrule):
+        self.entries.setdefault(flowrule.get('host'), []).append(
+            {'operation': operation, 'flowrule': flowrule})
+
+    def items(self):
+        return self.entries.items()
+
+    def __len__(self):
+        return len(self.entries)
+
+
 class SfcAgentRpcClient(object):
-    """RPC client for ovs sfc agent."""
+    """RPC client for ovs sfc agent.
+
+    API version history:
+        1.0 - Initial version.
+        1.1 - Add process_flow_rules to send all the flow rules of an
+              operation to a host in a single message.
+    """
 
     def __init__(self, topic=sfc_topics.SFC_AGENT):
         self.topic = topic
         target = oslo_messaging.Target(topic=topic, version='1.0')
-        self.client = n_rpc.get_client(target)
+        self.client = n_rpc.get_client(
+            target, version_cap=cfg.CONF.sfc.agent_rpc_version_cap)
 
     def ask_agent_to_update_flow_rules(self, context, flows):
         LOG.debug('Ask agent on the specific host to update flows ')
@@ -64,6 +114,7 @@ class SfcAgentRpcClient(object):
             topic=topics.get_topic_name(
                 self.topic, sfc_topics.PORTFLOW, topics.UPDATE),
             server=host)
+        instrumentation.count_rpc_cast(flows)
         cctxt.cast(context, 'update_flow_rules', flowrule_entries=flows)
 
     def ask_agent_to_delete_flow_rules(self, context, flows):
@@ -74,4 +125,30 @@ class SfcAgentRpcClient(object):
             topic=topics.get_topic_name(
                 self.topic, sfc_topics.PORTFLOW, topics.DELETE),
             server=host)
+        instrumentation.count_rpc_cast(flows)
         cctxt.cast(context, 'delete_flow_rules', flowrule_entries=flows)
+
+    def ask_agent_to_process_flow_rules(self, context, host, flowrule_entries):
+        """Send the ordered flow rule entries of a batch to one host.
+
+        Falls back to one cast per flow rule when the agent_rpc_version_cap
+        option pins the agents to a version older than 1.1.
+        """
+        LOG.debug('Ask agent on host %(host)s to process %(count)d flows',
+                  {'host': host, 'count': len(flowrule_entries)})
+        if not self.client.can_send_version('1.1'):
+            for entry in flowrule_entries:
+                if entry['operation'] == topics.DELETE:
+                    self.ask_agent_to_delete_flow_rules(
+                        context, entry['flowrule'])
+                else:
+                    self.ask_agent_to_update_flow_rules(
+                        context, entry['flowrule'])
+            return
+        cctxt = self.client.prepare(
+            topic=topics.get_topic_name(
+                self.topic, sfc_topics.PORTFLOW, topics.UPDATE),
+            server=host, version='1.1')
+        instrumentation.count_rpc_cast(flowrule_entries)
+        cctxt.cast(context, 'process_flow_rules',
+                   flowrule_entries=flowrule_entries)
@@ -0,0 +1,65 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class FlowRuleStatusWriter(object):
+    """Coalesce the flow rule statuses reported by the agents.
+
+    The statuses are kept per path node, the last reported status of a
+    node replacing the previous ones, and written with the write callable
+    at most interval seconds after the first status of a batch. Writing
+    outside of the RPC callback keeps it out of the session of the caller.
+    """
+
+    def __init__(self, write, interval):
+        """:param write: callable taking a dict of status by path node id
+           :param interval: seconds between a status and its write
+        """
+        self._write = write
+        self.interval = interval
+        self._statuses = {}
+        self._scheduled = False
+
+    def add(self, node_id, status):
+        self._statuses[node_id] = status
+        self._schedule()
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            eventlet.spawn_after(self.interval, self.flush)
+
+    def pending(self):
+        return len(self._statuses)
+
+    def flush(self):
+        """Write the coalesced statuses."""
+        self._scheduled = False
+        statuses, self._statuses = self._statuses, {}
+        if not statuses:
+            return
+        try:
+            self._write(statuses)
+        except Exception:
+            LOG.exception("Failed to write %d flow rule statuses",
+                          len(statuses))
+            # retry with the next batch, unless a newer status came in
+            for node_id, status in statuses.items():
+                self._statuses.setdefault(node_id, status)
+            self._schedule()
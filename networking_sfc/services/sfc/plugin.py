@@ -12,33 +12,92 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+
+from neutron_lib import context as n_context
+from neutron_lib import exceptions as n_exc
+from oslo_config import cfg
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
 from oslo_utils import excutils
 
 from networking_sfc.db import sfc_db
 from networking_sfc.extensions import sfc as sfc_ext
+from networking_sfc.extensions import sfc_metrics as sfc_metrics_ext
 from networking_sfc.services.sfc.common import context as sfc_ctx
 from networking_sfc.services.sfc.common import exceptions as sfc_exc
+from networking_sfc.services.sfc.common import instrumentation
+from networking_sfc.services.sfc.common import worker
 from networking_sfc.services.sfc import driver_manager as sfc_driver
 
 
 LOG = logging.getLogger(__name__)
 
+cfg.CONF.import_opt('async_postcommit',
+                    'networking_sfc.services.sfc.common.config',
+                    group='sfc')
+
 
-class SfcPlugin(sfc_db.SfcDbPlugin):
+class SfcPlugin(sfc_db.SfcDbPlugin, sfc_metrics_ext.SfcMetricsPluginBase):
     """SFC plugin implementation."""
 
     supported_extension_aliases = [sfc_ext.SFC_EXT]
     path_prefix = sfc_ext.SFC_PREFIX
 
     def __init__(self):
+        instrumentation.setup()
+        if instrumentation.enabled():
+            # there are no metrics without the instrumentation
+            self.supported_extension_aliases = (
+                self.supported_extension_aliases +
+                [sfc_metrics_ext.SFC_METRICS_EXT])
         self.driver_manager = sfc_driver.SfcDriverManager()
         super(SfcPlugin, self).__init__()
         self.driver_manager.initialize()
+        # applies to all the resources of the plugin, port chains included
+        self.__native_bulk_support = self.driver_manager.native_bulk_support
+        # runs the port chain postcommit operations, in order per port chain
+        self._postcommit_worker = None
+        if cfg.CONF.sfc.async_postcommit:
+            self._postcommit_worker = worker.KeyedWorkerPool(
+                cfg.CONF.sfc.postcommit_workers)
+
+    def _submit_port_chain_postcommit(self, method, context,
+                                      portchain_db_context):
+        # the request context, and its session, end with the request
+        job_context = n_context.Context.from_dict(context.to_dict())
+        self._postcommit_worker.submit(
+            portchain_db_context.current['id'],
+            self._run_port_chain_postcommit, method, job_context,
+            portchain_db_context.current,
+            portchain_db_context.original)
+
+    def _run_port_chain_postcommit(self, method, context, port_chain,
+                                   original_portchain):
+        portchain_db_context = sfc_ctx.PortChainContext(
+            self, context, port_chain,
+            original_portchain=original_portchain)
+        try:
+            getattr(self.driver_manager, method)(portchain_db_context)
+        except Exception as e:
+            LOG.exception(e)
+            LOG.error("%(method)s failed, port_chain '%(id)s'",
+                      {'method': method, 'id': port_chain['id']})
+            status = sfc_ext.PORT_CHAIN_STATUS_ERROR
+        else:
+            if self._postcommit_worker.pending(port_chain['id']):
+                # the next operation sets the status
+                return
+            status = sfc_ext.PORT_CHAIN_STATUS_ACTIVE
+        self._set_port_chain_status(context, port_chain['id'], status)
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
     def create_port_chain(self, context, port_chain):
+        if self._postcommit_worker:
+            port_chain = {'port_chain': dict(
+                port_chain['port_chain'],
+                status=sfc_ext.PORT_CHAIN_STATUS_BUILDING)}
         with context.session.begin(subtransactions=True):
             port_chain_db = super(SfcPlugin, self).create_port_chain(
                 context, port_chain)
@@ -46,6 +105,10 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
                 self, context, port_chain_db)
             self.driver_manager.create_port_chain_precommit(
                 portchain_db_context)
+        if self._postcommit_worker:
+            self._submit_port_chain_postcommit(
+                'create_port_chain_postcommit', context, portchain_db_context)
+            return port_chain_db
         try:
             self.driver_manager.create_port_chain_postcommit(
                 portchain_db_context)
@@ -60,7 +123,37 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
         return port_chain_db
 
     @log_helpers.log_method_call
+    def create_port_chain_bulk(self, context, port_chains):
+        """Create port chains one at a time.
+
+        The native bulk support of the plugin covers all its resources, so
+        port chains, which have no batched driver operation, are created
+        like the emulated bulk of the API does: in order, deleting the
+        created ones if one fails.
+        """
+        port_chain_dbs = []
+        try:
+            for port_chain in port_chains['port_chains']:
+                port_chain_dbs.append(
+                    self.create_port_chain(context, port_chain))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for port_chain_db in port_chain_dbs:
+                    try:
+                        self.delete_port_chain(context, port_chain_db['id'])
+                    except Exception:
+                        LOG.exception("Unable to delete port chain %s of a "
+                                      "failed bulk create",
+                                      port_chain_db['id'])
+        return port_chain_dbs
+
+    @log_helpers.log_method_call
+    @instrumentation.instrumented
     def update_port_chain(self, context, portchain_id, port_chain):
+        if self._postcommit_worker:
+            port_chain = {'port_chain': dict(
+                port_chain['port_chain'],
+                status=sfc_ext.PORT_CHAIN_STATUS_BUILDING)}
         with context.session.begin(subtransactions=True):
             original_portchain = self.get_port_chain(context, portchain_id)
             updated_portchain = super(SfcPlugin, self).update_port_chain(
@@ -71,6 +164,10 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
             self.driver_manager.update_port_chain_precommit(
                 portchain_db_context)
 
+        if self._postcommit_worker:
+            self._submit_port_chain_postcommit(
+                'update_port_chain_postcommit', context, portchain_db_context)
+            return updated_portchain
         try:
             self.driver_manager.update_port_chain_postcommit(
                 portchain_db_context)
@@ -84,7 +181,11 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
         return updated_portchain
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
     def delete_port_chain(self, context, portchain_id):
+        if self._postcommit_worker:
+            # the queued operations on the port chain run before its deletion
+            self._postcommit_worker.wait(portchain_id)
         pc = self.get_port_chain(context, portchain_id)
         pc_context = sfc_ctx.PortChainContext(self, context, pc)
         try:
@@ -104,6 +205,7 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
         self.driver_manager.delete_port_chain_postcommit(pc_context)
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
     def create_port_pair(self, context, port_pair):
         with context.session.begin(subtransactions=True):
             portpair_db = super(SfcPlugin, self).create_port_pair(
@@ -125,6 +227,34 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
         return portpair_db
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
+    def create_port_pair_bulk(self, context, port_pairs):
+        with context.session.begin(subtransactions=True):
+            portpair_dbs = super(SfcPlugin, self).create_port_pair_bulk(
+                context, port_pairs)
+            portpair_contexts = [
+                sfc_ctx.PortPairContext(self, context, portpair_db)
+                for portpair_db in portpair_dbs]
+            for portpair_context in portpair_contexts:
+                self.driver_manager.create_port_pair_precommit(
+                    portpair_context)
+
+        try:
+            self.driver_manager.create_port_pair_bulk_postcommit(
+                portpair_contexts)
+        except sfc_exc.SfcDriverError as e:
+            LOG.exception(e)
+            with excutils.save_and_reraise_exception():
+                LOG.error("Create port pairs failed, "
+                          "deleting port_pairs %s",
+                          [portpair_db['id'] for portpair_db in portpair_dbs])
+                for portpair_db in portpair_dbs:
+                    self.delete_port_pair(context, portpair_db['id'])
+
+        return portpair_dbs
+
+    @log_helpers.log_method_call
+    @instrumentation.instrumented
     def update_port_pair(self, context, portpair_id, port_pair):
         with context.session.begin(subtransactions=True):
             original_portpair = self.get_port_pair(context, portpair_id)
@@ -145,6 +275,7 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
         return updated_portpair
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
     def delete_port_pair(self, context, portpair_id):
         portpair = self.get_port_pair(context, portpair_id)
         portpair_context = sfc_ctx.PortPairContext(
@@ -166,6 +297,7 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
         self.driver_manager.delete_port_pair_postcommit(portpair_context)
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
     def create_port_pair_group(self, context, port_pair_group):
         with context.session.begin(subtransactions=True):
             portpairgroup_db = super(SfcPlugin, self).create_port_pair_group(
@@ -188,6 +320,36 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
         return portpairgroup_db
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
+    def create_port_pair_group_bulk(self, context, port_pair_groups):
+        with context.session.begin(subtransactions=True):
+            portpairgroup_dbs = super(
+                SfcPlugin, self).create_port_pair_group_bulk(
+                context, port_pair_groups)
+            portpairgroup_contexts = [
+                sfc_ctx.PortPairGroupContext(self, context, portpairgroup_db)
+                for portpairgroup_db in portpairgroup_dbs]
+            for portpairgroup_context in portpairgroup_contexts:
+                self.driver_manager.create_port_pair_group_precommit(
+                    portpairgroup_context)
+        try:
+            self.driver_manager.create_port_pair_group_bulk_postcommit(
+                portpairgroup_contexts)
+        except sfc_exc.SfcDriverError as e:
+            LOG.exception(e)
+            with excutils.save_and_reraise_exception():
+                LOG.error("Create port pair groups failed, "
+                          "deleting port_pair_groups %s",
+                          [portpairgroup_db['id']
+                           for portpairgroup_db in portpairgroup_dbs])
+                for portpairgroup_db in portpairgroup_dbs:
+                    self.delete_port_pair_group(context,
+                                                portpairgroup_db['id'])
+
+        return portpairgroup_dbs
+
+    @log_helpers.log_method_call
+    @instrumentation.instrumented
     def update_port_pair_group(
         self, context, portpairgroup_id, port_pair_group
     ):
@@ -215,6 +377,7 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
         return updated_portpairgroup
 
     @log_helpers.log_method_call
+    @instrumentation.instrumented
     def delete_port_pair_group(self, context, portpairgroup_id):
         portpairgroup = self.get_port_pair_group(context, portpairgroup_id)
         portpairgroup_context = sfc_ctx.PortPairGroupContext(
@@ -238,3 +401,27 @@ class SfcPlugin(sfc_db.SfcDbPlugin):
                 portpairgroup_context)
         self.driver_manager.delete_port_pair_group_postcommit(
             portpairgroup_context)
+
+    def _make_metric_dict(self, name, metrics, fields=None):
+        # the metrics are those of the worker process serving the request
+        res = dict(metrics, id=name, name=name, pid=os.getpid())
+        return self._fields(res, fields)
+
+    def get_metrics(self, context, filters=None, fields=None):
+        if not context.is_admin:
+            raise n_exc.NotAuthorized()
+        names = (filters or {}).get('name') or (filters or {}).get('id')
+        return [
+            self._make_metric_dict(name, metrics, fields)
+            for name, metrics in sorted(
+                instrumentation.REGISTRY.snapshot().items())
+            if not names or name in names
+        ]
+
+    def get_metric(self, context, id, fields=None):
+        if not context.is_admin:
+            raise n_exc.NotAuthorized()
+        metrics = instrumentation.REGISTRY.snapshot().get(id)
+        if metrics is None:
+            raise sfc_metrics_ext.SfcMetricsNotFound(id=id)
+        return self._make_metric_dict(id, metrics, fields)
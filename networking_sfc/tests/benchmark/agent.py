@@ -0,0 +1,288 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the flow rule programming of the OVS SFC agent driver.
+
+SfcOVSAgentDriver runs on the real SfcOVSBridgeExt, wrapping a recording
+br-int instead of an Open vSwitch bridge. The recording bridge counts the
+ovs-ofctl invocations and the flows and groups they carry, and sleeps for
+a configurable process spawn cost at each invocation. Generated flow
+rules of several classifier shapes are updated then deleted, with and
+without flow transactions, and the flows, ovs-ofctl invocations and
+latency per rule are reported as JSON, e.g.:
+
+    python -m networking_sfc.tests.benchmark.agent --rules 20 \\
+        --spawn-cost-ms 5 -o result.json
+"""
+
+import argparse
+import collections
+import sys
+import time
+
+from neutron.agent.common import ovs_lib
+from oslo_config import cfg
+from oslo_utils import uuidutils
+
+from networking_sfc.services.sfc.agent.extensions.openvswitch import (
+    sfc_driver)
+from networking_sfc.tests.benchmark import base
+
+# ovs-ofctl commands whose standard input has one flow or group per line
+ENTRY_COMMANDS = ('add-flows', 'mod-flows', 'del-flows', 'add-groups',
+                  'mod-group', 'del-groups')
+
+LOCAL_IP = '10.0.0.1'
+REMOTE_IP = '10.0.0.2'
+
+
+class RecordingBridge(object):
+    """br-int recording the ovs-ofctl invocations instead of running them.
+
+    It stands for the OVSAgentBridge wrapped by SfcOVSBridgeExt, so that
+    the batching of the flow transactions is the one of the agent.
+    """
+
+    def __init__(self, spawn_cost):
+        self.br_name = 'br-int'
+        self.spawn_cost = spawn_cost
+        self.vif_ports = {}
+        self.reserved_cookies = set()
+        self.reset()
+
+    def reset(self):
+        # ovs-ofctl command -> invocations, and flows or groups carried
+        self.invocations = collections.Counter()
+        self.entries = collections.Counter()
+
+    def run_ofctl(self, cmd, args, process_input=None):
+        self.invocations[cmd] += 1
+        if cmd in ENTRY_COMMANDS:
+            self.entries[cmd] += len(
+                [line for line in (process_input or '').splitlines()
+                 if line.strip()])
+        if self.spawn_cost:
+            time.sleep(self.spawn_cost)
+        return ''
+
+    def do_action_flows(self, action, kwargs_list):
+        self.run_ofctl('%s-flows' % action, ['-'], '\n'.join(
+            ','.join('%s=%s' % item for item in sorted(kwargs.items()))
+            for kwargs in kwargs_list))
+
+    def add_flow(self, **kwargs):
+        self.do_action_flows('add', [kwargs])
+
+    def mod_flow(self, **kwargs):
+        self.do_action_flows('mod', [kwargs])
+
+    def install_goto(self, **kwargs):
+        self.add_flow(**kwargs)
+
+    def install_drop(self, **kwargs):
+        self.add_flow(**kwargs)
+
+    def set_protocols(self, protocols):
+        pass
+
+    def clone(self):
+        return self
+
+    def set_agent_uuid_stamp(self, val):
+        self.reserved_cookies.add(val)
+
+    def get_port_ofport(self, port_name):
+        return 1
+
+    def get_vif_port_by_id(self, port_id):
+        vif_port = self.vif_ports.get(port_id)
+        if vif_port is None:
+            ofport = len(self.vif_ports) + 2
+            vif_port = self.vif_ports[port_id] = ovs_lib.VifPort(
+                'tap%d' % ofport, ofport, port_id,
+                '00:00:00:00:%02x:%02x' % (ofport >> 8 & 0xff, ofport & 0xff),
+                self)
+        return vif_port
+
+    def get_vif_port_set(self):
+        return set(self.vif_ports)
+
+
+class AgentApi(object):
+
+    def __init__(self, int_br):
+        self.int_br = int_br
+
+    def request_int_br(self):
+        return self.int_br
+
+
+class BenchmarkAgentDriver(sfc_driver.SfcOVSAgentDriver):
+
+    def _get_vlan_by_port(self, port_id):
+        return 1
+
+    def _conjunction_supported(self):
+        return True
+
+    def _hash_selection_supported(self):
+        return True
+
+
+def mac_address(i):
+    return 'fa:16:3e:%02x:%02x:%02x' % (i >> 16 & 0xff, i >> 8 & 0xff,
+                                        i & 0xff)
+
+
+def flow_classifier(i, source_ports=(100, 100), destination_ports=(80, 80)):
+    return {
+        'ethertype': 'IPv4',
+        'protocol': 'tcp',
+        'source_ip_prefix': '10.%d.%d.0/24' % (i >> 8 & 0xff, i & 0xff),
+        'destination_ip_prefix': '10.200.0.0/16',
+        'source_port_range_min': source_ports[0],
+        'source_port_range_max': source_ports[1],
+        'destination_port_range_min': destination_ports[0],
+        'destination_port_range_max': destination_ports[1],
+        'l7_parameters': {}
+    }
+
+
+def flow_rule(i, classifiers, next_hops):
+    """Flow rule of a service function forwarding to a next hop group."""
+    return {
+        'id': uuidutils.generate_uuid(),
+        'nsp': 256 + i,
+        'nsi': 254,
+        'node_type': 'sf_node',
+        'fwd_path': True,
+        'ingress': uuidutils.generate_uuid(),
+        'egress': uuidutils.generate_uuid(),
+        'pc_corr': 'mpls',
+        'pp_corr': None,
+        'next_group_id': i + 1,
+        'group_refcnt': 1,
+        'next_hops': [{
+            'local_endpoint': LOCAL_IP if hop % 2 else REMOTE_IP,
+            'ingress': uuidutils.generate_uuid(),
+            'weight': 1,
+            'net_uuid': uuidutils.generate_uuid(),
+            'network_type': 'vxlan',
+            'segment_id': 100,
+            'gw_mac': mac_address(0),
+            'cidr': '10.0.0.0/8',
+            'in_mac_address': mac_address(i << 8 | hop),
+            'pp_corr': None
+        } for hop in range(next_hops)],
+        'add_fcs': classifiers,
+        'del_fcs': []
+    }
+
+
+# name -> function generating the flow rule i of the shape
+SHAPES = collections.OrderedDict([
+    ('baseline', lambda i, params: flow_rule(
+        i, [flow_classifier(i)], 1)),
+    ('wide_port_ranges', lambda i, params: flow_rule(
+        i, [flow_classifier(i, (1024, 65535), (1, 1023))], 1)),
+    ('many_classifiers', lambda i, params: flow_rule(
+        i, [flow_classifier(i << 8 | k)
+            for k in range(params.classifiers)], 1)),
+    ('wide_next_hop_group', lambda i, params: flow_rule(
+        i, [flow_classifier(i)], params.next_hops)),
+])
+
+
+def run_shape(params, make_rule, flow_transaction, conjunction):
+    cfg.CONF.set_override('flow_transaction', flow_transaction,
+                          group='sfc_agent')
+    cfg.CONF.set_override('conjunction_classification', conjunction,
+                          group='sfc_agent')
+    bridge = RecordingBridge(params.spawn_cost_ms / 1000.0)
+    driver = BenchmarkAgentDriver()
+    driver.consume_api(AgentApi(bridge))
+    driver.initialize()
+    samples = {'update_flow_rules': [], 'delete_flow_rule': []}
+    rules = [make_rule(i, params) for i in range(params.rules)]
+    for operation in ('update_flow_rules', 'delete_flow_rule'):
+        for rule in rules:
+            if operation == 'delete_flow_rule':
+                rule = dict(rule, add_fcs=[], del_fcs=rule['add_fcs'])
+            bridge.reset()
+            status = []
+            start = time.time()
+            getattr(driver, operation)(rule, status)
+            latency = time.time() - start
+            if any(item['status'] == 'error' for item in status):
+                raise RuntimeError("%s failed" % operation)
+            samples[operation].append({
+                'latency_ms': latency * 1000,
+                'ofctl_invocations': sum(bridge.invocations.values()),
+                'flows_added': (bridge.entries['add-flows'] +
+                                bridge.entries['mod-flows']),
+                'flows_deleted': bridge.entries['del-flows'],
+                'group_operations': (bridge.entries['add-groups'] +
+                                     bridge.entries['mod-group'] +
+                                     bridge.entries['del-groups'])
+            })
+    return dict(
+        (operation, base.summarize_samples(
+            operation_samples,
+            ('latency_ms', 'ofctl_invocations', 'flows_added',
+             'flows_deleted', 'group_operations')))
+        for operation, operation_samples in samples.items()
+    )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the flow rule programming of the OVS SFC "
+                    "agent driver.")
+    parser.add_argument('--rules', type=int, default=20,
+                        help="flow rules per classifier shape")
+    parser.add_argument('--classifiers', type=int, default=20,
+                        help="flow classifiers per rule of the "
+                             "many_classifiers shape")
+    parser.add_argument('--next-hops', type=int, default=16,
+                        help="next hops per rule of the "
+                             "wide_next_hop_group shape")
+    parser.add_argument('--spawn-cost-ms', type=float, default=5.0,
+                        help="simulated cost of an ovs-ofctl invocation")
+    parser.add_argument('--shapes', nargs='+', choices=list(SHAPES),
+                        default=list(SHAPES),
+                        help="classifier shapes to run")
+    parser.add_argument('--conjunction', action='store_true',
+                        help="classify with conjunctive matches")
+    parser.add_argument('-o', '--output',
+                        help="file the JSON result is written to, "
+                             "instead of the standard output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    params = parse_args(sys.argv[1:] if argv is None else argv)
+    cfg.CONF.set_override('local_ip', LOCAL_IP, group='OVS')
+    result = {'parameters': vars(params), 'shapes': {}}
+    for shape in params.shapes:
+        result['shapes'][shape] = dict(
+            (mode, run_shape(params, SHAPES[shape], flow_transaction,
+                             params.conjunction))
+            for mode, flow_transaction in (('flow_transaction', True),
+                                           ('no_flow_transaction', False))
+        )
+    base.write_result(result, params.output)
+
+
+if __name__ == '__main__':
+    main()
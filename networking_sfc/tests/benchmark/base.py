@@ -0,0 +1,55 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sys
+
+from oslo_serialization import jsonutils
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percent // 100)]
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        'min': min(values),
+        'mean': float(sum(values)) / len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'max': max(values),
+        'total': sum(values)
+    }
+
+
+def summarize_samples(samples, metrics):
+    """Summarize each metric of a list of sample dicts."""
+    return dict(
+        count=len(samples),
+        **dict(
+            (metric, summarize([sample[metric] for sample in samples]))
+            for metric in metrics
+        )
+    )
+
+
+def write_result(result, output):
+    data = jsonutils.dumps(result, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(data + '\n')
+    else:
+        sys.stdout.write(data + '\n')
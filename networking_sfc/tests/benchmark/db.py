@@ -0,0 +1,213 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the lookups of the OVS driver tables.
+
+The port pair details, path nodes and path port associations are
+generated in a SQLite database, by default a file so that lookups read
+pages instead of memory only. The lookups of the OVS driver DB layer run
+on them first without the lookup indexes of the tables, then with them,
+and the latency per lookup is reported as JSON, e.g.:
+
+    python -m networking_sfc.tests.benchmark.db --rows 100000 \\
+        --lookups 200 -o result.json
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from oslo_utils import uuidutils
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+# the port chains referenced by the path nodes
+from networking_sfc.db import sfc_db  # noqa
+from networking_sfc.services.sfc.drivers.ovs import db as ovs_sfc_db
+from networking_sfc.tests.benchmark import base
+
+TABLES = (ovs_sfc_db.PortPairDetail.__table__,
+          ovs_sfc_db.PathNode.__table__,
+          ovs_sfc_db.PathPortAssoc.__table__)
+
+# path nodes per port chain, the src node and one per port pair group
+NODES_PER_CHAIN = 4
+
+INSERT_CHUNK = 10000
+
+
+class Context(object):
+
+    def __init__(self, session):
+        self.session = session
+
+
+def generate(session, params):
+    """Insert params.rows port pair details and path nodes.
+
+    Every path node but the src node of a chain is associated with the
+    port pair detail of the same rank. Return the lookup keys.
+    """
+    keys = {'port_pairs': [], 'hosts': [], 'chains': []}
+    details, nodes, assocs = [], [], []
+    for i in range(params.rows):
+        detail_id = uuidutils.generate_uuid()
+        ingress = uuidutils.generate_uuid()
+        egress = uuidutils.generate_uuid()
+        host = 'host%d' % (i % params.hosts)
+        details.append({
+            'id': detail_id, 'project_id': 'benchmark',
+            'ingress': ingress, 'egress': egress, 'host_id': host,
+            'mac_address': '00:00:00:00:00:00', 'network_type': 'vxlan',
+            'segment_id': 100, 'local_endpoint': '10.0.0.1'
+        })
+        chain, position = divmod(i, NODES_PER_CHAIN)
+        if not position:
+            portchain_id = uuidutils.generate_uuid()
+            keys['chains'].append((portchain_id, 256 + chain))
+        node_id = uuidutils.generate_uuid()
+        nodes.append({
+            'id': node_id, 'project_id': 'benchmark',
+            'node_type': 'sf_node' if position else 'src_node',
+            'nsp': 256 + chain, 'nsi': 0xff - position,
+            'portchain_id': portchain_id, 'status': 'active',
+            'next_group_id': (
+                None if position == NODES_PER_CHAIN - 1 else
+                (chain * NODES_PER_CHAIN + position) % 255 + 1),
+            'next_hop': None, 'fwd_path': True
+        })
+        if position:
+            assocs.append({'pathnode_id': node_id, 'portpair_id': detail_id,
+                           'weight': 1})
+        keys['port_pairs'].append((ingress, egress))
+        keys['hosts'].append(host)
+    for table, rows in zip(TABLES, (details, nodes, assocs)):
+        for i in range(0, len(rows), INSERT_CHUNK):
+            session.execute(table.insert(), rows[i:i + INSERT_CHUNK])
+    return keys
+
+
+def lookups(driver_db, keys, params):
+    """Return the lookups of the driver DB layer, by name."""
+    rand = random.Random(params.seed)
+
+    def port_detail_by_port_pair():
+        ingress, egress = rand.choice(keys['port_pairs'])
+        driver_db.get_port_detail_by_filter(
+            {'ingress': ingress, 'egress': egress})
+
+    def port_detail_by_egress():
+        driver_db.get_port_detail_by_filter(
+            {'egress': rand.choice(keys['port_pairs'])[1]})
+
+    def port_details_by_host():
+        driver_db.get_port_details_by_host(rand.choice(keys['hosts']),
+                                           limit=100)
+
+    def path_nodes_by_chain():
+        driver_db.get_path_nodes_by_filter(
+            {'portchain_id': rand.choice(keys['chains'])[0]})
+
+    def path_nodes_by_chain_nsi():
+        driver_db.get_path_nodes_by_filter(
+            {'portchain_id': rand.choice(keys['chains'])[0], 'nsi': 0xfe})
+
+    def path_node_by_nsp_nsi():
+        driver_db.get_path_node_by_filter(
+            {'nsp': rand.choice(keys['chains'])[1], 'nsi': 0xfe})
+
+    def group_reference_count():
+        driver_db.get_group_reference_count(
+            rand.randint(1, 255), True, rand.choice(keys['hosts']))
+
+    return dict((f.__name__, f) for f in (
+        port_detail_by_port_pair, port_detail_by_egress,
+        port_details_by_host, path_nodes_by_chain, path_nodes_by_chain_nsi,
+        path_node_by_nsp_nsi, group_reference_count))
+
+
+def measure(driver_db, keys, params):
+    result = {}
+    for name, lookup in sorted(lookups(driver_db, keys, params).items()):
+        samples = []
+        for i in range(params.lookups):
+            start = time.time()
+            lookup()
+            samples.append((time.time() - start) * 1000)
+        result[name] = base.summarize(samples)
+    return result
+
+
+def run(params, path):
+    engine = sa.create_engine('sqlite:///%s' % path if path else 'sqlite://')
+    session = orm.sessionmaker(bind=engine, autocommit=True)()
+    for table in TABLES:
+        table.create(engine)
+    indexes = [index for table in TABLES for index in table.indexes]
+    with session.begin():
+        keys = generate(session, params)
+
+    driver_db = ovs_sfc_db.OVSSfcDriverDB()
+    driver_db.admin_context = Context(session)
+    result = {'parameters': vars(params), 'lookups': {}}
+    for index in indexes:
+        index.drop(engine)
+    session.execute('ANALYZE')
+    result['lookups']['without_indexes'] = measure(driver_db, keys, params)
+    for index in indexes:
+        index.create(engine)
+    session.execute('ANALYZE')
+    result['lookups']['with_indexes'] = measure(driver_db, keys, params)
+    return result
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the lookups of the OVS driver tables.")
+    parser.add_argument('--rows', type=int, default=100000,
+                        help="port pair details and path nodes")
+    parser.add_argument('--hosts', type=int, default=100,
+                        help="number of hosts of the port pair details")
+    parser.add_argument('--lookups', type=int, default=200,
+                        help="lookups measured per access pattern")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the random lookup keys")
+    parser.add_argument('--in-memory', action='store_true',
+                        help="use an in-memory database instead of a "
+                             "temporary file")
+    parser.add_argument('-o', '--output',
+                        help="file the JSON result is written to, "
+                             "instead of the standard output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    params = parse_args(sys.argv[1:] if argv is None else argv)
+    if params.in_memory:
+        result = run(params, None)
+    else:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        try:
+            result = run(params, path)
+        finally:
+            os.remove(path)
+    base.write_result(result, params.output)
+
+
+if __name__ == '__main__':
+    main()
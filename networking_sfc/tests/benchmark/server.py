@@ -0,0 +1,243 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the port chain lifecycle on the server.
+
+The port chain operations run through SfcPlugin with the OVS driver, on
+the in-memory SQLite database and with the stubbed agent RPC of the OVS
+driver unit tests. A synthetic topology of chains is created, then each
+chain is updated, its port pair groups updated and the chain deleted.
+The latency, SQL statements, RPC messages and flow rules of every
+operation are reported as JSON, e.g.:
+
+    python -m networking_sfc.tests.benchmark.server --chains 10 \\
+        --groups 3 --pairs 4 --classifiers 2 --symmetric -o result.json
+"""
+
+import argparse
+import sys
+import unittest
+
+from neutron_lib.api.definitions import portbindings
+from neutron_lib.plugins import directory
+from oslo_config import cfg
+from stevedore import extension
+
+from networking_sfc.extensions import flowclassifier
+from networking_sfc.extensions import sfc
+from networking_sfc.services.sfc.common import instrumentation
+from networking_sfc.services.sfc import driver_manager as sfc_driver
+from networking_sfc.services.sfc import plugin as sfc_plugin
+from networking_sfc.tests.benchmark import base
+from networking_sfc.tests.unit.services.sfc.drivers.ovs import test_driver
+
+OPERATIONS = ('create_port_chain', 'update_port_chain',
+              'update_port_pair_group', 'delete_port_chain')
+
+
+class ServerBenchmark(test_driver.OVSSfcDriverTestCase):
+    """Port chain lifecycle through SfcPlugin and the OVS driver."""
+
+    # set by main() before the benchmark runs
+    params = None
+
+    def setUp(self):
+        super(ServerBenchmark, self).setUp()
+        cfg.CONF.set_override('instrumentation', True, group='sfc')
+        cfg.CONF.set_override('instrumentation_log_interval', 0,
+                              group='sfc')
+        instrumentation.setup()
+        self.addCleanup(setattr, instrumentation, '_enabled', False)
+        self.plugin = sfc_plugin.SfcPlugin()
+        self.plugin.driver_manager = (
+            sfc_driver.SfcDriverManager.make_test_instance([
+                extension.Extension('ovs', None, None, self.driver)
+            ])
+        )
+        directory.add_plugin(sfc.SFC_EXT, self.plugin)
+        self.samples = dict((op, []) for op in OPERATIONS)
+        self.port_count = 0
+
+    def _create_port(self, network):
+        host = 'host%d' % (self.port_count % self.params.hosts)
+        self.port_count += 1
+        self.host_endpoint_mapping.setdefault(host, '10.0.%d.%d' % (
+            self.port_count // 250, self.port_count % 250 + 1))
+        return self._make_port(
+            self.fmt, network['network']['id'],
+            device_owner='compute', device_id='benchmark',
+            arg_list=(portbindings.HOST_ID,),
+            **{portbindings.HOST_ID: host})['port']
+
+    def _create_port_pair_group(self, network, pairs):
+        port_pairs = []
+        for i in range(pairs):
+            port = self._create_port(network)
+            port_pairs.append(self.plugin.create_port_pair(self.ctx, {
+                'port_pair': {
+                    'tenant_id': self._tenant_id,
+                    'name': '', 'description': '',
+                    'ingress': port['id'], 'egress': port['id'],
+                    'service_function_parameters': dict(
+                        sfc.DEFAULT_SF_PARAMETERS)
+                }
+            })['id'])
+        return self.plugin.create_port_pair_group(self.ctx, {
+            'port_pair_group': {
+                'tenant_id': self._tenant_id,
+                'name': '', 'description': '',
+                'port_pairs': port_pairs[:self.params.pairs],
+                'port_pair_group_parameters': dict(
+                    sfc.DEFAULT_PPG_PARAMETERS)
+            }
+        }), port_pairs
+
+    def _create_flow_classifier(self, dst_port, src_port_id, dst_port_id):
+        return self.fc_plugin.create_flow_classifier(self.ctx, {
+            'flow_classifier': {
+                'tenant_id': self._tenant_id,
+                'name': '', 'description': '',
+                'ethertype': 'IPv4', 'protocol': 'tcp',
+                'source_port_range_min': None,
+                'source_port_range_max': None,
+                'destination_port_range_min': dst_port,
+                'destination_port_range_max': dst_port,
+                'source_ip_prefix': None,
+                'destination_ip_prefix': None,
+                'logical_source_port': src_port_id,
+                'logical_destination_port': dst_port_id,
+                'l7_parameters': {}
+            }
+        })['id']
+
+    def _measure(self, operation, func, *args):
+        self.init_rpc_calls()
+        with instrumentation.measure(operation) as measurement:
+            result = func(self.ctx, *args)
+        process_calls = self.rpc_calls['process_flow_rules']
+        flow_rules = sum(len(entries) for host, entries in process_calls)
+        single_casts = (len(self.rpc_calls['update_flow_rules']) +
+                        len(self.rpc_calls['delete_flow_rules']) -
+                        flow_rules)
+        self.samples[operation].append({
+            'latency_ms': measurement.wall_time * 1000,
+            'queries': measurement.queries,
+            'rpc_messages': len(process_calls) + single_casts,
+            'flow_rules': flow_rules + single_casts
+        })
+        return result
+
+    def run_benchmark(self):
+        params = self.params
+        self.fc_plugin = directory.get_plugin(
+            flowclassifier.FLOW_CLASSIFIER_EXT)
+        network = self._make_network(self.fmt, 'benchmark', True)
+        self._make_subnet(self.fmt, network, '10.0.0.1', '10.0.0.0/16')
+        src_port = self._create_port(network)
+        dst_port = self._create_port(network)
+        chains = []
+        for c in range(params.chains):
+            groups = [
+                self._create_port_pair_group(network, params.pairs + 1)
+                for m in range(params.groups)
+            ]
+            # one spare classifier, swapped in by the chain update
+            fcs = [
+                self._create_flow_classifier(
+                    1 + c * (params.classifiers + 1) + k,
+                    src_port['id'], dst_port['id'])
+                for k in range(params.classifiers + 1)
+            ]
+            chains.append((groups, fcs))
+
+        port_chains = []
+        for groups, fcs in chains:
+            port_chain = {'port_chain': {
+                'tenant_id': self._tenant_id,
+                'name': '', 'description': '',
+                'port_pair_groups': [group['id'] for group, pps in groups],
+                'flow_classifiers': fcs[:params.classifiers],
+                'chain_parameters': {
+                    'correlation': 'mpls',
+                    'symmetric': params.symmetric
+                },
+                'chain_id': 0
+            }}
+            port_chains.append(self._measure(
+                'create_port_chain', self.plugin.create_port_chain,
+                port_chain))
+        for port_chain, (groups, fcs) in zip(port_chains, chains):
+            self._measure('update_port_chain', self.plugin.update_port_chain,
+                          port_chain['id'], {'port_chain': {
+                              'flow_classifiers': fcs[1:]}})
+            for group, pps in groups:
+                self._measure(
+                    'update_port_pair_group',
+                    self.plugin.update_port_pair_group,
+                    group['id'], {'port_pair_group': {
+                        'port_pairs': pps[1:]}})
+        for port_chain in port_chains:
+            self._measure('delete_port_chain', self.plugin.delete_port_chain,
+                          port_chain['id'])
+
+        self.result = {
+            'parameters': vars(params),
+            'operations': dict(
+                (operation, base.summarize_samples(
+                    samples, ('latency_ms', 'queries', 'rpc_messages',
+                              'flow_rules')))
+                for operation, samples in self.samples.items()
+            )
+        }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the port chain operations of the server.")
+    parser.add_argument('--pairs', type=int, default=2,
+                        help="port pairs per port pair group")
+    parser.add_argument('--groups', type=int, default=3,
+                        help="port pair groups per port chain")
+    parser.add_argument('--classifiers', type=int, default=2,
+                        help="flow classifiers per port chain")
+    parser.add_argument('--chains', type=int, default=5,
+                        help="number of port chains")
+    parser.add_argument('--hosts', type=int, default=4,
+                        help="number of hosts the ports are bound to")
+    parser.add_argument('--symmetric', action='store_true',
+                        help="create symmetric port chains")
+    parser.add_argument('-o', '--output',
+                        help="file the JSON result is written to, "
+                             "instead of the standard output")
+    return parser.parse_args(argv)
+
+
+def run(benchmark_class, params):
+    """Run a benchmark test case, return its result or raise."""
+    benchmark_class.params = params
+    benchmark = benchmark_class('run_benchmark')
+    result = unittest.TestResult()
+    benchmark.run(result)
+    for test, error in result.errors + result.failures:
+        raise RuntimeError(error)
+    return benchmark.result
+
+
+def main(argv=None):
+    params = parse_args(sys.argv[1:] if argv is None else argv)
+    base.write_result(run(ServerBenchmark, params), params.output)
+
+
+if __name__ == '__main__':
+    main()
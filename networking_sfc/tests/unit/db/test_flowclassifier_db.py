@@ -18,6 +18,7 @@ import mock
 import webob.exc
 
 from neutron_lib import constants as lib_const
+from neutron_lib import context
 from oslo_config import cfg
 from oslo_utils import importutils
 from oslo_utils import uuidutils
@@ -171,6 +172,95 @@ class FlowClassifierDbPluginTestCase(
                 'logical_destination_port': dst_port['port']['id']
             })
 
+    def _flow_classifier_bulk_item(self, source_ip_prefix, logical_port):
+        return {'flow_classifier': {
+            'project_id': self._tenant_id,
+            'name': '', 'description': '',
+            'ethertype': 'IPv4', 'protocol': None,
+            'source_port_range_min': None, 'source_port_range_max': None,
+            'destination_port_range_min': None,
+            'destination_port_range_max': None,
+            'source_ip_prefix': source_ip_prefix,
+            'destination_ip_prefix': None,
+            'logical_source_port': logical_port,
+            'logical_destination_port': None,
+            'l7_parameters': {}
+        }}
+
+    def test_create_flow_classifier_bulk(self):
+        with self.port(
+            name='test1'
+        ) as port:
+            port_id = port['port']['id']
+            ctx = context.get_admin_context()
+            fcs = self.flowclassifier_plugin.create_flow_classifier_bulk(
+                ctx, {'flow_classifiers': [
+                    self._flow_classifier_bulk_item('10.100.0.0/16', port_id),
+                    self._flow_classifier_bulk_item('10.101.0.0/16', port_id)
+                ]})
+            self.assertEqual(
+                ['10.100.0.0/16', '10.101.0.0/16'],
+                [fc['source_ip_prefix'] for fc in fcs])
+            self.assertItemsEqual(
+                [fc['id'] for fc in fcs],
+                [fc['id'] for fc in
+                 self.flowclassifier_plugin.get_flow_classifiers(ctx)])
+            for fc in fcs:
+                self.flowclassifier_plugin.delete_flow_classifier(
+                    ctx, fc['id'])
+
+    def test_create_flow_classifier_bulk_conflict_existing(self):
+        with self.port(
+            name='test1'
+        ) as port, self.flow_classifier(flow_classifier={
+            'source_ip_prefix': '10.100.0.0/16',
+            'logical_source_port': port['port']['id']
+        }) as fc:
+            port_id = port['port']['id']
+            ctx = context.get_admin_context()
+            try:
+                self.flowclassifier_plugin.create_flow_classifier_bulk(
+                    ctx, {'flow_classifiers': [
+                        self._flow_classifier_bulk_item(
+                            '10.101.0.0/16', port_id),
+                        self._flow_classifier_bulk_item(
+                            '10.100.1.0/24', port_id)
+                    ]})
+            except fc_ext.FlowClassifierInConflict as e:
+                self.assertIn(fc['flow_classifier']['id'], str(e))
+            else:
+                self.fail('FlowClassifierInConflict not raised')
+            self.assertEqual(
+                [fc['flow_classifier']['id']],
+                [item['id'] for item in
+                 self.flowclassifier_plugin.get_flow_classifiers(ctx)])
+
+    def test_create_flow_classifier_bulk_conflict_in_batch(self):
+        with self.port(
+            name='test1'
+        ) as port:
+            port_id = port['port']['id']
+            ctx = context.get_admin_context()
+            self.assertRaises(
+                fc_ext.FlowClassifierInConflict,
+                self.flowclassifier_plugin.create_flow_classifier_bulk,
+                ctx, {'flow_classifiers': [
+                    self._flow_classifier_bulk_item('10.100.0.0/16', port_id),
+                    self._flow_classifier_bulk_item('10.100.1.0/24', port_id)
+                ]})
+            self.assertEqual(
+                [], self.flowclassifier_plugin.get_flow_classifiers(ctx))
+
+    def test_create_flow_classifier_bulk_port_not_found(self):
+        ctx = context.get_admin_context()
+        self.assertRaises(
+            fc_ext.FlowClassifierPortNotFound,
+            self.flowclassifier_plugin.create_flow_classifier_bulk,
+            ctx, {'flow_classifiers': [
+                self._flow_classifier_bulk_item(
+                    '10.100.0.0/16', uuidutils.generate_uuid())
+            ]})
+
     def test_quota_create_flow_classifier(self):
         cfg.CONF.set_override('quota_flow_classifier', 3, group='QUOTAS')
         with self.port(
@@ -1579,3 +1669,68 @@ class FlowClassifierDbPluginTestCase(
         )
         res = req.get_response(self.ext_api)
         self.assertEqual(404, res.status_int)
+
+
+class FlowClassifierIndexTestCase(base.BaseTestCase):
+
+    def _fc(self, id, **kwargs):
+        fc = {
+            'id': id,
+            'ethertype': 'IPv4',
+            'protocol': None,
+            'source_ip_prefix': None,
+            'destination_ip_prefix': None,
+            'source_port_range_min': None,
+            'source_port_range_max': None,
+            'destination_port_range_min': None,
+            'destination_port_range_max': None,
+            'logical_source_port': None,
+            'logical_destination_port': None
+        }
+        fc.update(kwargs)
+        return fc
+
+    def _build_fcs(self):
+        fcs = []
+        prefixes = [None, '10.0.0.0/8', '10.1.0.0/16', '10.1.1.0/24',
+                    '10.1.1.1/32', '10.2.0.0/16', '192.168.0.0/24']
+        for i, prefix in enumerate(prefixes):
+            for protocol in (None, lib_const.PROTO_NAME_TCP,
+                             lib_const.PROTO_NAME_UDP):
+                fcs.append(self._fc(
+                    '%s-%s' % (i, protocol),
+                    protocol=protocol,
+                    source_ip_prefix=prefix,
+                    destination_ip_prefix=prefixes[-1 - i],
+                    logical_source_port='port%d' % (i % 2)
+                ))
+        fcs.append(self._fc('v6', ethertype='IPv6',
+                            source_ip_prefix='2001:db8::/64'))
+        fcs.append(self._fc(
+            'ports', protocol=lib_const.PROTO_NAME_TCP,
+            source_port_range_min=100, source_port_range_max=200))
+        return fcs
+
+    def test_find_conflicts_matches_pairwise_checks(self):
+        fcs = self._build_fcs()
+        index = fdb.FlowClassifierIndex(fcs)
+        fc_cls = fdb.FlowClassifierDbPlugin
+        for fc in fcs:
+            for basic in (False, True):
+                if basic:
+                    conflict = fc_cls.flowclassifier_basic_conflict
+                else:
+                    conflict = fc_cls.flowclassifier_conflict
+                self.assertEqual(
+                    sorted(other['id'] for other in fcs
+                           if conflict(fc, other)),
+                    sorted(other['id'] for other in
+                           index.find_conflicts(fc, basic=basic)))
+
+    def test_ip_prefix_conflict(self):
+        conflict = fdb.FlowClassifierDbPlugin._ip_prefix_conflict
+        self.assertTrue(conflict('10.0.0.0/8', '10.1.1.1/32'))
+        self.assertTrue(conflict('10.1.1.1/32', '10.0.0.0/8'))
+        self.assertTrue(conflict(None, '10.0.0.0/8'))
+        self.assertFalse(conflict('10.0.0.0/16', '10.1.0.0/16'))
+        self.assertFalse(conflict('0.0.0.0/0', '::/0'))
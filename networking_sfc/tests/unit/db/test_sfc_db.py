@@ -24,6 +24,7 @@ from oslo_utils import uuidutils
 from neutron.api import extensions as api_ext
 from neutron.common import config
 import neutron.extensions as nextensions
+from neutron_lib import context
 
 from networking_sfc.db import flowclassifier_db as fdb
 from networking_sfc.db import sfc_db
@@ -309,6 +310,20 @@ class SfcDbPluginTestCase(
             self._test_create_port_chain({
                 'port_pair_groups': [pg['port_pair_group']['id']]})
 
+    def test_port_chain_status(self):
+        with self.port_pair_group(port_pair_group={}) as pg:
+            with self.port_chain(port_chain={
+                'port_pair_groups': [pg['port_pair_group']['id']]
+            }) as pc:
+                pc_id = pc['port_chain']['id']
+                self.assertEqual('active', pc['port_chain']['status'])
+                self.sfc_plugin._set_port_chain_status(
+                    context.get_admin_context(), pc_id, 'error')
+                req = self.new_show_request('port_chains', pc_id)
+                res = self.deserialize(
+                    self.fmt, req.get_response(self.ext_api))
+                self.assertEqual('error', res['port_chain']['status'])
+
     def test_quota_create_port_chain(self):
         cfg.CONF.set_override('quota_port_chain', 3, group='QUOTAS')
         with self.port_pair_group(
@@ -460,6 +475,31 @@ class SfcDbPluginTestCase(
                 }, expected_res_status=400
             )
 
+    def test_create_port_chains_reuse_free_chain_id(self):
+        with self.port_pair_group(
+            port_pair_group={}
+        ) as pg1, self.port_pair_group(
+            port_pair_group={}
+        ) as pg2, self.port_pair_group(
+            port_pair_group={}
+        ) as pg3, self.port_pair_group(
+            port_pair_group={}
+        ) as pg4:
+            with self.port_chain(port_chain={
+                'port_pair_groups': [pg1['port_pair_group']['id']],
+                'chain_id': 1
+            }), self.port_chain(port_chain={
+                'port_pair_groups': [pg2['port_pair_group']['id']],
+                'chain_id': 3
+            }):
+                with self.port_chain(port_chain={
+                    'port_pair_groups': [pg3['port_pair_group']['id']]
+                }) as pc3, self.port_chain(port_chain={
+                    'port_pair_groups': [pg4['port_pair_group']['id']]
+                }) as pc4:
+                    self.assertEqual(2, pc3['port_chain']['chain_id'])
+                    self.assertEqual(4, pc4['port_chain']['chain_id'])
+
     def test_create_port_chain_with_none_flow_classifiers(self):
         with self.port_pair_group(port_pair_group={}) as pg:
             self._test_create_port_chain({
@@ -1333,6 +1373,27 @@ class SfcDbPluginTestCase(
                     ]
                 })
 
+    def test_create_port_pair_groups_reuse_free_group_id(self):
+        with self.port_pair_group(
+            port_pair_group={}
+        ) as pg1, self.port_pair_group(
+            port_pair_group={}, do_delete=False
+        ) as pg2, self.port_pair_group(
+            port_pair_group={}
+        ) as pg3:
+            self.assertEqual(1, pg1['port_pair_group']['group_id'])
+            self.assertEqual(2, pg2['port_pair_group']['group_id'])
+            self.assertEqual(3, pg3['port_pair_group']['group_id'])
+            self._delete(
+                'port_pair_groups', pg2['port_pair_group']['id'])
+            with self.port_pair_group(port_pair_group={}) as pg4:
+                self.assertEqual(2, pg4['port_pair_group']['group_id'])
+            with self.port_pair_group(port_pair_group={}) as pg5:
+                self.assertEqual(2, pg5['port_pair_group']['group_id'])
+                with self.port_pair_group(port_pair_group={}) as pg6:
+                    self.assertEqual(
+                        4, pg6['port_pair_group']['group_id'])
+
     def test_create_port_pair_group_with_nouuid_port_pair_id(self):
         self._create_port_pair_group(
             self.fmt, {'port_pairs': ['unknown']},
@@ -1520,6 +1581,133 @@ class SfcDbPluginTestCase(
                 'egress': dst_port['port']['id']
             })
 
+    def _port_pair_bulk_item(self, ingress, egress):
+        return {'port_pair': {
+            'project_id': self._tenant_id,
+            'name': '', 'description': '',
+            'ingress': ingress, 'egress': egress,
+            'service_function_parameters': {
+                'correlation': None, 'weight': 1}
+        }}
+
+    def test_create_port_pair_bulk(self):
+        with self.port(
+            name='port1',
+            device_id='default'
+        ) as port1, self.port(
+            name='port2',
+            device_id='default'
+        ) as port2:
+            ports = [port1['port']['id'], port2['port']['id']]
+            ctx = context.get_admin_context()
+            pps = self.sfc_plugin.create_port_pair_bulk(ctx, {
+                'port_pairs': [
+                    self._port_pair_bulk_item(ports[0], ports[1]),
+                    self._port_pair_bulk_item(ports[1], ports[0])
+                ]
+            })
+            self.assertEqual(
+                [(ports[0], ports[1]), (ports[1], ports[0])],
+                [(pp['ingress'], pp['egress']) for pp in pps])
+            self.assertItemsEqual(
+                [pp['id'] for pp in pps],
+                [pp['id'] for pp in self.sfc_plugin.get_port_pairs(ctx)])
+            for pp in pps:
+                self.sfc_plugin.delete_port_pair(ctx, pp['id'])
+
+    def test_create_port_pair_bulk_ingress_egress_in_use(self):
+        with self.port(
+            name='port1',
+            device_id='default'
+        ) as port1, self.port(
+            name='port2',
+            device_id='default'
+        ) as port2:
+            ingress, egress = port1['port']['id'], port2['port']['id']
+            ctx = context.get_admin_context()
+            self.assertRaises(
+                sfc.PortPairIngressEgressInUse,
+                self.sfc_plugin.create_port_pair_bulk, ctx, {
+                    'port_pairs': [
+                        self._port_pair_bulk_item(ingress, egress),
+                        self._port_pair_bulk_item(ingress, egress)
+                    ]
+                })
+            self.assertEqual([], self.sfc_plugin.get_port_pairs(ctx))
+
+    def test_create_port_pair_bulk_port_not_found(self):
+        with self.port(
+            name='port1',
+            device_id='default'
+        ) as port1:
+            ctx = context.get_admin_context()
+            self.assertRaises(
+                sfc.PortPairPortNotFound,
+                self.sfc_plugin.create_port_pair_bulk, ctx, {
+                    'port_pairs': [self._port_pair_bulk_item(
+                        port1['port']['id'], uuidutils.generate_uuid())]
+                })
+
+    def _port_pair_group_bulk_item(self, port_pairs):
+        return {'port_pair_group': {
+            'project_id': self._tenant_id,
+            'name': '', 'description': '',
+            'port_pairs': port_pairs,
+            'port_pair_group_parameters': {'lb_fields': []}
+        }}
+
+    def test_create_port_pair_group_bulk(self):
+        with self.port(
+            name='port1',
+            device_id='default'
+        ) as port1, self.port(
+            name='port2',
+            device_id='default'
+        ) as port2, self.port_pair(port_pair={
+            'ingress': port1['port']['id'],
+            'egress': port1['port']['id']
+        }) as pp1, self.port_pair(port_pair={
+            'ingress': port2['port']['id'],
+            'egress': port2['port']['id']
+        }) as pp2, self.port_pair_group(port_pair_group={}) as pg:
+            ctx = context.get_admin_context()
+            pp_ids = [pp1['port_pair']['id'], pp2['port_pair']['id']]
+            pgs = self.sfc_plugin.create_port_pair_group_bulk(ctx, {
+                'port_pair_groups': [
+                    self._port_pair_group_bulk_item([pp_ids[0]]),
+                    self._port_pair_group_bulk_item([pp_ids[1]])
+                ]
+            })
+            self.assertEqual([[pp_ids[0]], [pp_ids[1]]],
+                             [created['port_pairs'] for created in pgs])
+            # the group ids are allocated after the existing one
+            self.assertEqual(
+                [pg['port_pair_group']['group_id'] + 1,
+                 pg['port_pair_group']['group_id'] + 2],
+                [created['group_id'] for created in pgs])
+            for created in pgs:
+                self.sfc_plugin.delete_port_pair_group(ctx, created['id'])
+
+    def test_create_port_pair_group_bulk_port_pair_in_use(self):
+        with self.port(
+            name='port1',
+            device_id='default'
+        ) as port1, self.port_pair(port_pair={
+            'ingress': port1['port']['id'],
+            'egress': port1['port']['id']
+        }) as pp:
+            ctx = context.get_admin_context()
+            pp_id = pp['port_pair']['id']
+            self.assertRaises(
+                sfc.PortPairInUse,
+                self.sfc_plugin.create_port_pair_group_bulk, ctx, {
+                    'port_pair_groups': [
+                        self._port_pair_group_bulk_item([pp_id]),
+                        self._port_pair_group_bulk_item([pp_id])
+                    ]
+                })
+            self.assertEqual([], self.sfc_plugin.get_port_pair_groups(ctx))
+
     def test_quota_create_port_pair_quota(self):
         cfg.CONF.set_override('quota_port_pair', 3, group='QUOTAS')
         with self.port(
@@ -76,6 +76,12 @@ class DriverManagerTestCase(base.BaseTestCase):
     def test_create_flow_classifier_postcommit_exception(self):
         self._test_method_exception("create_flow_classifier_postcommit")
 
+    def test_create_flow_classifier_bulk_postcommit_called(self):
+        self._test_method_called("create_flow_classifier_bulk_postcommit")
+
+    def test_create_flow_classifier_bulk_postcommit_exception(self):
+        self._test_method_exception("create_flow_classifier_bulk_postcommit")
+
     def test_update_flow_classifier_precommit_called(self):
         self._test_method_called("update_flow_classifier_precommit")
 
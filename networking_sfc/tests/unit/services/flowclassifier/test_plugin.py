@@ -14,6 +14,7 @@
 
 import copy
 import mock
+from neutron_lib import context
 
 from networking_sfc.services.flowclassifier.common import context as fc_ctx
 from networking_sfc.services.flowclassifier.common import exceptions as fc_exc
@@ -147,6 +148,83 @@ class FlowClassifierPluginTestCase(
              .assert_not_called())
             self._test_list_resources('flow_classifier', [])
 
+    def test_create_flow_classifier_bulk_driver_manager_called(self):
+        with self.port(
+            name='test1'
+        ) as port:
+            port_id = port['port']['id']
+            ctx = context.get_admin_context()
+            fcs = self.flowclassifier_plugin.create_flow_classifier_bulk(
+                ctx, {'flow_classifiers': [
+                    self._flow_classifier_bulk_item('10.100.0.0/16', port_id),
+                    self._flow_classifier_bulk_item('10.101.0.0/16', port_id)
+                ]})
+            driver_manager = self.fake_driver_manager
+            self.assertEqual(
+                2, driver_manager.create_flow_classifier_precommit.call_count)
+            (driver_manager.create_flow_classifier_postcommit
+             .assert_not_called())
+            (driver_manager.create_flow_classifier_bulk_postcommit
+             .assert_called_once_with(mock.ANY))
+            contexts = (driver_manager.create_flow_classifier_bulk_postcommit
+                        .call_args[0][0])
+            for fc_context in contexts:
+                self.assertIsInstance(
+                    fc_context, fc_ctx.FlowClassifierContext)
+            self.assertEqual(fcs, [c.current for c in contexts])
+            for fc in fcs:
+                self.flowclassifier_plugin.delete_flow_classifier(
+                    ctx, fc['id'])
+
+    def test_create_flow_classifier_bulk_api(self):
+        with self.port(
+            name='test1'
+        ) as port:
+            req = self.new_create_request(
+                'flow_classifiers', {'flow_classifiers': [
+                    {'source_ip_prefix': prefix,
+                     'logical_source_port': port['port']['id'],
+                     'tenant_id': self._tenant_id}
+                    for prefix in ('10.100.0.0/16', '10.101.0.0/16')
+                ]}, self.fmt)
+            res = req.get_response(self.ext_api)
+            self.assertEqual(201, res.status_int)
+            fcs = self.deserialize(self.fmt, res)['flow_classifiers']
+            self.assertEqual(2, len(fcs))
+            driver_manager = self.fake_driver_manager
+            (driver_manager.create_flow_classifier_bulk_postcommit
+             .assert_called_once_with(mock.ANY))
+            for fc in fcs:
+                self._delete('flow_classifiers', fc['id'])
+
+    def test_create_flow_classifier_bulk_postcommit_driver_manager_exception(
+        self
+    ):
+        (self.fake_driver_manager
+         .create_flow_classifier_bulk_postcommit) = mock.Mock(
+            side_effect=fc_exc.FlowClassifierDriverError(
+                method='create_flow_classifier_bulk_postcommit'
+            )
+        )
+        with self.port(
+            name='test1'
+        ) as port:
+            port_id = port['port']['id']
+            ctx = context.get_admin_context()
+            self.assertRaises(
+                fc_exc.FlowClassifierDriverError,
+                self.flowclassifier_plugin.create_flow_classifier_bulk,
+                ctx, {'flow_classifiers': [
+                    self._flow_classifier_bulk_item('10.100.0.0/16', port_id),
+                    self._flow_classifier_bulk_item('10.101.0.0/16', port_id)
+                ]})
+            driver_manager = self.fake_driver_manager
+            self.assertEqual(
+                2, driver_manager.delete_flow_classifier.call_count)
+            self.assertEqual(
+                2, driver_manager.delete_flow_classifier_postcommit.call_count)
+            self._test_list_resources('flow_classifier', [])
+
     def test_update_flow_classifier_driver_manager_called(self):
         self.fake_driver_manager.update_flow_classifier_precommit = mock.Mock(
             side_effect=self._record_context_precommit)
@@ -21,6 +21,8 @@ from oslo_utils import uuidutils
 
 from neutron.agent.common import ovs_lib
 from neutron.agent.common import utils
+from neutron.plugins.ml2.drivers.openvswitch.agent.common import constants \
+    as ovs_consts
 from neutron.plugins.ml2.drivers.openvswitch.agent import (
     ovs_agent_extension_api as ovs_ext_api)
 from neutron.plugins.ml2.drivers.openvswitch.agent.openflow.ovs_ofctl import (
@@ -31,6 +33,7 @@ from neutron.tests.unit.plugins.ml2.drivers.openvswitch.agent import (
 
 from networking_sfc.services.sfc.agent.extensions.openvswitch import sfc_driver
 from networking_sfc.services.sfc.common import ovs_ext_lib
+from networking_sfc.services.sfc.drivers.ovs import constants
 
 
 class SfcAgentDriverTestCase(ovs_test_base.OVSOFCtlTestBase):
@@ -38,6 +41,7 @@ class SfcAgentDriverTestCase(ovs_test_base.OVSOFCtlTestBase):
         self.executed_cmds = []
         self.node_flowrules = []
         self.added_flows = []
+        self.added_cookies = []
         self.deleted_flows = []
         self.group_mapping = {}
         self.deleted_groups = []
@@ -175,6 +179,11 @@ class SfcAgentDriverTestCase(ovs_test_base.OVSOFCtlTestBase):
             self.mock_delete_group
         )
         self.delete_group.start()
+        self.hash_selection_supported = mock.patch.object(
+            sfc_driver.SfcOVSAgentDriver, "_hash_selection_supported",
+            return_value=True
+        )
+        self.hash_selection_supported.start()
 
         self.sfc_driver = sfc_driver.SfcOVSAgentDriver()
         self.agent_api = ovs_ext_api.OVSAgentExtensionAPI(
@@ -323,6 +332,10 @@ class SfcAgentDriverTestCase(ovs_test_base.OVSOFCtlTestBase):
         pass
 
     def mock_add_flow(self, *args, **kwargs):
+        # the flow cookies are checked apart from the flows
+        cookie = kwargs.pop('cookie', None)
+        if cookie is not None:
+            self.added_cookies.append(cookie)
         if kwargs not in self.added_flows:
             self.added_flows.append(kwargs)
 
@@ -377,6 +390,7 @@ class SfcAgentDriverTestCase(ovs_test_base.OVSOFCtlTestBase):
         self.add_group.stop()
         self.mod_group.stop()
         self.delete_group.stop()
+        self.hash_selection_supported.stop()
         self._clear_local_entries()
         super(SfcAgentDriverTestCase, self).tearDown()
 
@@ -461,6 +475,39 @@ class SfcAgentDriverTestCase(ovs_test_base.OVSOFCtlTestBase):
             self.group_mapping
         )
 
+    def test_update_flow_rules_sf_node_flow_transaction(self):
+        cfg.CONF.set_override('flow_transaction', True, 'sfc_agent')
+        self._prepare_update_flow_rules_sf_node_empty_next_hops('mpls', None)
+        self.assertEqual([], self.added_flows)
+        self.assertEqual(
+            1,
+            len([cmd for cmd in self.executed_cmds if 'add-flows' in cmd])
+        )
+
+    def test_flow_transaction_failure_resyncs_group_cache(self):
+        cfg.CONF.set_override('flow_transaction', True, 'sfc_agent')
+        self.sfc_driver.group_cache = {1: None, 2: {'type': 'select'},
+                                       3: {'type': 'select'}}
+        br_int = self.sfc_driver.br_int
+        with mock.patch.object(br_int, 'dump_group_ids',
+                               return_value={1, 2, 4}):
+            def _install_and_fail():
+                with self.sfc_driver._flow_transaction():
+                    self.sfc_driver._install_group(
+                        4, 'bucket=weight=1,resubmit(,5)')
+                    raise RuntimeError()
+
+            self.assertRaises(RuntimeError, _install_and_fail)
+        # group 3 is gone from the switch, group 2 is modified when
+        # installed again and groups 1 and 4 are still unknown
+        self.assertEqual({1: None, 2: {}, 4: None},
+                         self.sfc_driver.group_cache)
+
+    def test_native_driver_requires_native_bridge(self):
+        native_driver = sfc_driver.SfcOVSNativeAgentDriver()
+        native_driver.consume_api(self.agent_api)
+        self.assertRaises(RuntimeError, native_driver.initialize)
+
     def test_update_flow_rules_src_node_empty_next_hops(self):
         self.port_mapping = {
             '2f1d2140-42ce-4979-9542-7ef25796e536': {
@@ -881,6 +928,67 @@ class SfcAgentDriverTestCase(ovs_test_base.OVSOFCtlTestBase):
             self.group_mapping
         )
 
+    def test_update_flow_rules_src_node_next_hops_group_cache(self):
+        self._prepare_update_flow_rules_src_node_next_hops_add_fcs(
+            'mpls', None)
+        self.group_mapping = {}
+        self._prepare_update_flow_rules_src_node_next_hops_add_fcs(
+            'mpls', None)
+        # the unchanged group is neither added nor modified again
+        self.assertEqual({}, self.group_mapping)
+        self.assertEqual(
+            {
+                1: {
+                    'buckets': (
+                        'bucket=weight=1, '
+                        'mod_dl_dst:12:34:56:78:cf:23, '
+                        'resubmit(,5)'
+                    ),
+                    'type': 'select'
+                }
+            },
+            self.sfc_driver.group_cache
+        )
+
+    def test_install_group_add_then_mod(self):
+        br_int = self.sfc_driver.br_int
+        with mock.patch.object(br_int, 'add_group') as add_group, \
+                mock.patch.object(br_int, 'mod_group') as mod_group:
+            self.sfc_driver._install_group(1, 'bucket=weight=1,resubmit(,5)')
+            self.sfc_driver._install_group(1, 'bucket=weight=2,resubmit(,5)')
+        add_group.assert_called_once_with(
+            group_id=1, type='select', buckets='bucket=weight=1,resubmit(,5)')
+        mod_group.assert_called_once_with(
+            group_id=1, type='select', buckets='bucket=weight=2,resubmit(,5)')
+        self.sfc_driver._delete_group(1)
+        self.assertEqual({}, self.sfc_driver.group_cache)
+        self.assertEqual([1], self.deleted_groups)
+
+    def test_install_group_lb_fields(self):
+        br_int = self.sfc_driver.br_int
+        with mock.patch.object(br_int, 'add_group') as add_group, \
+                mock.patch.object(br_int, 'mod_group') as mod_group:
+            self.sfc_driver._install_group(
+                1, 'bucket=weight=3,resubmit(,5)', ['ip_src', 'tcp_dst'])
+            self.sfc_driver._install_group(
+                1, 'bucket=weight=3,resubmit(,5)', ['ip_src', 'tcp_dst'])
+            self.sfc_driver._install_group(
+                1, 'bucket=weight=3,resubmit(,5)', [])
+        add_group.assert_called_once_with(
+            group_id=1, type='select', buckets='bucket=weight=3,resubmit(,5)',
+            selection_method='hash', fields='ip_src,tcp_dst')
+        # dropping the fields reverts to the default selection method
+        mod_group.assert_called_once_with(
+            group_id=1, type='select', buckets='bucket=weight=3,resubmit(,5)')
+
+    def test_install_group_seeded_from_dump(self):
+        self.sfc_driver.group_cache = {1: None}
+        with mock.patch.object(self.sfc_driver.br_int,
+                               'mod_group') as mod_group:
+            self.sfc_driver._install_group(1, 'bucket=weight=1,resubmit(,5)')
+        mod_group.assert_called_once_with(
+            group_id=1, type='select', buckets='bucket=weight=1,resubmit(,5)')
+
     def test_update_flow_rules_src_node_next_hops_add_fcs_no_proxy(self):
         self._prepare_update_flow_rules_src_node_next_hops_add_fcs(
             'mpls', 'mpls')
@@ -2551,8 +2659,8 @@ class SfcAgentDriverTestCase(ovs_test_base.OVSOFCtlTestBase):
     def test_init_agent_empty_flowrules(self):
         # in setUp we call _clear_local_entries() so whatever was done
         # during initialize() is lost ; here, we really want to check the
-        # _clear_sfc_flow_on_int_br done at initialize
-        self.sfc_driver._clear_sfc_flow_on_int_br()
+        # _setup_sfc_flows_on_int_br done at initialize
+        self.sfc_driver._setup_sfc_flows_on_int_br()
         self.assertEqual(
             [{
                 'actions': 'resubmit(,10)',
@@ -2566,8 +2674,288 @@ class SfcAgentDriverTestCase(ovs_test_base.OVSOFCtlTestBase):
             }],
             self.added_flows
         )
+        # the flows and groups of the chains are kept
+        self.assertEqual([], self.deleted_flows)
+        self.assertEqual([], self.deleted_groups)
+
+    def test_update_flow_rules_flow_cookies(self):
+        self._prepare_update_flow_rules_sf_node_empty_next_hops('mpls', None)
+        self.assertEqual(1, len(self.added_cookies))
+        cookie = self.added_cookies[0]
         self.assertEqual(
-            ["all"],
-            self.deleted_groups
+            sfc_driver.SFC_COOKIE_PREFIX,
+            cookie & sfc_driver.SFC_COOKIE_PREFIX_MASK)
+        self.assertEqual(
+            256 << 8 | 254,
+            cookie >> sfc_driver.SFC_COOKIE_PATH_SHIFT &
+            sfc_driver.SFC_COOKIE_PATH_MASK)
+
+        # the same flows get the same cookies after a restart
+        self._clear_local_entries()
+        self._prepare_update_flow_rules_sf_node_empty_next_hops('mpls', None)
+        self.assertEqual([cookie], self.added_cookies)
+        self._clear_local_entries()
+        self._prepare_update_flow_rules_sf_node_empty_next_hops('mpls',
+                                                                'mpls')
+        self.assertNotEqual([cookie], self.added_cookies)
+
+    def test_update_flow_rules_reserve_cookies(self):
+        self._prepare_update_flow_rules_sf_node_empty_next_hops('mpls', None)
+        cookie = self.added_cookies[0]
+        # the agent keeps the SFC flows, and the other flows of the
+        # extension, when it cleans br-int
+        reserved_cookies = self.agent_api.br_int.reserved_cookies
+        self.assertIn(cookie, reserved_cookies)
+        self.assertIn(self.sfc_driver.br_int.default_cookie,
+                      reserved_cookies)
+
+    def test_delete_flows_present_cookies(self):
+        cookie = sfc_driver.SFC_COOKIE_PREFIX | 1
+        other_cookie = sfc_driver.SFC_COOKIE_PREFIX | 2
+        self.sfc_driver._present_cookies = {cookie, other_cookie}
+        with mock.patch.object(
+            ovs_ext_lib.SfcOVSBridgeExt, 'dump_flow_cookies',
+            return_value={cookie}
+        ) as dump_flow_cookies:
+            self.sfc_driver._delete_flows(table=0, in_port=42)
+            dump_flow_cookies.assert_called_once_with(
+                sfc_driver.SFC_COOKIE_PREFIX,
+                sfc_driver.SFC_COOKIE_PREFIX_MASK,
+                table=0, in_port=42)
+            # only the flows found at start which were deleted are
+            # installed again
+            self.assertEqual({other_cookie},
+                             self.sfc_driver._present_cookies)
+
+            # nothing to look up once no flow found at start is left
+            self.sfc_driver._present_cookies = set()
+            dump_flow_cookies.reset_mock()
+            self.sfc_driver._delete_flows(table=0, in_port=42)
+            self.assertFalse(dump_flow_cookies.called)
+        self.assertEqual([{'table': 0, 'in_port': 42}] * 2,
+                         self.deleted_flows)
+
+    def test_init_agent_reconcile_flowrules(self):
+        self._prepare_update_flow_rules_sf_node_empty_next_hops('mpls', None)
+        cookie = self.added_cookies[0]
+        stale_cookie = sfc_driver.SFC_COOKIE_PREFIX | 1
+        self._clear_local_entries()
+
+        with mock.patch.object(
+            ovs_ext_lib.SfcOVSBridgeExt, 'dump_flow_cookies',
+            return_value={cookie, stale_cookie}
+        ), mock.patch.object(
+            ovs_ext_lib.SfcOVSBridgeExt, 'dump_group_ids',
+            return_value={1}
+        ):
+            self.sfc_driver.initialize()
+        self._clear_local_entries()
+
+        self._prepare_update_flow_rules_sf_node_empty_next_hops('mpls', None)
+        self.assertEqual([], self.added_flows)
+        self.assertEqual([], self.deleted_flows)
+        self.assertEqual([], self.deleted_groups)
+
+        self.sfc_driver.finish_sync()
+        self.assertEqual(
+            [{'cookie': '0x%x/0x%x' % (stale_cookie,
+                                       sfc_driver.UINT64_BITMASK)}],
+            self.deleted_flows)
+        self.assertEqual([1], self.deleted_groups)
+        self.assertEqual({cookie}, self.sfc_driver.br_int.reserved_cookies)
+
+        # once synchronized, flows are installed again when asked for
+        self._prepare_update_flow_rules_sf_node_empty_next_hops('mpls', None)
+        self.assertEqual([cookie], self.added_cookies)
+        self.sfc_driver.finish_sync()
+        self.assertEqual([1], self.deleted_groups)
+
+    def test_hash_selection_supported(self):
+        self.hash_selection_supported.stop()
+        with mock.patch.object(self.sfc_driver.br_int, 'ovsdb') as ovsdb:
+            ovsdb.db_get.return_value.execute.return_value = '2.3.2'
+            self.assertFalse(self.sfc_driver._hash_selection_supported())
+            ovsdb.db_get.return_value.execute.return_value = '2.5.0'
+            self.assertTrue(self.sfc_driver._hash_selection_supported())
+        self.hash_selection_supported.start()
+
+    def test_initialize_protocols(self):
+        with mock.patch.object(ovs_ext_lib.SfcOVSBridgeExt,
+                               'set_protocols') as set_protocols:
+            self.sfc_driver.initialize()
+            set_protocols.assert_called_once_with(
+                sfc_driver.SfcOVSAgentDriver.REQUIRED_PROTOCOLS +
+                [ovs_consts.OPENFLOW15],
+                of_version=ovs_consts.OPENFLOW13)
+            set_protocols.reset_mock()
+            with mock.patch.object(sfc_driver.SfcOVSAgentDriver,
+                                   '_hash_selection_supported',
+                                   return_value=False):
+                self.sfc_driver.initialize()
+            set_protocols.assert_called_once_with(
+                sfc_driver.SfcOVSAgentDriver.REQUIRED_PROTOCOLS,
+                of_version=ovs_consts.OPENFLOW13)
+        self._clear_local_entries()
+
+    def test_install_group_lb_fields_unsupported(self):
+        self.sfc_driver.hash_selection = False
+        with mock.patch.object(self.sfc_driver.br_int,
+                               'add_group') as add_group:
+            self.sfc_driver._install_group(
+                1, 'bucket=weight=3,resubmit(,5)', ['ip_src'])
+        add_group.assert_called_once_with(
+            group_id=1, type='select', buckets='bucket=weight=3,resubmit(,5)')
+
+    def test_conjunction_supported(self):
+        with mock.patch.object(self.sfc_driver.br_int, 'ovsdb') as ovsdb:
+            ovsdb.db_get.return_value.execute.return_value = '2.3.2'
+            self.assertFalse(self.sfc_driver._conjunction_supported())
+            ovsdb.db_get.return_value.execute.return_value = '2.5.0'
+            self.assertTrue(self.sfc_driver._conjunction_supported())
+            ovsdb.db_get.return_value.execute.side_effect = RuntimeError()
+            self.assertFalse(self.sfc_driver._conjunction_supported())
+
+    def _init_conjunction(self, supported):
+        cfg.CONF.set_override('conjunction_classification', True,
+                              'sfc_agent')
+        with mock.patch.object(sfc_driver.SfcOVSAgentDriver,
+                               '_conjunction_supported',
+                               return_value=supported):
+            self.sfc_driver.initialize()
+        self._clear_local_entries()
+
+    def _update_flow_rules_src_node_port_ranges(self, add_fcs, del_fcs):
+        self.port_mapping = {
+            '9bedd01e-c216-4dfd-b48e-fbd5c8212ba4': {
+                'port_name': 'dst_port',
+                'ofport': 42,
+                'vif_mac': '00:01:02:03:06:08',
+            }
+        }
+        status = []
+        self.sfc_driver.update_flow_rules(
+            {
+                'nsi': 255,
+                'ingress': None,
+                'next_hops': None,
+                'del_fcs': del_fcs,
+                'group_refcnt': 1,
+                'node_type': 'src_node',
+                'egress': u'9bedd01e-c216-4dfd-b48e-fbd5c8212ba4',
+                'next_group_id': None,
+                'nsp': 256,
+                'add_fcs': add_fcs,
+                'id': uuidutils.generate_uuid(),
+                'fwd_path': True,
+                'pc_corr': 'mpls',
+                'pp_corr': None,
+            },
+            status
         )
-        self.assertEqual({}, self.group_mapping)
+        self.assertEqual(
+            [constants.STATUS_ACTIVE],
+            [flowrule_status['status'] for flowrule_status in status])
+
+    def _get_port_range_fc(self, destination_port_range_max):
+        return {
+            'source_port_range_min': 101,
+            'destination_ip_prefix': u'10.200.0.0/16',
+            'protocol': u'tcp',
+            'l7_parameters': {},
+            'source_port_range_max': 102,
+            'source_ip_prefix': u'10.100.0.0/16',
+            'destination_port_range_min': 101,
+            'ethertype': u'IPv4',
+            'destination_port_range_max': destination_port_range_max,
+        }
+
+    def _get_clause_flow(self, actions, **kwargs):
+        flow = {
+            'actions': actions,
+            'dl_type': 2048,
+            'in_port': 42,
+            'nw_dst': u'10.200.0.0/16',
+            'nw_proto': 6,
+            'nw_src': u'10.100.0.0/16',
+            'priority': 30,
+            'table': 0
+        }
+        flow.update(kwargs)
+        return flow
+
+    def test_update_flow_rules_conjunction(self):
+        self._init_conjunction(True)
+        self._update_flow_rules_src_node_port_ranges(
+            [self._get_port_range_fc(104)], [])
+
+        conj_id = list(self.sfc_driver._conj_ids.values())[0]
+        src_clause = 'conjunction(%d,1/2)' % conj_id
+        dst_clause = 'conjunction(%d,2/2)' % conj_id
+        self.assertEqual(
+            [{'actions': 'normal', 'conj_id': conj_id, 'priority': 30,
+              'table': 0},
+             self._get_clause_flow(src_clause, tp_src='0x65/0xffff'),
+             self._get_clause_flow(src_clause, tp_src='0x66/0xffff'),
+             self._get_clause_flow(dst_clause, tp_dst='0x65/0xffff'),
+             self._get_clause_flow(dst_clause, tp_dst='0x66/0xfffe'),
+             self._get_clause_flow(dst_clause, tp_dst='0x68/0xffff')],
+            self.added_flows
+        )
+
+    def test_update_flow_rules_conjunction_shared_clauses(self):
+        self._init_conjunction(True)
+        self._update_flow_rules_src_node_port_ranges(
+            [self._get_port_range_fc(102), self._get_port_range_fc(104)],
+            [])
+        self.assertEqual(2, len(self.sfc_driver._conj_ids))
+        conj_ids = sorted(self.sfc_driver._conj_ids.values())
+        self.assertIn(
+            self._get_clause_flow(
+                'conjunction(%d,1/2),conjunction(%d,1/2)' % tuple(conj_ids),
+                tp_src='0x65/0xffff'),
+            self.added_flows)
+
+        # the clauses of the deleted conjunction are removed from the
+        # flows shared with the other one
+        conj_id = self.sfc_driver._conj_ids[
+            [key for key in self.sfc_driver._conj_ids
+             if key[3] == ('0x65/0xffff', '0x66/0xffff')][0]]
+        other_conj_id = [cid for cid in conj_ids if cid != conj_id][0]
+        self._clear_local_entries()
+        self._update_flow_rules_src_node_port_ranges(
+            [], [self._get_port_range_fc(102)])
+        self.assertEqual([other_conj_id],
+                         list(self.sfc_driver._conj_ids.values()))
+        self.assertEqual({other_conj_id}, self.sfc_driver._used_conj_ids)
+        self.assertEqual(
+            [self._get_clause_flow('conjunction(%d,1/2)' % other_conj_id,
+                                   tp_src='0x65/0xffff'),
+             self._get_clause_flow('conjunction(%d,1/2)' % other_conj_id,
+                                   tp_src='0x66/0xffff'),
+             self._get_clause_flow('conjunction(%d,2/2)' % other_conj_id,
+                                   tp_dst='0x65/0xffff')],
+            self.added_flows)
+        self.assertEqual(
+            [{'conj_id': conj_id, 'priority': 30, 'table': 0},
+             {'dl_type': 2048, 'in_port': 42, 'nw_dst': u'10.200.0.0/16',
+              'nw_proto': 6, 'nw_src': u'10.100.0.0/16', 'priority': 30,
+              'table': 0, 'tp_dst': '0x66/0xffff'}],
+            self.deleted_flows)
+
+    def test_get_conj_id_collision(self):
+        conj_key = (30, (('in_port', 42),), ('0x65/0xffff',), ())
+        conj_id = self.sfc_driver._get_conj_id(conj_key)
+        # the id derived from the key is taken by another conjunction
+        self.sfc_driver._conj_ids[('other',)] = conj_id
+        self.sfc_driver._used_conj_ids.add(conj_id)
+        self.assertEqual((conj_id + 1) & sfc_driver.CONJUNCTION_ID_MASK,
+                         self.sfc_driver._get_conj_id(conj_key))
+
+    def test_update_flow_rules_conjunction_unsupported(self):
+        self._init_conjunction(False)
+        self._update_flow_rules_src_node_port_ranges(
+            [self._get_port_range_fc(104)], [])
+        self.assertEqual(6, len(self.added_flows))
+        self.assertEqual({}, self.sfc_driver._conj_ids)
+        for flow in self.added_flows:
+            self.assertEqual('normal', flow['actions'])
@@ -21,6 +21,7 @@ from neutron.plugins.ml2.drivers.openvswitch.agent.openflow.ovs_ofctl import (
     ovs_bridge)
 from neutron.tests import base
 from neutron_lib import context
+from oslo_config import cfg
 
 from networking_sfc.services.sfc.agent.extensions import sfc
 
@@ -43,15 +44,158 @@ class SfcAgentExtensionTestCase(base.BaseTestCase):
         self.sfc_ext.consume_api(self.agent_api)
 
         # Don't rely on used driver
+        self.sync_port_ids = set()
         mock.patch(
             'neutron.manager.NeutronManager.load_class_for_provider',
-            return_value=lambda: mock.Mock(spec=sfc.SfcAgentDriver)
+            return_value=self._mock_driver
         ).start()
 
         self.sfc_ext.initialize(
             self.connection, constants.EXTENSION_DRIVER_TYPE)
 
+    def _mock_driver(self):
+        driver = mock.Mock(spec=sfc.SfcAgentDriver)
+        driver.get_sync_port_ids.return_value = self.sync_port_ids
+        return driver
+
     def test_update_empty_flow_rules(self):
         self.sfc_ext.update_flow_rules(self.context, flowrule_entries={})
 
         self.assertFalse(self.sfc_ext.sfc_driver.update_flow_rules.called)
+
+    def test_process_flow_rules(self):
+        update_rule = {'id': 'rule1'}
+        delete_rule = {'id': 'rule2'}
+        self.sfc_ext.process_flow_rules(
+            self.context,
+            flowrule_entries=[
+                {'operation': 'delete', 'flowrule': delete_rule},
+                {'operation': 'update', 'flowrule': update_rule}
+            ])
+
+        self.sfc_ext.sfc_driver.delete_flow_rule.assert_called_once_with(
+            delete_rule, [])
+        self.sfc_ext.sfc_driver.update_flow_rules.assert_called_once_with(
+            update_rule, [])
+
+    def test_process_empty_flow_rules(self):
+        self.sfc_ext.process_flow_rules(self.context, flowrule_entries=[])
+
+        self.assertFalse(self.sfc_ext.sfc_driver.update_flow_rules.called)
+        self.assertFalse(self.sfc_ext.sfc_driver.delete_flow_rule.called)
+
+    def _mock_host_flowrules(self, pages):
+        rpc = mock.Mock()
+        rpc.get_flowrules_by_host.side_effect = pages
+        rpc.get_flowrules_by_host_portid.return_value = [{'id': 'rule3'}]
+        self.sfc_ext.sfc_plugin_rpc = rpc
+
+    def test_handle_port_uses_host_flowrules(self):
+        cfg.CONF.set_override('flowrules_page_size', 1, 'sfc_agent')
+        self._mock_host_flowrules([
+            {'port_details': [{'ingress': 'port1', 'egress': 'port2',
+                               'flowrules': [{'id': 'rule1'}]}],
+             'next_marker': 'detail1'},
+            {'port_details': [{'ingress': None, 'egress': 'port3',
+                               'flowrules': [{'id': 'rule2'}]}],
+             'next_marker': None}
+        ])
+        rpc = self.sfc_ext.sfc_plugin_rpc
+        driver = self.sfc_ext.sfc_driver
+
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port1'})
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port2'})
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port3'})
+
+        rpc.get_flowrules_by_host.assert_has_calls([
+            mock.call(self.context, marker=None, limit=1),
+            mock.call(self.context, marker='detail1', limit=1)])
+        self.assertFalse(rpc.get_flowrules_by_host_portid.called)
+        driver.update_flow_rules.assert_has_calls([
+            mock.call({'id': 'rule1'}, mock.ANY),
+            mock.call({'id': 'rule1'}, mock.ANY),
+            mock.call({'id': 'rule2'}, mock.ANY)])
+
+        # ports handled again or not on the host are fetched per port
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port1'})
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port4'})
+        self.assertEqual(2, rpc.get_flowrules_by_host.call_count)
+        rpc.get_flowrules_by_host_portid.assert_has_calls([
+            mock.call(self.context, 'port1'),
+            mock.call(self.context, 'port4')])
+
+    def test_handle_port_host_flowrules_failure(self):
+        self._mock_host_flowrules(Exception())
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port1'})
+
+        rpc = self.sfc_ext.sfc_plugin_rpc
+        rpc.get_flowrules_by_host_portid.assert_called_once_with(
+            self.context, 'port1')
+        self.sfc_ext.sfc_driver.update_flow_rules.assert_called_once_with(
+            {'id': 'rule3'}, [])
+
+    def test_flow_rule_notification_invalidates_host_flowrules(self):
+        self._mock_host_flowrules([
+            {'port_details': [{'ingress': 'port1', 'egress': 'port2',
+                               'flowrules': [{'id': 'rule1'}]}],
+             'next_marker': None}
+        ])
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port1'})
+        self.sfc_ext.process_flow_rules(self.context, flowrule_entries=[])
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port2'})
+
+        rpc = self.sfc_ext.sfc_plugin_rpc
+        rpc.get_flowrules_by_host_portid.assert_called_once_with(
+            self.context, 'port2')
+
+    def test_finish_sync_without_ports(self):
+        self.sfc_ext.sfc_driver.finish_sync.assert_called_once_with()
+
+    def test_finish_sync_once_ports_handled(self):
+        self.sync_port_ids.update(['port1', 'port2', 'port3'])
+        self.sfc_ext.initialize(
+            self.connection, constants.EXTENSION_DRIVER_TYPE)
+        self._mock_host_flowrules(Exception())
+        driver = self.sfc_ext.sfc_driver
+        driver.update_flow_rules.side_effect = [Exception(), None, None]
+
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port1'})
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port2'})
+        self.sfc_ext.delete_port(self.context, {'port_id': 'port3'})
+        self.assertFalse(driver.finish_sync.called)
+
+        # the port whose flow rules failed is handled again
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port1'})
+        driver.finish_sync.assert_called_once_with()
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port2'})
+        driver.finish_sync.assert_called_once_with()
+
+    @mock.patch('eventlet.spawn_after')
+    def test_finish_sync_timeout(self, mock_spawn_after):
+        self.sync_port_ids.update(['port1', 'port2'])
+        self.sfc_ext.initialize(
+            self.connection, constants.EXTENSION_DRIVER_TYPE)
+        self._mock_host_flowrules(Exception())
+        driver = self.sfc_ext.sfc_driver
+        self.assertEqual(cfg.CONF.sfc_agent.sync_timeout,
+                         mock_spawn_after.call_args[0][0])
+        sync_timed_out = mock_spawn_after.call_args[0][1]
+
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port1'})
+        self.assertFalse(driver.finish_sync.called)
+        # port2 is never handled
+        sync_timed_out()
+        driver.finish_sync.assert_called_once_with()
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port2'})
+        driver.finish_sync.assert_called_once_with()
+
+    @mock.patch('eventlet.spawn_after')
+    def test_finish_sync_cancels_timeout(self, mock_spawn_after):
+        self.sync_port_ids.add('port1')
+        self.sfc_ext.initialize(
+            self.connection, constants.EXTENSION_DRIVER_TYPE)
+        self._mock_host_flowrules(Exception())
+
+        self.sfc_ext.handle_port(self.context, {'port_id': 'port1'})
+        self.sfc_ext.sfc_driver.finish_sync.assert_called_once_with()
+        mock_spawn_after.return_value.cancel.assert_called_once_with()
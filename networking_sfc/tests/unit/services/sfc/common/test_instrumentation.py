@@ -0,0 +1,90 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo_serialization import jsonutils
+
+from neutron.tests import base
+
+from networking_sfc.services.sfc.common import instrumentation
+
+
+class FakeOperations(object):
+
+    @instrumentation.instrumented
+    def outer(self, payload):
+        self.inner(payload)
+        instrumentation.count_rpc_cast(payload)
+
+    @instrumentation.instrumented
+    def inner(self, payload):
+        instrumentation._count_query(None, None, 'SELECT 1', (), None, False)
+        instrumentation.count_rpc_cast(payload)
+
+
+class InstrumentationTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(InstrumentationTestCase, self).setUp()
+        self.registry = instrumentation.Registry()
+        mock.patch.object(instrumentation, 'REGISTRY', self.registry).start()
+        mock.patch.object(instrumentation, '_enabled', True).start()
+        self.operations = FakeOperations()
+
+    def test_histogram(self):
+        histogram = instrumentation.Histogram((1, 10))
+        for value in (0, 1, 5, 20, 30):
+            histogram.add(value)
+        self.assertEqual({
+            'sum': 56,
+            'max': 30,
+            'buckets': [[1, 2], [10, 1], [None, 2]]
+        }, histogram.to_dict())
+
+    def test_nested_measurements(self):
+        payload = {'host': 'host1', 'flows': ['flow']}
+        size = len(jsonutils.dumps(payload))
+        self.operations.outer(payload)
+        self.operations.inner(payload)
+        metrics = self.registry.snapshot()
+        self.assertEqual(
+            ['FakeOperations.inner', 'FakeOperations.outer'],
+            sorted(metrics))
+        inner = metrics['FakeOperations.inner']
+        outer = metrics['FakeOperations.outer']
+        self.assertEqual(2, inner['count'])
+        self.assertEqual(2, inner['queries']['sum'])
+        self.assertEqual(2, inner['rpc_casts']['sum'])
+        self.assertEqual(1, outer['count'])
+        # the query and cast of the inner call count in the outer call
+        self.assertEqual(1, outer['queries']['sum'])
+        self.assertEqual(2, outer['rpc_casts']['sum'])
+        self.assertEqual(2 * size, outer['payload_bytes']['sum'])
+        self.assertEqual([], self.registry.active())
+
+    def test_measure_exception(self):
+        def fail():
+            with instrumentation.measure('fail'):
+                raise ValueError()
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(1, self.registry.snapshot()['fail']['count'])
+        self.assertEqual([], self.registry.active())
+
+    def test_disabled(self):
+        with mock.patch.object(instrumentation, '_enabled', False):
+            self.operations.outer({})
+            with instrumentation.measure('op'):
+                pass
+        self.assertEqual({}, self.registry.snapshot())
@@ -12,6 +12,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import eventlet
+from eventlet import event
+import mock
 from neutron_lib import exceptions
 
 from neutron.tests import base
@@ -94,3 +97,180 @@ class GetPortMaskTestCase(base.BaseTestCase):
             ['0x7fff/0xffff', '0x8000/0x8000'],
             masks
         )
+
+
+class SfcOVSBridgeExtTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(SfcOVSBridgeExtTestCase, self).setUp()
+        self.bridge = mock.Mock()
+        self.run_ofctl = self.bridge.run_ofctl
+        self.br_ext = ovs_ext_lib.SfcOVSBridgeExt(self.bridge)
+
+    def _ofctl_cmds(self):
+        return [(call[0][0], call[0][1][1:])
+                for call in self.run_ofctl.call_args_list]
+
+    def test_flow_transaction(self):
+        with self.br_ext.flow_transaction():
+            self.br_ext.add_flow(table=0, actions='normal')
+            self.br_ext.add_flow(table=5, actions='drop')
+            self.br_ext.delete_flows(table=10, dl_dst='00:01:02:03:04:05')
+            self.br_ext.delete_flows(table=0, priority=30, in_port=1)
+            self.br_ext.add_group(group_id=1, type='select',
+                                  buckets='bucket=output:1')
+            self.br_ext.mod_group(group_id=2, type='select',
+                                  buckets='bucket=output:2')
+            self.br_ext.delete_group(group_id=3)
+            self.assertFalse(self.bridge.add_flow.called)
+            self.assertFalse(self.run_ofctl.called)
+
+        self.bridge.do_action_flows.assert_called_once_with(
+            'add', [{'table': 0, 'actions': 'normal'},
+                    {'table': 5, 'actions': 'drop'}])
+        self.assertEqual(
+            [('del-flows', ['-']),
+             ('del-flows', ['--strict', '-']),
+             ('add-groups', ['-']),
+             ('mod-group', ['-']),
+             ('del-groups', ['-'])],
+            self._ofctl_cmds())
+
+    def test_flow_transaction_keeps_order(self):
+        calls = []
+        self.run_ofctl.side_effect = (
+            lambda cmd, args, process_input=None:
+            calls.append((cmd, process_input)))
+        self.bridge.do_action_flows.side_effect = (
+            lambda action, flows: calls.append((action + '-flows', flows)))
+        with self.br_ext.flow_transaction():
+            self.br_ext.delete_flows(dl_dst='00:01:02:03:04:05')
+            self.br_ext.add_flow(table=10, dl_dst='00:01:02:03:04:05',
+                                 actions='output:1')
+            self.br_ext.add_flow(table=10, dl_dst='00:01:02:03:04:06',
+                                 actions='output:2')
+            self.br_ext.delete_group(group_id=1)
+            self.br_ext.add_group(group_id=1, type='select',
+                                  buckets='bucket=output:1')
+
+        self.assertEqual(
+            [('del-flows', 'dl_dst=00:01:02:03:04:05\n'),
+             ('add-flows', [{'table': 10, 'dl_dst': '00:01:02:03:04:05',
+                             'actions': 'output:1'},
+                            {'table': 10, 'dl_dst': '00:01:02:03:04:06',
+                             'actions': 'output:2'}]),
+             ('del-groups', 'group_id=1'),
+             ('add-groups', 'group_id=1,type=select,bucket=output:1')],
+            calls)
+
+    def test_flow_transaction_per_thread(self):
+        started = event.Event()
+        failed = event.Event()
+
+        def _other_transaction():
+            with self.br_ext.flow_transaction():
+                self.br_ext.add_flow(table=5, actions='drop')
+                started.send()
+                failed.wait()
+
+        other = eventlet.spawn(_other_transaction)
+        started.wait()
+
+        def _add_flow_and_fail():
+            with self.br_ext.flow_transaction():
+                self.br_ext.add_flow(table=0, actions='normal')
+                raise RuntimeError()
+
+        self.assertRaises(RuntimeError, _add_flow_and_fail)
+        failed.send()
+        other.wait()
+        self.bridge.do_action_flows.assert_called_once_with(
+            'add', [{'table': 5, 'actions': 'drop'}])
+
+    def test_build_group_expr_str_hash_fields(self):
+        self.assertEqual(
+            'group_id=1,selection_method=hash,fields(ip_src,tcp_dst),'
+            'bucket=weight=2,output:1',
+            ovs_ext_lib._build_group_expr_str(
+                {'group_id': 1, 'selection_method': 'hash',
+                 'fields': 'ip_src,tcp_dst',
+                 'buckets': 'bucket=weight=2,output:1'}, 'add'))
+
+    def test_add_group_hash_fields_openflow15(self):
+        self.br_ext.set_protocols(['OpenFlow10', 'OpenFlow13', 'OpenFlow15'],
+                                  of_version='OpenFlow13')
+        self.br_ext.add_group(group_id=1, type='select',
+                              buckets='bucket=output:1')
+        self.br_ext.add_group(group_id=2, type='select',
+                              selection_method='hash', fields='ip_src',
+                              buckets='bucket=output:2')
+        self.br_ext.add_flow(table=0, actions='normal')
+        self.assertEqual(
+            [['-O OpenFlow13', '-'], ['-O OpenFlow15', '-']],
+            [call[0][1] for call in self.run_ofctl.call_args_list])
+        self.bridge.set_protocols.assert_called_once_with(
+            ['OpenFlow10', 'OpenFlow13', 'OpenFlow15'])
+
+    def test_dump_group_ids(self):
+        self.run_ofctl.return_value = (
+            'OFPST_GROUP_DESC reply (OF1.3) (xid=0x2):\n'
+            ' group_id=1,type=select,bucket=actions=resubmit(,5)\n'
+            ' group_id=7001,type=select,bucket=actions=resubmit(,5)\n')
+        self.assertEqual({1, 7001}, self.br_ext.dump_group_ids())
+        self.assertEqual([('dump-groups', [])], self._ofctl_cmds())
+
+    def test_dump_flow_cookies(self):
+        self.run_ofctl.return_value = (
+            'OFPST_FLOW reply (OF1.3) (xid=0x2):\n'
+            ' cookie=0x5fc0000000000001, duration=1.0s, table=0, '
+            'priority=30,in_port=1 actions=normal\n'
+            ' cookie=0x5fc00000000000a2, duration=1.0s, table=10, '
+            'priority=1 actions=output:2\n')
+        self.assertEqual({0x5fc0000000000001, 0x5fc00000000000a2},
+                         self.br_ext.dump_flow_cookies(0x5fc << 52,
+                                                       0xfff << 52))
+        self.assertEqual(
+            [('dump-flows', ['cookie=0x5fc0000000000000/0xfff0000000000000'])],
+            self._ofctl_cmds())
+
+    def test_dump_flow_cookies_match(self):
+        self.run_ofctl.return_value = ''
+        self.assertEqual(set(), self.br_ext.dump_flow_cookies(
+            0x5fc << 52, 0xfff << 52, table=0, priority=30, in_port=1))
+        [(cmd, [flow_str])] = self._ofctl_cmds()
+        self.assertEqual('dump-flows', cmd)
+        # the priority only selects the flows of strict deletions
+        self.assertEqual(
+            ['cookie=0x5fc0000000000000/0xfff0000000000000', 'in_port=1',
+             'table=0'],
+            sorted(flow_str.split(',')))
+
+    def test_reserve_cookie(self):
+        self.br_ext.reserve_cookie(0x5fc0000000000001)
+        self.br_ext.reserve_cookie(0x5fc0000000000001)
+        self.bridge.clone.assert_called_once_with()
+        self.bridge.clone.return_value.set_agent_uuid_stamp.\
+            assert_called_once_with(0x5fc0000000000001)
+        self.assertEqual({0x5fc0000000000001}, self.br_ext.reserved_cookies)
+
+        self.br_ext.unreserve_cookie(0x5fc0000000000001)
+        self.bridge.unset_cookie.assert_called_once_with(0x5fc0000000000001)
+        self.assertEqual(set(), self.br_ext.reserved_cookies)
+
+    def test_flow_transaction_dropped_on_error(self):
+        def _add_flow_and_fail():
+            with self.br_ext.flow_transaction():
+                self.br_ext.add_flow(table=0, actions='normal')
+                self.br_ext.delete_group(group_id=3)
+                raise RuntimeError()
+
+        self.assertRaises(RuntimeError, _add_flow_and_fail)
+        self.assertFalse(self.bridge.do_action_flows.called)
+        self.assertFalse(self.run_ofctl.called)
+
+    def test_flow_transaction_not_deferred(self):
+        with self.br_ext.flow_transaction(defer=False):
+            self.br_ext.add_flow(table=0, actions='normal')
+            self.br_ext.delete_flows(table=10)
+            self.bridge.add_flow.assert_called_once_with(
+                table=0, actions='normal')
+            self.assertEqual([('del-flows', ['-'])], self._ofctl_cmds())
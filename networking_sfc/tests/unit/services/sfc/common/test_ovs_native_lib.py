@@ -0,0 +1,185 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from neutron_lib import exceptions
+from ryu.ofproto import ofproto_v1_3 as ofp
+from ryu.ofproto import ofproto_v1_3_parser as ofpp
+
+from neutron.tests import base
+
+from networking_sfc.services.sfc.common import ovs_native_lib
+
+
+class TranslateTestCase(base.BaseTestCase):
+
+    def test_split_actions(self):
+        self.assertEqual(
+            ['pop_mpls:0x0800', 'resubmit(,10)', 'output:5'],
+            ovs_native_lib.split_actions(
+                'pop_mpls:0x0800, resubmit(,10),output:5'))
+
+    def test_build_match_kwargs(self):
+        match = ovs_native_lib.build_match_kwargs(ofp, {
+            'in_port': 42,
+            'dl_type': 0x0800,
+            'nw_proto': 6,
+            'nw_src': '10.0.0.0/24',
+            'nw_dst': '0.0.0.0/0.0.0.0',
+            'tp_src': '0x64/0xfffc',
+            'tp_dst': '0x50/0xffff'
+        })
+        self.assertEqual({
+            'in_port': 42,
+            'eth_type': 0x0800,
+            'ip_proto': 6,
+            'ipv4_src': ('10.0.0.0', '255.255.255.0'),
+            'tcp_src': (0x64, 0xfffc),
+            'tcp_dst': 0x50
+        }, match)
+
+    def test_build_match_kwargs_vlan_mpls(self):
+        match = ovs_native_lib.build_match_kwargs(ofp, {
+            'dl_vlan': 10,
+            'dl_type': 0x8847,
+            'mpls_label': 511,
+            'dl_dst': '00:01:02:03:04:05'
+        })
+        self.assertEqual({
+            'vlan_vid': 10 | ofp.OFPVID_PRESENT,
+            'eth_type': 0x8847,
+            'mpls_label': 511,
+            'eth_dst': '00:01:02:03:04:05'
+        }, match)
+
+    def test_build_match_kwargs_ports_without_protocol(self):
+        self.assertRaises(
+            exceptions.InvalidInput,
+            ovs_native_lib.build_match_kwargs,
+            ofp, {'tp_src': '0x64/0xffff'})
+
+    def test_build_actions(self):
+        actions = ovs_native_lib.build_actions(
+            ofp, ofpp,
+            'push_mpls:0x8847,set_mpls_label:511,set_mpls_ttl:255,'
+            'mod_vlan_vid:10,output:2,group:1,resubmit(,10),normal')
+        self.assertEqual([
+            ofpp.OFPActionPushMpls,
+            ofpp.OFPActionSetField,
+            ofpp.OFPActionSetMplsTtl,
+            ofpp.OFPActionPushVlan,
+            ofpp.OFPActionSetField,
+            ofpp.OFPActionOutput,
+            ofpp.OFPActionGroup,
+            ofpp.NXActionResubmitTable,
+            ofpp.OFPActionOutput
+        ], [type(action) for action in actions])
+        self.assertEqual(10, actions[7].table_id)
+        self.assertEqual(ofp.OFPP_NORMAL, actions[8].port)
+
+    def test_build_unsupported_action(self):
+        self.assertRaises(
+            exceptions.InvalidInput,
+            ovs_native_lib.build_actions,
+            ofp, ofpp, 'learn(table=1)')
+
+    def test_build_buckets(self):
+        buckets = ovs_native_lib.build_buckets(
+            ofp, ofpp,
+            'bucket=weight=1, mod_dl_dst:00:01:02:03:04:05, resubmit(,5),'
+            'bucket=weight=2, mod_dl_dst:00:01:02:03:04:06, resubmit(,5)')
+        self.assertEqual([1, 2], [bucket.weight for bucket in buckets])
+        self.assertEqual(
+            '00:01:02:03:04:06', buckets[1].actions[0].value)
+
+
+class SfcOVSBridgeNativeTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(SfcOVSBridgeNativeTestCase, self).setUp()
+        self.bridge = mock.Mock(default_cookie=1234)
+        self.bridge._get_dp.return_value = (mock.Mock(), ofp, ofpp)
+        self.br_int = ovs_native_lib.SfcOVSBridgeNative(self.bridge)
+
+    def _sent_msg(self):
+        return self.bridge._send_msg.call_args[0][0]
+
+    def test_add_flow(self):
+        self.br_int.add_flow(table=10, priority=30, dl_type=0x8847,
+                             mpls_label=511,
+                             actions='pop_mpls:0x0800,output:5')
+        msg = self._sent_msg()
+        self.assertEqual(ofp.OFPFC_ADD, msg.command)
+        self.assertEqual(10, msg.table_id)
+        self.assertEqual(30, msg.priority)
+        self.assertEqual(1234, msg.cookie)
+        self.assertEqual(511, msg.match['mpls_label'])
+        self.assertEqual(2, len(msg.instructions[0].actions))
+
+    def test_delete_flows_strict(self):
+        self.br_int.delete_flows(table=0, priority=30, in_port=5)
+        msg = self._sent_msg()
+        self.assertEqual(ofp.OFPFC_DELETE_STRICT, msg.command)
+        self.assertEqual(0, msg.cookie_mask)
+
+    def test_delete_flows(self):
+        self.br_int.delete_flows(table=10)
+        self.assertEqual(ofp.OFPFC_DELETE, self._sent_msg().command)
+
+    def test_delete_flows_by_cookie(self):
+        self.br_int.delete_flows(cookie='0x5fc0000000000001/-1')
+        msg = self._sent_msg()
+        self.assertEqual(ofp.OFPFC_DELETE, msg.command)
+        self.assertEqual(0x5fc0000000000001, msg.cookie)
+        self.assertEqual(ovs_native_lib.UINT64_BITMASK, msg.cookie_mask)
+
+    def test_dump_flow_cookies(self):
+        self.bridge._send_msg.return_value = [
+            mock.Mock(body=[mock.Mock(cookie=1), mock.Mock(cookie=2)]),
+            mock.Mock(body=[mock.Mock(cookie=2)])]
+        self.assertEqual({1, 2}, self.br_int.dump_flow_cookies(0, 0xf))
+        msg = self._sent_msg()
+        self.assertEqual(0, msg.cookie)
+        self.assertEqual(0xf, msg.cookie_mask)
+        self.assertEqual(ofp.OFPTT_ALL, msg.table_id)
+
+    def test_dump_flow_cookies_match(self):
+        self.bridge._send_msg.return_value = []
+        self.assertEqual(set(), self.br_int.dump_flow_cookies(
+            0, 0xf, table=10, priority=30, in_port=42))
+        msg = self._sent_msg()
+        self.assertEqual(10, msg.table_id)
+        self.assertEqual(42, msg.match['in_port'])
+
+    @mock.patch.object(ovs_native_lib.LOG, 'warning')
+    def test_add_group_hash_selection_ignored(self, mock_warning):
+        self.br_int.add_group(group_id=1, type='select',
+                              buckets='bucket=weight=3,resubmit(,5)',
+                              selection_method='hash', fields='ip_src')
+        self.assertTrue(mock_warning.called)
+        msg = self._sent_msg()
+        self.assertEqual(ofp.OFPGC_ADD, msg.command)
+        self.assertEqual([3], [bucket.weight for bucket in msg.buckets])
+
+    def test_delete_all_groups(self):
+        self.br_int.delete_group(group_id='all')
+        msg = self._sent_msg()
+        self.assertEqual(ofp.OFPGC_DELETE, msg.command)
+        self.assertEqual(ofp.OFPG_ALL, msg.group_id)
+
+    def test_dump_group_for_id(self):
+        self.bridge._send_msg.return_value = [
+            mock.Mock(body=[mock.Mock(group_id=1), mock.Mock(group_id=2)])]
+        self.assertEqual('group_id=2', self.br_int.dump_group_for_id(2))
+        self.assertEqual('', self.br_int.dump_group_for_id(3))
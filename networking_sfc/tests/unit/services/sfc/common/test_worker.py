@@ -0,0 +1,59 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from eventlet import event
+
+from neutron.tests import base
+
+from networking_sfc.services.sfc.common import worker
+
+
+class KeyedWorkerPoolTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(KeyedWorkerPoolTestCase, self).setUp()
+        self.pool = worker.KeyedWorkerPool(2)
+        self.done = []
+
+    def _job(self, name, wait_for=None):
+        if wait_for is not None:
+            wait_for.wait()
+        self.done.append(name)
+
+    def test_jobs_of_a_key_in_order(self):
+        blocker = event.Event()
+        self.pool.submit('pc1', self._job, 'a', wait_for=blocker)
+        self.pool.submit('pc1', self._job, 'b')
+        self.pool.submit('pc2', self._job, 'c')
+        self.assertEqual(2, self.pool.pending('pc1'))
+
+        # pc2 does not wait for the blocked job of pc1
+        self.pool.wait('pc2')
+        self.assertEqual(['c'], self.done)
+        self.assertEqual(1, self.pool.pending('pc1'))
+
+        blocker.send()
+        self.pool.wait('pc1')
+        self.assertEqual(['c', 'a', 'b'], self.done)
+        self.assertEqual(0, self.pool.pending('pc1'))
+
+    def test_failed_job(self):
+        self.pool.submit('pc1', self._job, 'a', wait_for=object())
+        self.pool.submit('pc1', self._job, 'b')
+        self.pool.wait('pc1')
+        self.assertEqual(['b'], self.done)
+
+    def test_wait_without_jobs(self):
+        self.pool.wait('pc1')
+        self.assertEqual([], self.done)
@@ -0,0 +1,65 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.tests import base
+
+from networking_sfc.services.sfc.drivers.ovs import cache
+
+
+class TTLCacheTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(TTLCacheTestCase, self).setUp()
+        self.now = 0
+        self.cache = cache.TTLCache(2, 10, timer=lambda: self.now)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get('host1'))
+        self.assertEqual('default', self.cache.get('host1', 'default'))
+        self.cache.set('host1', '10.0.0.1')
+        self.assertEqual('10.0.0.1', self.cache.get('host1'))
+
+    def test_expiry(self):
+        self.cache.set('host1', '10.0.0.1')
+        self.now = 9
+        self.assertEqual('10.0.0.1', self.cache.get('host1'))
+        self.now = 10
+        self.assertIsNone(self.cache.get('host1'))
+        self.assertEqual(0, len(self.cache))
+
+    def test_evict_first_set(self):
+        self.cache.set('host1', '10.0.0.1')
+        self.cache.set('host2', '10.0.0.2')
+        # setting an entry again renews it
+        self.cache.set('host1', '10.0.0.1')
+        self.cache.set('host3', '10.0.0.3')
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNone(self.cache.get('host2'))
+        self.assertEqual('10.0.0.1', self.cache.get('host1'))
+        self.assertEqual('10.0.0.3', self.cache.get('host3'))
+
+    def test_pop_clear(self):
+        self.cache.set('host1', '10.0.0.1')
+        self.cache.set('host2', '10.0.0.2')
+        self.cache.pop('host1')
+        self.cache.pop('host3')
+        self.assertIsNone(self.cache.get('host1'))
+        self.cache.clear()
+        self.assertEqual(0, len(self.cache))
+
+    def test_disabled(self):
+        for size, ttl in ((0, 10), (2, 0)):
+            disabled = cache.TTLCache(size, ttl)
+            disabled.set('host1', '10.0.0.1')
+            self.assertIsNone(disabled.get('host1'))
@@ -0,0 +1,51 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo_db import exception as db_exc
+
+from neutron.tests import base
+
+from networking_sfc.services.sfc.drivers.ovs import db as ovs_db
+
+
+class IDAllocationTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IDAllocationTestCase, self).setUp()
+        self.allocation = ovs_db.IDAllocation(mock.Mock())
+        self.session = mock.MagicMock()
+        mock.patch.object(self.allocation, 'session', self.session).start()
+        self.find_free_id = mock.patch.object(
+            ovs_db.id_allocator, 'find_free_id').start()
+
+    def test_assign_intid_retried_on_duplicate(self):
+        self.find_free_id.side_effect = [256, 257]
+        self.session.begin_nested.return_value.__exit__.side_effect = [
+            db_exc.DBDuplicateEntry(columns=['intid']), None]
+        self.assertEqual(
+            257, self.allocation.assign_intid('portchain', 'uuid1'))
+        self.assertEqual(2, self.find_free_id.call_count)
+
+    def test_assign_intid_duplicate_uuid(self):
+        self.find_free_id.return_value = 256
+        self.session.begin_nested.return_value.__exit__.side_effect = (
+            db_exc.DBDuplicateEntry(columns=['uuid']))
+        self.assertRaises(db_exc.DBDuplicateEntry,
+                          self.allocation.assign_intid, 'portchain', 'uuid1')
+        self.assertEqual(1, self.find_free_id.call_count)
+
+    def test_assign_intid_exhausted(self):
+        self.find_free_id.return_value = None
+        self.assertIsNone(self.allocation.assign_intid('portchain', 'uuid1'))
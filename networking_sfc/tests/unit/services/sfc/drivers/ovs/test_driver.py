@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
 from eventlet import greenthread
 import mock
 from neutron.api import extensions as api_ext
@@ -19,7 +21,12 @@ from neutron.common import config
 from neutron.common import rpc as n_rpc
 from neutron.plugins.ml2.drivers import type_vxlan
 from neutron_lib.api.definitions import portbindings
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import registry
+from neutron_lib.callbacks import resources
 from neutron_lib import context
+from neutron_lib.plugins import directory
+from oslo_config import cfg
 from oslo_utils import importutils
 
 from networking_sfc.db import flowclassifier_db as fdb
@@ -28,8 +35,10 @@ from networking_sfc.extensions import flowclassifier
 from networking_sfc.extensions import sfc
 from networking_sfc.services.sfc.common import context as sfc_ctx
 from networking_sfc.services.sfc.common import exceptions as sfc_exc
+from networking_sfc.services.sfc.drivers.ovs import db as ovs_db
 from networking_sfc.services.sfc.drivers.ovs import driver
 from networking_sfc.services.sfc.drivers.ovs import rpc
+from networking_sfc.services.sfc.drivers.ovs import status
 from networking_sfc.tests import base
 from networking_sfc.tests.unit.db import test_flowclassifier_db
 from networking_sfc.tests.unit.db import test_sfc_db
@@ -58,6 +67,13 @@ class OVSSfcDriverTestCase(
     def ask_agent_to_delete_flow_rules(self, context, flows):
         self.record_rpc('delete_flow_rules', flows)
 
+    def ask_agent_to_process_flow_rules(self, context, host,
+                                        flowrule_entries):
+        self.record_rpc('process_flow_rules', (host, flowrule_entries))
+        for entry in flowrule_entries:
+            self.record_rpc('%s_flow_rules' % entry['operation'],
+                            entry['flowrule'])
+
     def ask_agent_to_update_src_node_flow_rules(self, context, flows):
         self.record_rpc('update_src_node_flow_rules', flows)
 
@@ -79,7 +95,8 @@ class OVSSfcDriverTestCase(
         self.rpc_calls = {
             'update_flow_rules': [], 'delete_flow_rules': [],
             'update_src_node_flow_rules': [],
-            'delete_src_node_flow_rules': []
+            'delete_src_node_flow_rules': [],
+            'process_flow_rules': []
         }
 
     def setUp(self):
@@ -127,6 +144,9 @@ class OVSSfcDriverTestCase(
         self.mocked_notifier.ask_agent_to_delete_flow_rules = mock.Mock(
             side_effect=self.ask_agent_to_delete_flow_rules
         )
+        self.mocked_notifier.ask_agent_to_process_flow_rules = mock.Mock(
+            side_effect=self.ask_agent_to_process_flow_rules
+        )
         self.mocked_notifier.ask_agent_to_delete_src_node_flow_rules = (
             mock.Mock(
                 side_effect=self.ask_agent_to_delete_src_node_flow_rules
@@ -671,6 +691,391 @@ class OVSSfcDriverTestCase(
                                 update_flow_rules[flow2]['node_type'],
                                 'sf_node')
 
+    def test_create_port_chain_fetches_flow_classifiers_once(self):
+        with self.port(
+            name='port1',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'test'}
+        ) as src_port, self.port(
+            name='ingress',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'test'}
+        ) as ingress, self.port(
+            name='egress',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'test'}
+        ) as egress:
+            self.host_endpoint_mapping = {
+                'test': '10.0.0.1',
+            }
+            with self.flow_classifier(flow_classifier={
+                'ethertype': 'IPv4',
+                'protocol': 'tcp',
+                'logical_source_port': src_port['port']['id']
+            }) as fc:
+                with self.port_pair(port_pair={
+                    'ingress': ingress['port']['id'],
+                    'egress': egress['port']['id']
+                }) as pp:
+                    pp_context = sfc_ctx.PortPairContext(
+                        self.sfc_plugin, self.ctx,
+                        pp['port_pair']
+                    )
+                    self.driver.create_port_pair(pp_context)
+                    with self.port_pair_group(port_pair_group={
+                        'port_pairs': [pp['port_pair']['id']]
+                    }) as pg:
+                        pg_context = sfc_ctx.PortPairGroupContext(
+                            self.sfc_plugin, self.ctx,
+                            pg['port_pair_group']
+                        )
+                        self.driver.create_port_pair_group(pg_context)
+                        with self.port_chain(port_chain={
+                            'name': 'test1',
+                            'port_pair_groups': [pg['port_pair_group']['id']],
+                            'flow_classifiers': [fc['flow_classifier']['id']]
+                        }) as pc:
+                            pc_context = sfc_ctx.PortChainContext(
+                                self.sfc_plugin, self.ctx,
+                                pc['port_chain']
+                            )
+                            get_flow_classifiers = (
+                                fdb.FlowClassifierDbPlugin.get_flow_classifiers
+                            )
+                            with mock.patch.object(
+                                fdb.FlowClassifierDbPlugin,
+                                'get_flow_classifiers',
+                                autospec=True,
+                                side_effect=get_flow_classifiers
+                            ) as mock_get_fcs:
+                                self.driver.create_port_chain(pc_context)
+                                self.wait()
+                            self.assertEqual(1, mock_get_fcs.call_count)
+                            self.assertIsNone(self.driver._fc_local.cache)
+                            update_flow_rules = self.map_flow_rules(
+                                self.rpc_calls['update_flow_rules'])
+                            flow1 = self.build_ingress_egress(
+                                None, src_port['port']['id'])
+                            flow2 = self.build_ingress_egress(
+                                ingress['port']['id'],
+                                egress['port']['id']
+                            )
+                            for flow in (flow1, flow2):
+                                add_fcs = update_flow_rules[flow]['add_fcs']
+                                self.assertEqual(
+                                    src_port['port']['fixed_ips'][0][
+                                        'ip_address'],
+                                    add_fcs[0]['source_ip_prefix'])
+
+    def test_get_path_nodes_by_ids(self):
+        nodes = [
+            self.driver.create_path_node({
+                'project_id': self._tenant_id,
+                'node_type': 'sf_node',
+                'nsp': 1,
+                'nsi': nsi,
+                'fwd_path': True
+            }) for nsi in (0xfe, 0xfd, 0xfc)
+        ]
+        node_ids = [node['id'] for node in nodes]
+        self.assertEqual(
+            dict((node['id'], node) for node in nodes),
+            self.driver.get_path_nodes_by_ids(node_ids, 2))
+        self.assertRaises(
+            ovs_db.NodeNotFound,
+            self.driver.get_path_nodes_by_ids,
+            node_ids + ['unknown'], 2)
+
+    def test_update_flowrule_status(self):
+        nodes = [
+            self.driver.create_path_node({
+                'project_id': self._tenant_id,
+                'node_type': 'sf_node',
+                'nsp': 1,
+                'nsi': nsi,
+                'fwd_path': True,
+                'status': 'building'
+            }) for nsi in (0xfe, 0xfd, 0xfc)
+        ]
+        self.driver.update_flowrule_status(
+            self.ctx, nodes[0]['id'], 'error')
+        self.driver.update_flowrule_status(
+            self.ctx, nodes[0]['id'], 'active')
+        self.driver.update_flowrule_status(
+            self.ctx, nodes[1]['id'], 'error')
+        self.assertEqual(2, self.driver._status_writer.pending())
+        # nothing is written before the flush
+        self.assertEqual(
+            'building', self.driver.get_path_node(nodes[0]['id'])['status'])
+        self.driver._status_writer.flush()
+        self.assertEqual(0, self.driver._status_writer.pending())
+        self.assertEqual(
+            ['active', 'error', 'building'],
+            [self.driver.get_path_node(node['id'])['status']
+             for node in nodes])
+
+    def test_flowrule_status_writer_retry(self):
+        write = mock.Mock(side_effect=[Exception(), None])
+        writer = status.FlowRuleStatusWriter(write, 2)
+        with mock.patch('eventlet.spawn_after') as spawn_after:
+            writer.add('node1', 'active')
+            writer.add('node2', 'active')
+            writer.flush()
+            writer.add('node2', 'error')
+            writer.flush()
+        self.assertEqual(2, spawn_after.call_count)
+        write.assert_called_with({'node1': 'active', 'node2': 'error'})
+        self.assertEqual(0, writer.pending())
+
+    def test_get_group_reference_count(self):
+        def create_node(nsi, fwd_path, next_group_id=1):
+            return self.driver.create_path_node({
+                'project_id': self._tenant_id,
+                'node_type': 'sf_node' if nsi != 0xff else 'src_node',
+                'nsp': 1,
+                'nsi': nsi,
+                'next_group_id': next_group_id,
+                'fwd_path': fwd_path
+            })
+
+        def create_detail(host_id, *nodes):
+            pd = self.driver.create_port_pair_detail({
+                'project_id': self._tenant_id,
+                'host_id': host_id,
+                'mac_address': '00:01:02:03:04:05',
+                'local_endpoint': '10.0.0.1'
+            })
+            for node in nodes:
+                self.driver.create_pathport_assoc({
+                    'portpair_id': pd['id'],
+                    'pathnode_id': node['id'],
+                    'weight': 1
+                })
+
+        create_node(0xff, True)
+        create_node(0xff, False)
+        src_node = create_node(0xff, True)
+        sf_node = create_node(0xfe, True)
+        create_node(0xfe, True, next_group_id=2)
+        create_detail('host1', src_node, sf_node)
+        create_detail('host2', sf_node)
+        self.assertEqual(
+            3, self.driver.get_group_reference_count(1, True, 'host1'))
+        self.assertEqual(
+            3, self.driver.get_group_reference_count(1, False, 'host1'))
+        self.assertEqual(
+            2, self.driver.get_group_reference_count(1, True, 'host2'))
+        self.assertEqual(
+            0, self.driver.get_group_reference_count(3, True, 'host1'))
+
+    def test_get_by_filter_fields(self):
+        node = self.driver.create_path_node({
+            'project_id': self._tenant_id,
+            'node_type': 'sf_node',
+            'nsp': 1,
+            'nsi': 0xfe,
+            'next_group_id': 2,
+            'fwd_path': True
+        })
+        pd = self.driver.create_port_pair_detail({
+            'project_id': self._tenant_id,
+            'host_id': 'host1',
+            'mac_address': '00:01:02:03:04:05',
+            'local_endpoint': '10.0.0.1'
+        })
+        self.driver.create_pathport_assoc({
+            'portpair_id': pd['id'],
+            'pathnode_id': node['id'],
+            'weight': 1
+        })
+        # column projections only have the fields asked for
+        self.assertEqual(
+            [{'next_group_id': 2, 'fwd_path': True}],
+            self.driver.get_path_nodes_by_filter(
+                {'nsp': 1}, fields=['next_group_id', 'fwd_path']))
+        self.assertEqual(
+            {'host_id': 'host1'},
+            self.driver.get_port_detail_by_filter(
+                {'id': pd['id']}, fields=['host_id']))
+        # the associations are loaded when asked for
+        self.assertEqual(
+            {'id': node['id'], 'portpair_details': [pd['id']]},
+            self.driver.get_path_node_by_filter(
+                {'nsp': 1}, fields=['id', 'portpair_details']))
+        self.assertEqual(
+            [{'pathnode_id': node['id'], 'weight': 1}],
+            self.driver.get_port_details_by_filter(
+                {'host_id': 'host1'})[0]['path_nodes'])
+
+    def test_create_and_delete_path_nodes(self):
+        pd = self.driver.create_port_pair_detail({
+            'project_id': self._tenant_id,
+            'host_id': 'host1',
+            'mac_address': '00:01:02:03:04:05',
+            'local_endpoint': '10.0.0.1'
+        })
+        members = [{'portpair_id': pd['id'], 'weight': 2}]
+        nodes = self.driver.create_path_nodes([
+            ({'project_id': self._tenant_id,
+              'node_type': 'sf_node',
+              'nsp': 1,
+              'nsi': nsi,
+              'fwd_path': True}, members)
+            for nsi in (0xfe, 0xfd, 0xfc)
+        ])
+        self.assertEqual([[pd['id']]] * 3,
+                         [node['portpair_details'] for node in nodes])
+        self.assertEqual(
+            dict((node['id'], node) for node in nodes),
+            self.driver.get_path_nodes_by_ids(
+                [node['id'] for node in nodes], 10))
+        self.driver.delete_path_nodes([nodes[0]['id']])
+        self.assertEqual(
+            set(node['id'] for node in nodes[1:]),
+            set(assoc['pathnode_id'] for assoc in
+                self.driver.get_port_detail(pd['id'])['path_nodes']))
+        # the nodes are not part of any port chain
+        self.driver.delete_path(None)
+        self.assertIsNone(self.driver.get_path_nodes_by_filter({'nsp': 1}))
+        self.assertEqual([],
+                         self.driver.get_port_detail(pd['id'])['path_nodes'])
+
+    def test_create_port_pair_bulk_postcommit(self):
+        with self.port(
+            name='port1',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'host1'}
+        ) as port1, self.port(
+            name='port2',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'host1'}
+        ) as port2, self.port(
+            name='port3',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'host2'}
+        ) as port3:
+            self.host_endpoint_mapping = {
+                'host1': '10.0.0.1',
+                'host2': '10.0.0.2'
+            }
+            ports = [port['port'] for port in (port1, port2, port3)]
+            with self.port_pair(port_pair={
+                'ingress': ports[0]['id'],
+                'egress': ports[1]['id']
+            }) as pp1, self.port_pair(port_pair={
+                'ingress': ports[1]['id'],
+                'egress': ports[2]['id']
+            }) as pp2:
+                core_plugin = directory.get_plugin()
+                get_endpoint_by_host = (
+                    type_vxlan.VxlanTypeDriver.get_endpoint_by_host)
+                get_endpoint_by_host.reset_mock()
+                with mock.patch.object(
+                    core_plugin, 'get_port'
+                ) as get_port, mock.patch.object(
+                    core_plugin, 'get_network'
+                ) as get_network:
+                    self.driver.create_port_pair_bulk_postcommit([
+                        sfc_ctx.PortPairContext(
+                            self.sfc_plugin, self.ctx, pp['port_pair'])
+                        for pp in (pp1, pp2)
+                    ])
+                    get_port.assert_not_called()
+                    get_network.assert_not_called()
+                # one tunnel endpoint lookup per host
+                self.assertEqual(2, get_endpoint_by_host.call_count)
+                for ingress, egress, local_endpoint in (
+                    (ports[0], ports[1], '10.0.0.1'),
+                    (ports[1], ports[2], '10.0.0.2')
+                ):
+                    pd = self.driver.get_port_detail_by_filter({
+                        'ingress': ingress['id'], 'egress': egress['id']})
+                    self.assertEqual(egress['binding:host_id'],
+                                     pd['host_id'])
+                    self.assertEqual(local_endpoint, pd['local_endpoint'])
+                    self.assertEqual(egress['mac_address'],
+                                     pd['mac_address'])
+                    self.assertEqual(ingress['mac_address'],
+                                     pd['in_mac_address'])
+                    self.assertEqual('vxlan', pd['network_type'])
+
+    def test_port_detail_info_cache(self):
+        with self.subnet() as subnet, self.port(
+            subnet=subnet,
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'host1'}
+        ) as port1, self.port(
+            subnet=subnet,
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'host1'}
+        ) as port2:
+            self.host_endpoint_mapping = {'host1': '10.0.0.1'}
+            network_id = subnet['subnet']['network_id']
+            port_ids = [port1['port']['id'], port2['port']['id']]
+            core_plugin = directory.get_plugin()
+            get_endpoint_by_host = (
+                type_vxlan.VxlanTypeDriver.get_endpoint_by_host)
+            get_endpoint_by_host.reset_mock()
+            with mock.patch.object(
+                core_plugin, 'get_network', wraps=core_plugin.get_network
+            ) as get_network:
+                for port_id in port_ids:
+                    self.assertEqual(
+                        ('host1', '10.0.0.1', 'vxlan'),
+                        self.driver._get_port_detail_info(port_id)[:3])
+                self.assertEqual(1, get_network.call_count)
+                self.assertEqual(1, get_endpoint_by_host.call_count)
+
+                registry.notify(resources.NETWORK, events.AFTER_UPDATE, self,
+                                network={'id': network_id})
+                self.driver._get_port_detail_info(port_ids[0])
+                self.assertEqual(2, get_network.call_count)
+
+            # a new tunnel endpoint IP is used once the entry expires
+            self.host_endpoint_mapping = {'host1': '10.0.0.2'}
+            self.assertEqual(
+                '10.0.0.1',
+                self.driver._get_port_detail_info(port_ids[0])[1])
+            expiry = time.time() + cfg.CONF.sfc.port_detail_cache_ttl
+            with mock.patch.object(self.driver._endpoint_cache, '_timer',
+                                   return_value=expiry):
+                self.assertEqual(
+                    '10.0.0.2',
+                    self.driver._get_port_detail_info(port_ids[0])[1])
+            self.assertEqual(2, get_endpoint_by_host.call_count)
+
     def test_create_port_chain_multi_port_groups_port_pairs(self):
         with self.port(
             name='port1',
@@ -2592,9 +2997,10 @@ class OVSSfcDriverTestCase(
                             None, src_port2['port']['id'])
                         flow3 = self.build_ingress_egress(
                             ingress['port']['id'], egress['port']['id'])
+                        # the sf node is kept and only gets the delta
                         self.assertEqual(
                             set(delete_flow_rules.keys()),
-                            {flow1, flow3})
+                            {flow1})
                         del_fcs = delete_flow_rules[flow1]['del_fcs']
                         self.assertEqual(len(del_fcs), 1)
                         ip_src1 = (
@@ -2621,31 +3027,9 @@ class OVSSfcDriverTestCase(
                         self.assertEqual(
                             delete_flow_rules[flow1]['node_type'],
                             'src_node')
-                        del_fcs = delete_flow_rules[flow3]['del_fcs']
-                        self.assertEqual(len(del_fcs), 1)
                         ip_src2 = (
                             src_port2['port']['fixed_ips'][0]['ip_address']
                         )
-                        self.assertDictContainsSubset({
-                            'destination_ip_prefix': None,
-                            'destination_port_range_max': None,
-                            'destination_port_range_min': None,
-                            'ethertype': u'IPv4',
-                            'l7_parameters': {},
-                            'protocol': None,
-                            'source_ip_prefix': ip_src1,
-                            'source_port_range_max': None,
-                            'source_port_range_min': None
-                        }, del_fcs[0])
-                        next_hops = self.next_hops_info(
-                            delete_flow_rules[flow3].get('next_hops'))
-                        self.assertEqual(
-                            next_hops,
-                            {}
-                        )
-                        self.assertEqual(
-                            delete_flow_rules[flow3]['node_type'],
-                            'sf_node')
                         self.assertEqual(
                             set(update_flow_rules.keys()),
                             {flow2, flow3})
@@ -2693,6 +3077,19 @@ class OVSSfcDriverTestCase(
                         self.assertEqual(
                             update_flow_rules[flow3]['node_type'],
                             'sf_node')
+                        del_fcs = update_flow_rules[flow3]['del_fcs']
+                        self.assertEqual(len(del_fcs), 1)
+                        self.assertDictContainsSubset({
+                            'destination_ip_prefix': None,
+                            'destination_port_range_max': None,
+                            'destination_port_range_min': None,
+                            'ethertype': u'IPv4',
+                            'l7_parameters': {},
+                            'protocol': None,
+                            'source_ip_prefix': ip_src1,
+                            'source_port_range_max': None,
+                            'source_port_range_min': None
+                        }, del_fcs[0])
 
     def test_update_port_chain_add_port_pair_group(self):
         with self.port(
@@ -2815,41 +3212,16 @@ class OVSSfcDriverTestCase(
                             self.rpc_calls['delete_flow_rules'])
                         update_flow_rules = self.map_flow_rules(
                             self.rpc_calls['update_flow_rules'])
-                        flow1 = self.build_ingress_egress(
-                            None, src_port['port']['id'])
                         flow2 = self.build_ingress_egress(
                             ingress1['port']['id'], egress1['port']['id'])
                         flow3 = self.build_ingress_egress(
                             ingress2['port']['id'], egress2['port']['id'])
                         self.assertEqual(
                             set(delete_flow_rules.keys()),
-                            {flow1, flow2})
-                        del_fcs = delete_flow_rules[flow1]['del_fcs']
-                        self.assertEqual(len(del_fcs), 1)
+                            {flow2})
                         ip_src = (
                             src_port['port']['fixed_ips'][0]['ip_address']
                         )
-                        self.assertDictContainsSubset({
-                            'destination_ip_prefix': None,
-                            'destination_port_range_max': None,
-                            'destination_port_range_min': None,
-                            'ethertype': u'IPv4',
-                            'l7_parameters': {},
-                            'protocol': None,
-                            'source_ip_prefix': ip_src,
-                            'source_port_range_max': None,
-                            'source_port_range_min': None
-                        }, del_fcs[0])
-                        next_hops = self.next_hops_info(
-                            delete_flow_rules[flow1].get('next_hops'))
-                        self.assertEqual(
-                            next_hops, {
-                                ingress1['port']['mac_address']: '10.0.0.1',
-                            }
-                        )
-                        self.assertEqual(
-                            delete_flow_rules[flow1]['node_type'],
-                            'src_node')
                         del_fcs = delete_flow_rules[flow2]['del_fcs']
                         self.assertEqual(len(del_fcs), 1)
                         self.assertDictContainsSubset({
@@ -2874,30 +3246,7 @@ class OVSSfcDriverTestCase(
                             'sf_node')
                         self.assertEqual(
                             set(update_flow_rules.keys()),
-                            {flow1, flow2, flow3})
-                        add_fcs = update_flow_rules[flow1]['add_fcs']
-                        self.assertEqual(len(add_fcs), 1)
-                        self.assertDictContainsSubset({
-                            'destination_ip_prefix': None,
-                            'destination_port_range_max': None,
-                            'destination_port_range_min': None,
-                            'ethertype': u'IPv4',
-                            'l7_parameters': {},
-                            'protocol': None,
-                            'source_ip_prefix': ip_src,
-                            'source_port_range_max': None,
-                            'source_port_range_min': None
-                        }, add_fcs[0])
-                        next_hops = self.next_hops_info(
-                            update_flow_rules[flow1].get('next_hops'))
-                        self.assertEqual(
-                            next_hops, {
-                                ingress1['port']['mac_address']: '10.0.0.1'
-                            }
-                        )
-                        self.assertEqual(
-                            update_flow_rules[flow1]['node_type'],
-                            'src_node')
+                            {flow2, flow3})
                         add_fcs = update_flow_rules[flow2]['add_fcs']
                         self.assertEqual(len(add_fcs), 1)
                         self.assertDictContainsSubset({
@@ -3067,41 +3416,16 @@ class OVSSfcDriverTestCase(
                             self.rpc_calls['delete_flow_rules'])
                         update_flow_rules = self.map_flow_rules(
                             self.rpc_calls['update_flow_rules'])
-                        flow1 = self.build_ingress_egress(
-                            None, src_port['port']['id'])
                         flow2 = self.build_ingress_egress(
                             ingress1['port']['id'], egress1['port']['id'])
                         flow3 = self.build_ingress_egress(
                             ingress2['port']['id'], egress2['port']['id'])
                         self.assertEqual(
                             set(delete_flow_rules.keys()),
-                            {flow1, flow2, flow3})
-                        del_fcs = delete_flow_rules[flow1]['del_fcs']
-                        self.assertEqual(len(del_fcs), 1)
+                            {flow2, flow3})
                         ip_src = (
                             src_port['port']['fixed_ips'][0]['ip_address']
                         )
-                        self.assertDictContainsSubset({
-                            'destination_ip_prefix': None,
-                            'destination_port_range_max': None,
-                            'destination_port_range_min': None,
-                            'ethertype': u'IPv4',
-                            'l7_parameters': {},
-                            'protocol': None,
-                            'source_ip_prefix': ip_src,
-                            'source_port_range_max': None,
-                            'source_port_range_min': None
-                        }, del_fcs[0])
-                        next_hops = self.next_hops_info(
-                            delete_flow_rules[flow1].get('next_hops'))
-                        self.assertEqual(
-                            next_hops, {
-                                ingress1['port']['mac_address']: '10.0.0.1',
-                            }
-                        )
-                        self.assertEqual(
-                            delete_flow_rules[flow1]['node_type'],
-                            'src_node')
                         del_fcs = delete_flow_rules[flow2]['del_fcs']
                         self.assertEqual(len(del_fcs), 1)
                         self.assertDictContainsSubset({
@@ -3149,30 +3473,7 @@ class OVSSfcDriverTestCase(
                             'sf_node')
                         self.assertEqual(
                             set(update_flow_rules.keys()),
-                            {flow1, flow2})
-                        add_fcs = update_flow_rules[flow1]['add_fcs']
-                        self.assertEqual(len(add_fcs), 1)
-                        self.assertDictContainsSubset({
-                            'destination_ip_prefix': None,
-                            'destination_port_range_max': None,
-                            'destination_port_range_min': None,
-                            'ethertype': u'IPv4',
-                            'l7_parameters': {},
-                            'protocol': None,
-                            'source_ip_prefix': ip_src,
-                            'source_port_range_max': None,
-                            'source_port_range_min': None
-                        }, add_fcs[0])
-                        next_hops = self.next_hops_info(
-                            update_flow_rules[flow1].get('next_hops'))
-                        self.assertEqual(
-                            next_hops, {
-                                ingress1['port']['mac_address']: '10.0.0.1'
-                            }
-                        )
-                        self.assertEqual(
-                            update_flow_rules[flow1]['node_type'],
-                            'src_node')
+                            {flow2})
                         add_fcs = update_flow_rules[flow2]['add_fcs']
                         self.assertEqual(len(add_fcs), 1)
                         self.assertDictContainsSubset({
@@ -3723,6 +4024,119 @@ class OVSSfcDriverTestCase(
                                 flow_rules[flow2]['node_type'],
                                 'sf_node')
 
+    def test_agent_init_host_flowrules(self):
+        with self.port(
+            name='port1',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'test'}
+        ) as src_port, self.port(
+            name='ingress',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'test'}
+        ) as ingress, self.port(
+            name='egress',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'test'}
+        ) as egress:
+            self.host_endpoint_mapping = {
+                'test': '10.0.0.1',
+            }
+            with self.flow_classifier(flow_classifier={
+                'logical_source_port': src_port['port']['id']
+            }) as fc:
+                with self.port_pair(port_pair={
+                    'ingress': ingress['port']['id'],
+                    'egress': egress['port']['id']
+                }) as pp:
+                    pp_context = sfc_ctx.PortPairContext(
+                        self.sfc_plugin, self.ctx,
+                        pp['port_pair']
+                    )
+                    self.driver.create_port_pair(pp_context)
+                    with self.port_pair_group(port_pair_group={
+                        'port_pairs': [pp['port_pair']['id']]
+                    }) as pg:
+                        pg_context = sfc_ctx.PortPairGroupContext(
+                            self.sfc_plugin, self.ctx,
+                            pg['port_pair_group']
+                        )
+                        self.driver.create_port_pair_group(pg_context)
+                        with self.port_chain(port_chain={
+                            'name': 'test1',
+                            'port_pair_groups': [pg['port_pair_group']['id']],
+                            'flow_classifiers': [fc['flow_classifier']['id']]
+                        }) as pc:
+                            pc_context = sfc_ctx.PortChainContext(
+                                self.sfc_plugin, self.ctx,
+                                pc['port_chain']
+                            )
+                            self.driver.create_port_chain(pc_context)
+                            self.wait()
+                            pages = []
+                            marker = None
+                            while True:
+                                page = self.driver.get_flowrules_by_host(
+                                    self.ctx, 'test', marker=marker, limit=1)
+                                pages.append(page)
+                                marker = page['next_marker']
+                                if not marker:
+                                    break
+                            port_details = [
+                                port_detail for page in pages
+                                for port_detail in page['port_details']]
+                            self.assertEqual(2, len(port_details))
+                            self.assertEqual(
+                                {(None, src_port['port']['id']),
+                                 (ingress['port']['id'],
+                                  egress['port']['id'])},
+                                set((port_detail['ingress'],
+                                     port_detail['egress'])
+                                    for port_detail in port_details))
+                            flow_rules = self.map_flow_rules(
+                                [], *[port_detail['flowrules']
+                                      for port_detail in port_details])
+                            flow1 = self.build_ingress_egress(
+                                None,
+                                src_port['port']['id']
+                            )
+                            flow2 = self.build_ingress_egress(
+                                ingress['port']['id'],
+                                egress['port']['id']
+                            )
+                            self.assertEqual(
+                                set(flow_rules.keys()),
+                                {flow1, flow2})
+                            self.assertEqual(
+                                flow_rules[flow1]['node_type'],
+                                'src_node')
+                            self.assertEqual(
+                                flow_rules[flow2]['node_type'],
+                                'sf_node')
+                            self.assertEqual(
+                                {'port_details': [], 'next_marker': None},
+                                self.driver.get_flowrules_by_host(
+                                    self.ctx, 'other'))
+
+                            # the page size is bounded by the server
+                            cfg.CONF.set_override(
+                                'flowrules_bulk_size', 1, 'sfc')
+                            page = self.driver.get_flowrules_by_host(
+                                self.ctx, 'test', limit=10)
+                            self.assertEqual(1, len(page['port_details']))
+                            self.assertIsNotNone(page['next_marker'])
+
     def test_agent_init_multi_port_groups_port_pairs(self):
         with self.port(
             name='port1',
@@ -5318,3 +5732,229 @@ class OVSSfcDriverTestCase(
                             self.assertEqual(
                                 update_flow_rules[flow6]['node_type'],
                                 'sf_node')
+
+    def test_create_port_chain_with_lb_fields_and_weights(self):
+        with self.port(
+            name='port1',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'test'}
+        ) as src_port, self.port(
+            name='ingress1',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'test'}
+        ) as ingress1, self.port(
+            name='ingress2',
+            device_owner='compute',
+            device_id='test',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'test'}
+        ) as ingress2:
+            self.host_endpoint_mapping = {
+                'test': '10.0.0.1',
+            }
+            with self.flow_classifier(flow_classifier={
+                'logical_source_port': src_port['port']['id']
+            }) as fc, self.port_pair(port_pair={
+                'ingress': ingress1['port']['id'],
+                'egress': ingress1['port']['id'],
+                'service_function_parameters': {'weight': 3}
+            }) as pp1, self.port_pair(port_pair={
+                'ingress': ingress2['port']['id'],
+                'egress': ingress2['port']['id']
+            }) as pp2:
+                for pp in (pp1, pp2):
+                    self.driver.create_port_pair(sfc_ctx.PortPairContext(
+                        self.sfc_plugin, self.ctx, pp['port_pair']))
+                with self.port_pair_group(port_pair_group={
+                    'port_pairs': [pp1['port_pair']['id'],
+                                   pp2['port_pair']['id']],
+                    'port_pair_group_parameters': {
+                        'lb_fields': ['ip_src', 'tcp_dst']}
+                }) as pg:
+                    with self.port_chain(port_chain={
+                        'name': 'test1',
+                        'port_pair_groups': [pg['port_pair_group']['id']],
+                        'flow_classifiers': [fc['flow_classifier']['id']]
+                    }) as pc:
+                        pc_context = sfc_ctx.PortChainContext(
+                            self.sfc_plugin, self.ctx,
+                            pc['port_chain']
+                        )
+                        self.driver.create_port_chain(pc_context)
+                        self.wait()
+                        update_flow_rules = self.map_flow_rules(
+                            self.rpc_calls['update_flow_rules'])
+                        flow1 = self.build_ingress_egress(
+                            None, src_port['port']['id'])
+                        self.assertEqual(
+                            ['ip_src', 'tcp_dst'],
+                            update_flow_rules[flow1]['lb_fields'])
+                        self.assertEqual(
+                            {ingress1['port']['mac_address']: 3,
+                             ingress2['port']['mac_address']: 1},
+                            dict((hop['in_mac_address'], hop['weight'])
+                                 for hop in
+                                 update_flow_rules[flow1]['next_hops']))
+                        # the last hop has no group to balance over
+                        flow2 = self.build_ingress_egress(
+                            ingress1['port']['id'], ingress1['port']['id'])
+                        self.assertEqual(
+                            [], update_flow_rules[flow2]['lb_fields'])
+
+    def _build_path_snapshot(self):
+        return {
+            'groups': {
+                'pg1': {'group_id': 1,
+                        'port_pairs': [('in1', 'out1'), ('in2', 'out2')],
+                        'weights': {('in1', 'out1'): 1,
+                                    ('in2', 'out2'): 3}},
+                'pg2': {'group_id': 2,
+                        'port_pairs': [('in3', 'out3')],
+                        'weights': {('in3', 'out3'): 1}}
+            },
+            'flow_classifiers': [{'logical_source_port': 'src'}],
+            'port_details': {('in1', 'out1'): {'id': 'pd1'},
+                             ('in2', 'out2'): {'id': 'pd2'}},
+            'cidrs': {'src': '10.0.0.0/24',
+                      'in1': '10.0.0.0/24', 'out1': '10.0.0.0/24',
+                      'in2': '10.0.0.0/24', 'out2': '10.0.0.0/24',
+                      'in3': '10.0.0.0/24', 'out3': '10.0.0.0/24'}
+        }
+
+    def test_get_portgroup_members_from_snapshot(self):
+        snapshot = self._build_path_snapshot()
+        self.assertEqual(
+            (1, [{'portpair_id': 'pd1', 'weight': 1},
+                 {'portpair_id': 'pd2', 'weight': 3}]),
+            self.driver._get_portgroup_members_from_snapshot(
+                snapshot, 'pg1', True))
+        self.assertEqual(
+            (1, [{'portpair_id': 'pd2', 'weight': 3},
+                 {'portpair_id': 'pd1', 'weight': 1}]),
+            self.driver._get_portgroup_members_from_snapshot(
+                snapshot, 'pg1', False))
+        # port pairs without port detail are skipped
+        self.assertEqual(
+            (2, []),
+            self.driver._get_portgroup_members_from_snapshot(
+                snapshot, 'pg2', True))
+
+    def test_check_portchain_cross_subnet(self):
+        port_chain = {'port_pair_groups': ['pg1', 'pg2']}
+        snapshot = self._build_path_snapshot()
+        self.driver._check_portchain_cross_subnet(port_chain, snapshot)
+
+        snapshot['cidrs']['in3'] = '10.0.1.0/24'
+        self.assertRaises(
+            sfc_exc.SfcDriverError,
+            self.driver._check_portchain_cross_subnet,
+            port_chain, snapshot)
+
+        snapshot = self._build_path_snapshot()
+        snapshot['cidrs']['src'] = '10.0.1.0/24'
+        self.assertRaises(
+            sfc_exc.SfcDriverError,
+            self.driver._check_portchain_cross_subnet,
+            port_chain, snapshot)
+
+    def test_create_port_chain_batches_flow_rules_per_host(self):
+        with self.port(
+            name='ingress1',
+            device_owner='compute',
+            device_id='test1',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'host1'}
+        ) as ingress1, self.port(
+            name='egress1',
+            device_owner='compute',
+            device_id='test1',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'host1'}
+        ) as egress1, self.port(
+            name='ingress2',
+            device_owner='compute',
+            device_id='test2',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'host2'}
+        ) as ingress2, self.port(
+            name='egress2',
+            device_owner='compute',
+            device_id='test2',
+            arg_list=(
+                portbindings.HOST_ID,
+            ),
+            **{portbindings.HOST_ID: 'host2'}
+        ) as egress2:
+            self.host_endpoint_mapping = {
+                'host1': '10.0.0.1',
+                'host2': '10.0.0.2'
+            }
+            with self.port_pair(port_pair={
+                'ingress': ingress1['port']['id'],
+                'egress': egress1['port']['id']
+            }) as pp1, self.port_pair(port_pair={
+                'ingress': ingress2['port']['id'],
+                'egress': egress2['port']['id']
+            }) as pp2:
+                for pp in (pp1, pp2):
+                    self.driver.create_port_pair(sfc_ctx.PortPairContext(
+                        self.sfc_plugin, self.ctx, pp['port_pair']))
+                with self.port_pair_group(port_pair_group={
+                    'port_pairs': [pp1['port_pair']['id'],
+                                   pp2['port_pair']['id']]
+                }) as pg:
+                    with self.port_chain(port_chain={
+                        'name': 'test1',
+                        'port_pair_groups': [pg['port_pair_group']['id']]
+                    }) as pc:
+                        pc_context = sfc_ctx.PortChainContext(
+                            self.sfc_plugin, self.ctx,
+                            pc['port_chain']
+                        )
+                        self.driver.create_port_chain(pc_context)
+                        self.wait()
+                        self.assertFalse(
+                            self.mocked_notifier.
+                            ask_agent_to_update_flow_rules.called)
+                        hosts = [
+                            host for host, entries in
+                            self.rpc_calls['process_flow_rules']
+                        ]
+                        self.assertEqual(['host1', 'host2'], sorted(hosts))
+                        self.assertEqual(
+                            2, len(self.rpc_calls['update_flow_rules']))
+
+    def test_notify_flow_rule_without_batch(self):
+        flow_rule = {'host': 'test'}
+        self.driver._notify_flow_rule('update', flow_rule)
+        self.driver._notify_flow_rule('delete', flow_rule)
+        self.assertEqual([flow_rule], self.rpc_calls['update_flow_rules'])
+        self.assertEqual([flow_rule], self.rpc_calls['delete_flow_rules'])
+        self.assertEqual([], self.rpc_calls['process_flow_rules'])
+
+    def test_batch_flow_rules_dropped_on_error(self):
+        @driver.batch_flow_rules
+        def _notify_and_fail(ovs_driver):
+            ovs_driver._notify_flow_rule('update', {'host': 'test'})
+            raise RuntimeError()
+
+        self.assertRaises(RuntimeError, _notify_and_fail, self.driver)
+        self.assertEqual([], self.rpc_calls['process_flow_rules'])
+        self.assertEqual([], self.rpc_calls['update_flow_rules'])
+        self.assertIsNone(self.driver._flowrule_local.batch)
@@ -0,0 +1,61 @@
+# Copyright 2017 Futurewei. All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo_config import cfg
+
+from neutron.common import topics
+from neutron.tests import base
+
+from networking_sfc.services.sfc.drivers.ovs import rpc
+
+
+class SfcAgentRpcClientTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(SfcAgentRpcClientTestCase, self).setUp()
+        self.get_client = mock.patch(
+            'neutron.common.rpc.get_client').start()
+        self.client = self.get_client.return_value
+        self.cctxt = self.client.prepare.return_value
+        self.flowrule_entries = [
+            {'operation': topics.DELETE, 'flowrule': {'host': 'host1'}},
+            {'operation': topics.UPDATE, 'flowrule': {'host': 'host1'}}]
+
+    def test_version_cap(self):
+        cfg.CONF.set_override('agent_rpc_version_cap', '1.0', group='sfc')
+        rpc.SfcAgentRpcClient()
+        self.assertEqual(
+            '1.0', self.get_client.call_args[1]['version_cap'])
+
+    def test_process_flow_rules(self):
+        self.client.can_send_version.return_value = True
+        rpc.SfcAgentRpcClient().ask_agent_to_process_flow_rules(
+            'context', 'host1', self.flowrule_entries)
+        self.client.can_send_version.assert_called_once_with('1.1')
+        self.assertEqual('1.1', self.client.prepare.call_args[1]['version'])
+        self.cctxt.cast.assert_called_once_with(
+            'context', 'process_flow_rules',
+            flowrule_entries=self.flowrule_entries)
+
+    def test_process_flow_rules_version_1_0(self):
+        self.client.can_send_version.return_value = False
+        rpc.SfcAgentRpcClient().ask_agent_to_process_flow_rules(
+            'context', 'host1', self.flowrule_entries)
+        self.assertEqual(
+            [mock.call('context', 'delete_flow_rules',
+                       flowrule_entries={'host': 'host1'}),
+             mock.call('context', 'update_flow_rules',
+                       flowrule_entries={'host': 'host1'})],
+            self.cctxt.cast.call_args_list)
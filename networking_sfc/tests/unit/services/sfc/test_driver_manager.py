@@ -116,6 +116,12 @@ class DriverManagerTestCase(base.BaseTestCase):
     def test_create_port_pair_group_postcommit_exception(self):
         self._test_method_exception("create_port_pair_group_postcommit")
 
+    def test_create_port_pair_group_bulk_postcommit_called(self):
+        self._test_method_called("create_port_pair_group_bulk_postcommit")
+
+    def test_create_port_pair_group_bulk_postcommit_exception(self):
+        self._test_method_exception("create_port_pair_group_bulk_postcommit")
+
     def test_update_port_pair_group_precommit_called(self):
         self._test_method_called("update_port_pair_group_precommit")
 
@@ -158,6 +164,12 @@ class DriverManagerTestCase(base.BaseTestCase):
     def test_create_port_pair_postcommit_exception(self):
         self._test_method_exception("create_port_pair_postcommit")
 
+    def test_create_port_pair_bulk_postcommit_called(self):
+        self._test_method_called("create_port_pair_bulk_postcommit")
+
+    def test_create_port_pair_bulk_postcommit_exception(self):
+        self._test_method_exception("create_port_pair_bulk_postcommit")
+
     def test_update_port_pair_precommit_called(self):
         self._test_method_called("update_port_pair_precommit")
 
@@ -14,9 +14,15 @@
 
 import copy
 import mock
+import os
+from neutron_lib import context
+from neutron_lib import exceptions as n_exc
 
+from networking_sfc.extensions import sfc_metrics
 from networking_sfc.services.sfc.common import context as sfc_ctx
 from networking_sfc.services.sfc.common import exceptions as sfc_exc
+from networking_sfc.services.sfc.common import instrumentation
+from networking_sfc.services.sfc.common import worker
 from networking_sfc.tests.unit.db import test_sfc_db
 
 SFC_PLUGIN_KLASS = (
@@ -111,6 +117,111 @@ class SfcPluginTestCase(test_sfc_db.SfcDbPluginTestCase):
             mock.ANY
         )
 
+    def test_get_metrics(self):
+        registry = instrumentation.Registry()
+        mock.patch.object(instrumentation, 'REGISTRY', registry).start()
+        mock.patch.object(instrumentation, '_enabled', True).start()
+        with self.port_pair_group(port_pair_group={}):
+            pass
+        admin_context = context.get_admin_context()
+        metrics = self.sfc_plugin.get_metrics(
+            admin_context, filters={'name': [
+                'SfcPlugin.create_port_pair_group',
+                'SfcPlugin.delete_port_pair_group']},
+            fields=['id', 'count'])
+        self.assertEqual([
+            {'id': 'SfcPlugin.create_port_pair_group', 'count': 1},
+            {'id': 'SfcPlugin.delete_port_pair_group', 'count': 1}
+        ], metrics)
+        metric = self.sfc_plugin.get_metric(
+            admin_context, 'SfcPlugin.create_port_pair_group')
+        self.assertEqual(1, sum(
+            count for bound, count in metric['wall_time_ms']['buckets']))
+        self.assertEqual(os.getpid(), metric['pid'])
+        self.assertRaises(
+            sfc_metrics.SfcMetricsNotFound,
+            self.sfc_plugin.get_metric, admin_context, 'unknown')
+        self.assertRaises(
+            n_exc.NotAuthorized,
+            self.sfc_plugin.get_metrics,
+            context.Context('user', 'project'))
+
+    def test_metrics_extension_alias(self):
+        self.assertNotIn(sfc_metrics.SFC_METRICS_EXT,
+                         self.sfc_plugin.supported_extension_aliases)
+        with mock.patch.object(instrumentation, 'enabled',
+                               return_value=True):
+            sfc_plugin = type(self.sfc_plugin)()
+        self.assertIn(sfc_metrics.SFC_METRICS_EXT,
+                      sfc_plugin.supported_extension_aliases)
+        self.assertNotIn(sfc_metrics.SFC_METRICS_EXT,
+                         self.sfc_plugin.supported_extension_aliases)
+
+    def _show_port_chain(self, port_chain_id):
+        req = self.new_show_request('port_chains', port_chain_id)
+        return self.deserialize(
+            self.fmt, req.get_response(self.ext_api))['port_chain']
+
+    def test_create_port_chain_async_postcommit(self):
+        self.sfc_plugin._postcommit_worker = worker.KeyedWorkerPool(1)
+        with self.port_pair_group(port_pair_group={}) as pg:
+            with self.port_chain(port_chain={
+                'port_pair_groups': [pg['port_pair_group']['id']]
+            }) as pc:
+                pc_id = pc['port_chain']['id']
+                self.assertEqual('building', pc['port_chain']['status'])
+                self.sfc_plugin._postcommit_worker.wait(pc_id)
+                (self.fake_driver_manager.create_port_chain_postcommit
+                 .assert_called_once_with(mock.ANY))
+                self.assertEqual(
+                    'active', self._show_port_chain(pc_id)['status'])
+
+    def test_create_port_chain_async_postcommit_exception(self):
+        self.sfc_plugin._postcommit_worker = worker.KeyedWorkerPool(1)
+        self.fake_driver_manager.create_port_chain_postcommit = mock.Mock(
+            side_effect=sfc_exc.SfcDriverError(
+                method='create_port_chain_postcommit'
+            )
+        )
+        with self.port_pair_group(port_pair_group={}) as pg:
+            with self.port_chain(port_chain={
+                'port_pair_groups': [pg['port_pair_group']['id']]
+            }) as pc:
+                pc_id = pc['port_chain']['id']
+                self.sfc_plugin._postcommit_worker.wait(pc_id)
+                # the port chain is kept, in the error status
+                self.assertEqual(
+                    'error', self._show_port_chain(pc_id)['status'])
+                self.fake_driver_manager.delete_port_chain.assert_not_called()
+
+    def test_update_port_chain_async_postcommit_ordered(self):
+        self.sfc_plugin._postcommit_worker = worker.KeyedWorkerPool(2)
+        calls = []
+        self.fake_driver_manager.update_port_chain_postcommit = mock.Mock(
+            side_effect=lambda context: calls.append(
+                ('update', context.current['name'])))
+        self.fake_driver_manager.delete_port_chain = mock.Mock(
+            side_effect=lambda context: calls.append(('delete', None)))
+        with self.port_pair_group(port_pair_group={}) as pg:
+            with self.port_chain(port_chain={
+                'name': 'test1',
+                'port_pair_groups': [pg['port_pair_group']['id']]
+            }, do_delete=False) as pc:
+                pc_id = pc['port_chain']['id']
+                for name in ('test2', 'test3'):
+                    req = self.new_update_request(
+                        'port_chains', {'port_chain': {'name': name}}, pc_id)
+                    res = self.deserialize(
+                        self.fmt, req.get_response(self.ext_api))
+                    self.assertEqual('building', res['port_chain']['status'])
+                req = self.new_delete_request('port_chains', pc_id)
+                res = req.get_response(self.ext_api)
+                self.assertEqual(204, res.status_int)
+                self.assertEqual(
+                    [('update', 'test2'), ('update', 'test3'),
+                     ('delete', None)],
+                    calls)
+
     def test_update_port_chain_driver_manager_called(self):
         self.fake_driver_manager.update_port_chain_precommit = mock.Mock(
             side_effect=self._record_context_precommit)
@@ -550,6 +661,155 @@ class SfcPluginTestCase(test_sfc_db.SfcDbPluginTestCase):
                 mock.ANY
             )
 
+    def test_create_port_pair_bulk_driver_manager_called(self):
+        with self.port(
+            name='port1',
+            device_id='default'
+        ) as port1, self.port(
+            name='port2',
+            device_id='default'
+        ) as port2:
+            ports = [port1['port']['id'], port2['port']['id']]
+            ctx = context.get_admin_context()
+            pps = self.sfc_plugin.create_port_pair_bulk(ctx, {
+                'port_pairs': [
+                    self._port_pair_bulk_item(ports[0], ports[1]),
+                    self._port_pair_bulk_item(ports[1], ports[0])
+                ]
+            })
+            driver_manager = self.fake_driver_manager
+            self.assertEqual(
+                2, driver_manager.create_port_pair_precommit.call_count)
+            driver_manager.create_port_pair_postcommit.assert_not_called()
+            (driver_manager.create_port_pair_bulk_postcommit
+             .assert_called_once_with(mock.ANY))
+            contexts = (driver_manager.create_port_pair_bulk_postcommit
+                        .call_args[0][0])
+            for portpair_context in contexts:
+                self.assertIsInstance(
+                    portpair_context, sfc_ctx.PortPairContext)
+            self.assertEqual(pps, [c.current for c in contexts])
+            for pp in pps:
+                self.sfc_plugin.delete_port_pair(ctx, pp['id'])
+
+    def test_create_port_pair_bulk_postcommit_driver_manager_exception(self):
+        self.fake_driver_manager.create_port_pair_bulk_postcommit = mock.Mock(
+            side_effect=sfc_exc.SfcDriverError(
+                method='create_port_pair_bulk_postcommit'
+            )
+        )
+        with self.port(
+            name='port1',
+            device_id='default'
+        ) as port1, self.port(
+            name='port2',
+            device_id='default'
+        ) as port2:
+            ports = [port1['port']['id'], port2['port']['id']]
+            ctx = context.get_admin_context()
+            self.assertRaises(
+                sfc_exc.SfcDriverError,
+                self.sfc_plugin.create_port_pair_bulk, ctx, {
+                    'port_pairs': [
+                        self._port_pair_bulk_item(ports[0], ports[1]),
+                        self._port_pair_bulk_item(ports[1], ports[0])
+                    ]
+                })
+            self._test_list_resources('port_pair', [])
+            driver_manager = self.fake_driver_manager
+            self.assertEqual(2, driver_manager.delete_port_pair.call_count)
+            self.assertEqual(
+                2, driver_manager.delete_port_pair_postcommit.call_count)
+
+    def test_create_port_pair_group_bulk_driver_manager_called(self):
+        ctx = context.get_admin_context()
+        pgs = self.sfc_plugin.create_port_pair_group_bulk(ctx, {
+            'port_pair_groups': [
+                self._port_pair_group_bulk_item([]),
+                self._port_pair_group_bulk_item([])
+            ]
+        })
+        driver_manager = self.fake_driver_manager
+        self.assertEqual(
+            2, driver_manager.create_port_pair_group_precommit.call_count)
+        driver_manager.create_port_pair_group_postcommit.assert_not_called()
+        (driver_manager.create_port_pair_group_bulk_postcommit
+         .assert_called_once_with(mock.ANY))
+        contexts = (driver_manager.create_port_pair_group_bulk_postcommit
+                    .call_args[0][0])
+        self.assertEqual(pgs, [c.current for c in contexts])
+        for pg in pgs:
+            self.sfc_plugin.delete_port_pair_group(ctx, pg['id'])
+
+    def test_create_port_pair_bulk_api(self):
+        with self.port(
+            name='port1',
+            device_id='default'
+        ) as port1, self.port(
+            name='port2',
+            device_id='default'
+        ) as port2:
+            ports = [port1['port']['id'], port2['port']['id']]
+            req = self.new_create_request('port_pairs', {'port_pairs': [
+                {'ingress': ports[0], 'egress': ports[1],
+                 'tenant_id': self._tenant_id},
+                {'ingress': ports[1], 'egress': ports[0],
+                 'tenant_id': self._tenant_id}
+            ]}, self.fmt)
+            res = req.get_response(self.ext_api)
+            self.assertEqual(201, res.status_int)
+            pps = self.deserialize(self.fmt, res)['port_pairs']
+            self.assertEqual(2, len(pps))
+            driver_manager = self.fake_driver_manager
+            (driver_manager.create_port_pair_bulk_postcommit
+             .assert_called_once_with(mock.ANY))
+            for pp in pps:
+                self._delete('port_pairs', pp['id'])
+
+    def test_create_port_chain_bulk_api(self):
+        with self.port_pair_group(
+            port_pair_group={}
+        ) as pg1, self.port_pair_group(
+            port_pair_group={}
+        ) as pg2:
+            req = self.new_create_request('port_chains', {'port_chains': [
+                {'port_pair_groups': [pg['port_pair_group']['id']],
+                 'tenant_id': self._tenant_id}
+                for pg in (pg1, pg2)
+            ]}, self.fmt)
+            res = req.get_response(self.ext_api)
+            self.assertEqual(201, res.status_int)
+            pcs = self.deserialize(self.fmt, res)['port_chains']
+            self.assertEqual(2, len(pcs))
+            self.assertEqual(
+                2,
+                self.fake_driver_manager.create_port_chain_postcommit
+                .call_count)
+            for pc in pcs:
+                self._delete('port_chains', pc['id'])
+
+    def test_create_port_chain_bulk_postcommit_exception(self):
+        self.fake_driver_manager.create_port_chain_postcommit = mock.Mock(
+            side_effect=[None, sfc_exc.SfcDriverError(
+                method='create_port_chain_postcommit')])
+        with self.port_pair_group(
+            port_pair_group={}
+        ) as pg1, self.port_pair_group(
+            port_pair_group={}
+        ) as pg2:
+            req = self.new_create_request('port_chains', {'port_chains': [
+                {'port_pair_groups': [pg['port_pair_group']['id']],
+                 'tenant_id': self._tenant_id}
+                for pg in (pg1, pg2)
+            ]}, self.fmt)
+            res = req.get_response(self.ext_api)
+            self.assertEqual(500, res.status_int)
+            self._test_list_resources('port_chain', [])
+            self.assertEqual(
+                2,
+                self.fake_driver_manager.delete_port_chain_postcommit
+                .call_count)
+
     def test_update_port_pair_driver_manager_called(self):
         self.fake_driver_manager.update_port_pair_precommit = mock.Mock(
             side_effect=self._record_context_precommit)